@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Compare the memory footprint of `Cache` and `ArrayCache`.
+
+Usage:
+    python benchmarks/bench_cache_memory.py [--num_docs 200000]
+
+Random fingerprints are inserted under url-like string ids, the memory
+allocated by each cache is measured with `tracemalloc` and reported per
+million documents. The ids themselves are allocated before the measurement
+starts, as in `find_duplicates.py` they are shared with the rest of the
+program.
+
+With `--b_bits` the caches store packed b-bit fingerprints, each band then
+only has `rows * b_bits` bits, so fewer and wider bands are needed to keep
+the buckets small, e.g. `--b_bits 4 --bands 5`.
+"""
+from __future__ import print_function
+
+import argparse
+import gc
+import time
+import tracemalloc
+
+import numpy as np
+
+from lsh.cache import ArrayCache, Cache
+from lsh.minhash import MinHasher, pack_bits
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_docs', type=int, default=200000)
+    parser.add_argument('--seeds', type=int, default=100)
+    parser.add_argument('--bands', type=int, default=10)
+    parser.add_argument('--hashbytes', type=int, default=4)
+    parser.add_argument('--b_bits', type=int, default=None)
+    parser.add_argument('--batch_size', type=int, default=10000)
+    return parser.parse_args()
+
+
+def measure(cache, fingerprints, doc_ids, batch_size):
+    gc.collect()
+    tracemalloc.start()
+    start_time = time.time()
+    if isinstance(cache, ArrayCache):
+        for start in range(0, len(doc_ids), batch_size):
+            cache.add_fingerprints(fingerprints[start:start + batch_size],
+                                   doc_ids[start:start + batch_size])
+    else:
+        for fingerprint, doc_id in zip(fingerprints, doc_ids):
+            cache.add_fingerprint(fingerprint.copy(), doc_id)
+    cache.get_all_duplicates()
+    elapsed = time.time() - start_time
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, peak, elapsed
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    hasher = MinHasher(seeds=args.seeds, hashbytes=args.hashbytes,
+                       b_bits=args.b_bits)
+    rng = np.random.RandomState(0)
+    fingerprints = rng.randint(0, 2 ** 31, (args.num_docs, args.seeds))
+    if args.b_bits is not None:
+        fingerprints = pack_bits(fingerprints, args.b_bits)
+    fingerprints = fingerprints.astype(hasher.dtype)
+    doc_ids = ['https://www.example.com/page/{}'.format(i)
+               for i in range(args.num_docs)]
+
+    scale = 1e6 / args.num_docs / 2 ** 20
+    print('> {} documents, {} seeds, {} bands, {} byte hashes, {} bits '
+          'kept'.format(args.num_docs, args.seeds, args.bands, args.hashbytes,
+                        args.b_bits or 8 * args.hashbytes))
+    for cache_class in (Cache, ArrayCache):
+        cache = cache_class(hasher, num_bands=args.bands)
+        current, peak, elapsed = measure(cache, fingerprints, doc_ids,
+                                         args.batch_size)
+        print('{:10s} | {:8.1f} MB per million docs | peak {:8.1f} MB per '
+              'million docs | {:.2f} s'.format(cache_class.__name__,
+                                               current * scale,
+                                               peak * scale, elapsed))
+        del cache
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Compare the fingerprinting throughput of the MinHash kernels.
+
+Usage:
+    python benchmarks/bench_minhash.py [--input docs.json] [--num_docs 2000]
+
+Without `--input` a synthetic corpus of random word documents is used,
+otherwise the `text` field of the first `--num_docs` lines of a loose json
+file is fingerprinted.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from lsh.minhash import MinHasher
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', type=str, default=None,
+                        help='Loose json file with a `text` field per line.')
+    parser.add_argument('--num_docs', type=int, default=2000,
+                        help='Number of documents to fingerprint.')
+    parser.add_argument('--doc_words', type=int, default=500,
+                        help='Words per synthetic document.')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[100, 200],
+                        help='Numbers of seeds to benchmark.')
+    parser.add_argument('--char_ngram', type=int, default=5)
+    parser.add_argument('--hashbytes', type=int, default=4)
+    return parser.parse_args()
+
+
+def synthetic_docs(num_docs, doc_words, random_state=0):
+    rng = np.random.RandomState(random_state)
+    vocab = [''.join(rng.choice(list('abcdefghijklmnopqrstuvwxyz'),
+                                rng.randint(2, 10)))
+             for _ in range(5000)]
+    return [' '.join(rng.choice(vocab, doc_words)).encode('utf8')
+            for _ in range(num_docs)]
+
+
+def read_docs(filename, num_docs):
+    docs = []
+    with open(filename, 'r') as f:
+        for line in f:
+            docs.append(json.loads(line)['text'].encode('utf8'))
+            if len(docs) == num_docs:
+                break
+    return docs
+
+
+def docs_per_second(hasher, docs):
+    # call the undecorated function so the lru_cache does not hide the cost
+    fingerprint = MinHasher.fingerprint.__wrapped__
+    start_time = time.time()
+    for doc in docs:
+        fingerprint(hasher, doc)
+    return len(docs) / (time.time() - start_time)
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    if args.input is None:
+        docs = synthetic_docs(args.num_docs, args.doc_words)
+    else:
+        docs = read_docs(args.input, args.num_docs)
+    mean_len = np.mean([len(d) for d in docs])
+    print('> fingerprinting {} documents (mean length {:.0f} bytes)'.format(
+        len(docs), mean_len))
+
+    for num_seeds in args.seeds:
+        results = {}
+        for method in ('murmur', 'universal'):
+            hasher = MinHasher(seeds=num_seeds, char_ngram=args.char_ngram,
+                               hashbytes=args.hashbytes, random_state=0,
+                               method=method)
+            results[method] = docs_per_second(hasher, docs)
+        print('seeds: {:4d} | murmur: {:9.1f} docs/s | universal: {:9.1f} '
+              'docs/s | speedup: {:.2f}x'.format(
+                  num_seeds, results['murmur'], results['universal'],
+                  results['universal'] / results['murmur']))
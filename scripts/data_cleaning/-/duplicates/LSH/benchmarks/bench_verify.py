@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Compare set based and hashed shingle Jaccard verification of a bucket.
+
+Usage:
+    python benchmarks/bench_verify.py [--members 300] [--doc_words 500]
+
+A bucket of near-duplicate documents is verified the way `find_duplicates.py`
+used to, with one python `set` of string shingles per document and one
+Jaccard computation per pair, and with `lsh.verify`.
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy as np
+
+from lsh.verify import jaccard_to_first, shingle_hashes
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--members', type=int, nargs='+', default=[100, 300])
+    parser.add_argument('--doc_words', type=int, default=500)
+    parser.add_argument('--char_ngram', type=int, default=5)
+    return parser.parse_args()
+
+
+def near_duplicates(members, doc_words, random_state=0):
+    rng = np.random.RandomState(random_state)
+    vocab = ['word{}'.format(i) for i in range(5000)]
+    base = list(rng.choice(vocab, doc_words))
+    docs = []
+    for _ in range(members):
+        doc = list(base)
+        for i in rng.randint(0, doc_words, doc_words // 20):
+            doc[i] = rng.choice(vocab)
+        docs.append(' '.join(doc))
+    return docs
+
+
+def set_based(docs, char_ngram):
+    def shingles(text):
+        return set(text[head:head + char_ngram]
+                   for head in range(0, len(text) - char_ngram + 1))
+    main = shingles(docs[0])
+    similarities = []
+    for doc in docs[1:]:
+        other = shingles(doc)
+        similarities.append(len(main & other) / len(main | other))
+    return similarities
+
+
+def hashed(docs, char_ngram):
+    return jaccard_to_first([shingle_hashes(doc, char_ngram)
+                             for doc in docs])
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    for members in args.members:
+        docs = near_duplicates(members, args.doc_words)
+        timings = {}
+        results = {}
+        for name, verify in (('sets', set_based), ('hashed', hashed)):
+            start_time = time.time()
+            results[name] = verify(docs, args.char_ngram)
+            timings[name] = time.time() - start_time
+        np.testing.assert_allclose(results['sets'], results['hashed'])
+        print('members: {:5d} | sets: {:.3f} s | hashed: {:.3f} s | '
+              'speedup: {:.2f}x'.format(members, timings['sets'],
+                                        timings['hashed'],
+                                        timings['sets'] / timings['hashed']))
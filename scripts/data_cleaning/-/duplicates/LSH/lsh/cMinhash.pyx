@@ -93,3 +93,105 @@ def minhash_32(char* c_str, int strlen,
             # reset string pointer for next hash
             c_str -= strlen - char_ngram + 1
     return fingerprint
+
+
+# Mersenne prime 2**61 - 1 used as the modulus of the universal hash family
+cdef uint64_t MERSENNE_61 = 2305843009213693951ULL
+
+
+cdef inline uint64_t mod_mersenne_61(uint64_t x) nogil:
+    x = (x & MERSENNE_61) + (x >> 61)
+    if x >= MERSENNE_61:
+        x -= MERSENNE_61
+    return x
+
+
+cdef inline uint64_t mulmod_mersenne_61(uint64_t a, uint64_t b) nogil:
+    """Compute `a * b mod 2**61 - 1` for `a, b < 2**61` without overflow.
+
+    The 122bit product is split into 32bit limbs and folded back using
+    `2**61 = 1 (mod p)`, which keeps every intermediate value below 2**64.
+    """
+    cdef uint64_t a_lo = a & 0xFFFFFFFFULL
+    cdef uint64_t a_hi = a >> 32
+    cdef uint64_t b_lo = b & 0xFFFFFFFFULL
+    cdef uint64_t b_hi = b >> 32
+    cdef uint64_t lo = a_lo * b_lo
+    cdef uint64_t mid = a_hi * b_lo + a_lo * b_hi
+    cdef uint64_t hi = a_hi * b_hi
+    # hi * 2**64 = hi * 8, mid * 2**32 = (mid >> 29) + (mid & (2**29 - 1)) << 32
+    cdef uint64_t s = (hi << 3) + (mid >> 29) + ((mid & 0x1FFFFFFFULL) << 32) \
+        + (lo & MERSENNE_61) + (lo >> 61)
+    return mod_mersenne_61(s)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def minhash_universal(char* c_str, int strlen,
+                      np.ndarray[dtype=np.uint64_t, ndim=1] perm_a not None,
+                      np.ndarray[dtype=np.uint64_t, ndim=1] perm_b not None,
+                      uint32_t seed, int char_ngram, int hashbytes):
+    """Perform shingling and compute minhashes using a single hash per shingle.
+
+    Every `char_ngram` length shingle of `c_str` is hashed exactly once with
+    MurmurHash3. The `len(perm_a)` min hashes are then derived from that hash
+    with the universal hash family `(a * h + b) mod (2**61 - 1)`, one `(a, b)`
+    pair per permutation. This reduces the number of MurmurHash3 calls from
+    `len(seeds) * num_shingles` to `num_shingles`.
+
+    With `hashbytes=4` the 32bit MurmurHash3 is used, `perm_a` and `perm_b`
+    must be smaller than 2**32 and each permuted hash is truncated to its
+    lowest 32 bits, a `uint32` fingerprint is returned. Otherwise the 128bit
+    MurmurHash3 is used, `perm_a` and `perm_b` must be smaller than 2**61 - 1
+    and a `uint64` fingerprint is returned.
+    """
+    cdef uint32_t num_perms = len(perm_a)
+    cdef int num_shingles = strlen - char_ngram + 1
+    if num_shingles < 0:
+        num_shingles = 0
+    cdef np.ndarray[np.uint64_t, ndim=1] fingerprint = \
+        np.empty((num_perms, ), dtype=np.uint64)
+    cdef np.ndarray[np.uint64_t, ndim=1] shingle_hashes = \
+        np.empty((num_shingles, ), dtype=np.uint64)
+
+    cdef uint64_t [:] mem_view = fingerprint
+    cdef uint64_t [:] hash_view = shingle_hashes
+    cdef uint64_t [:] a_view = perm_a
+    cdef uint64_t [:] b_view = perm_b
+    cdef uint64_t hashes[2]
+    cdef uint32_t hash_32[1]
+    cdef uint64_t a, b, value, minhash
+    cdef uint64_t mask = 0xFFFFFFFFULL if hashbytes == 4 else MERSENNE_61
+    cdef int i
+    cdef uint32_t s
+    with nogil:
+        # hash every shingle once, reduced into the field of the permutations
+        for i in range(num_shingles):
+            if hashbytes == 4:
+                MurmurHash3_x86_32(c_str + i, char_ngram, seed, hash_32)
+                hash_view[i] = hash_32[0]
+            else:
+                MurmurHash3_x64_128(c_str + i, char_ngram, seed, hashes)
+                hash_view[i] = mod_mersenne_61(hashes[0])
+
+        for s in range(num_perms):
+            a = a_view[s]
+            b = b_view[s]
+            minhash = mask
+            if hashbytes == 4:
+                # a, b and h all fit in 32bit, a * h + b can not overflow
+                for i in range(num_shingles):
+                    value = mod_mersenne_61(a * hash_view[i] + b) & mask
+                    if value < minhash:
+                        minhash = value
+            else:
+                for i in range(num_shingles):
+                    value = mod_mersenne_61(
+                        mulmod_mersenne_61(a, hash_view[i]) + b)
+                    if value < minhash:
+                        minhash = value
+            mem_view[s] = minhash
+
+    if hashbytes == 4:
+        return fingerprint.astype(np.uint32)
+    return fingerprint
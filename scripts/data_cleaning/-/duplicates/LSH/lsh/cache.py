@@ -5,14 +5,183 @@ import json
 from collections import defaultdict
 import itertools
 import logging
+import os
 from copy import deepcopy
 
 import numpy as np
+from lsh.cluster import cluster_buckets
 from lsh.minhash import MinHasher
 
 __author__ = "Matti Lyra"
 
 
+# 64bit FNV-1a parameters used to hash band slices of the fingerprints
+FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+FNV_PRIME = np.uint64(0x100000001b3)
+
+
+def band_keys(fingerprints, num_bands):
+    """Hash every band of every fingerprint into a single 64bit key.
+
+    `fingerprints` is a `(n_docs, num_seeds)` matrix, the result is a
+    `(n_docs, num_bands)` matrix of `uint64` keys. Equal band slices always
+    produce equal keys.
+    """
+    n_docs, num_seeds = fingerprints.shape
+    bands = fingerprints.reshape(n_docs, num_bands, num_seeds // num_bands)
+    keys = np.full((n_docs, num_bands), FNV_OFFSET, dtype=np.uint64)
+    for column in range(bands.shape[2]):
+        keys ^= bands[:, :, column].astype(np.uint64)
+        keys *= FNV_PRIME
+    return keys
+
+
+def content_key(fingerprint, dtype):
+    """Key of the reverse index from fingerprint content to doc ids."""
+    return hash(np.ascontiguousarray(fingerprint, dtype=dtype).tobytes())
+
+
+# number of candidate pairs whose fingerprints are compared at once
+FILTER_CHUNK_SIZE = 100000
+
+
+def estimate_jaccard(fingerprints_a, fingerprints_b):
+    """Estimate the Jaccard similarity of rows of two fingerprint matrices.
+
+    The fraction of equal min hashes of two fingerprints is an unbiased
+    estimate of the Jaccard similarity of the underlying shingle sets.
+    """
+    return (np.asarray(fingerprints_a) == np.asarray(fingerprints_b)).mean(
+        axis=-1)
+
+
+def filter_pairs(candidate_id_pairs, get_fingerprints, min_jaccard,
+                 estimate=estimate_jaccard):
+    """Keep the pairs whose estimated Jaccard similarity exceeds min_jaccard.
+
+    `get_fingerprints` maps a list of ids to their fingerprint matrix, the
+    pairs are compared in vectorised chunks of `FILTER_CHUNK_SIZE` with
+    `estimate`, e.g. `MinHasher.estimate_jaccard` for b-bit fingerprints.
+    """
+    pairs = list(candidate_id_pairs)
+    res = set()
+    for start in range(0, len(pairs), FILTER_CHUNK_SIZE):
+        chunk = pairs[start:start + FILTER_CHUNK_SIZE]
+        jaccard = estimate(get_fingerprints([p[0] for p in chunk]),
+                           get_fingerprints([p[1] for p in chunk]))
+        res.update(pair for pair, j in zip(chunk, jaccard) if j > min_jaccard)
+    return res
+
+
+# file names of a cache saved with `Cache.save` or `ArrayCache.save`
+META_FILE = 'meta.json'
+SEEDS_FILE = 'seeds.npy'
+FINGERPRINTS_FILE = 'fingerprints.npy'
+KEYS_FILE = 'keys.npy'
+BAND_ROWS_FILE = 'band_rows.npy'
+BAND_KEYS_FILE = 'band_keys.npy'
+IDS_FILE = 'ids.jsonl'
+ID_OFFSETS_FILE = 'id_offsets.npy'
+
+
+class StoredIds(object):
+    """A read-only sequence of document ids backed by a saved cache.
+
+    The ids are stored as one json value per line, `offsets[i]` is the byte
+    offset of the i-th id. Ids are only decoded when they are accessed, so a
+    memory-mapped cache does not need to hold all of them in memory.
+    """
+
+    def __init__(self, data, offsets):
+        self._data = data
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, row):
+        start, end = self._offsets[row], self._offsets[row + 1]
+        return json.loads(bytes(self._data[start:end]).decode('utf8'))
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+
+def save_arrays(directory, hasher, num_bands, fingerprints, doc_ids):
+    """Write fingerprints, ids and sorted band tables to `directory`.
+
+    Every array is written as a `.npy` file so that it can be memory-mapped
+    by `load_arrays`. Document ids must be json serializable.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fingerprints = np.ascontiguousarray(fingerprints, dtype=hasher.dtype)
+    keys = band_keys(hasher.unpack(fingerprints), num_bands)
+    order = np.argsort(keys, axis=0, kind='stable')
+    band_rows = np.ascontiguousarray(order.T)
+    sorted_keys = np.ascontiguousarray(
+        np.take_along_axis(keys, order, axis=0).T)
+
+    meta = {'num_bands': num_bands,
+            'num_docs': len(fingerprints),
+            'char_ngram': hasher.char_ngram,
+            'hashbytes': hasher.hashbytes,
+            'method': hasher.method,
+            'b_bits': hasher.b_bits}
+    with open(os.path.join(directory, META_FILE), 'w') as f:
+        json.dump(meta, f)
+    np.save(os.path.join(directory, SEEDS_FILE), hasher._seeds)
+    np.save(os.path.join(directory, FINGERPRINTS_FILE), fingerprints)
+    np.save(os.path.join(directory, KEYS_FILE), keys)
+    np.save(os.path.join(directory, BAND_ROWS_FILE), band_rows)
+    np.save(os.path.join(directory, BAND_KEYS_FILE), sorted_keys)
+
+    offsets = [0]
+    with open(os.path.join(directory, IDS_FILE), 'wb') as f:
+        for doc_id in doc_ids:
+            line = json.dumps(doc_id, ensure_ascii=False) + '\n'
+            line = line.encode('utf8')
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+    np.save(os.path.join(directory, ID_OFFSETS_FILE),
+            np.array(offsets, dtype=np.int64))
+
+
+def load_arrays(directory, hasher=None, mmap=True):
+    """Read a cache written by `save_arrays`.
+
+    Returns the metadata dict, the hasher and a dict of arrays. With
+    `mmap=True` the arrays are memory-mapped read-only instead of being read
+    into memory. If no `hasher` is given it is recreated from the saved
+    seeds and settings.
+    """
+    with open(os.path.join(directory, META_FILE), 'r') as f:
+        meta = json.load(f)
+    mmap_mode = 'r' if mmap else None
+    if hasher is None:
+        hasher = MinHasher(seeds=np.load(os.path.join(directory, SEEDS_FILE)),
+                           char_ngram=meta['char_ngram'],
+                           hashbytes=meta['hashbytes'],
+                           method=meta['method'],
+                           b_bits=meta.get('b_bits'))
+    arrays = {name: np.load(os.path.join(directory, filename),
+                            mmap_mode=mmap_mode)
+              for name, filename in [('fingerprints', FINGERPRINTS_FILE),
+                                     ('keys', KEYS_FILE),
+                                     ('band_rows', BAND_ROWS_FILE),
+                                     ('band_keys', BAND_KEYS_FILE),
+                                     ('id_offsets', ID_OFFSETS_FILE)]}
+    if mmap and os.path.getsize(os.path.join(directory, IDS_FILE)) > 0:
+        ids = np.memmap(os.path.join(directory, IDS_FILE), dtype=np.uint8,
+                        mode='r')
+    else:
+        with open(os.path.join(directory, IDS_FILE), 'rb') as f:
+            ids = f.read()
+    arrays['ids'] = StoredIds(ids, arrays.pop('id_offsets'))
+    return meta, hasher, arrays
+
+
 class Cache(object):
     """LSH provides a way of determining the local neighbourhood of a document.
 
@@ -37,12 +206,17 @@ class Cache(object):
         self.num_bands = num_bands
 
         self.fingerprints = dict()
+        # content key of a fingerprint -> ids of the docs with that fingerprint
+        self.contents = defaultdict(set)
 
     def bins_(self, fingerprint):
-        yield from enumerate(np.array_split(fingerprint, self.num_bands))
+        yield from enumerate(np.array_split(self.hasher.unpack(fingerprint),
+                                            self.num_bands))
 
     def clear(self):
         self.bins = [defaultdict(set) for _ in range(self.num_bands)]
+        self.fingerprints = dict()
+        self.contents = defaultdict(set)
         self.hasher.fingerprint.cache_clear()
 
     def add_doc(self, doc, doc_id):
@@ -50,7 +224,10 @@ class Cache(object):
         self.add_fingerprint(fingerprint, doc_id)
 
     def add_fingerprint(self, fingerprint, doc_id):
+        if doc_id in self.fingerprints:
+            self.remove_id(doc_id)
         self.fingerprints[doc_id] = fingerprint
+        self.contents[self._content_key(fingerprint)].add(doc_id)
         for bin_i, bucket in self.bins_(fingerprint):
             # todo faster hash here? or no hash at all?
             bucket_id = hash(tuple(bucket))
@@ -59,13 +236,8 @@ class Cache(object):
     def filter_candidates(self, candidate_id_pairs, min_jaccard):
         logging.info('Computing Jaccard sim of %d pairs',
                      len(candidate_id_pairs))
-        res = set()
-        for id1, id2 in candidate_id_pairs:
-            # todo id1, id2 may not be contained in data
-            jaccard = self.hasher.jaccard(self.fingerprints[id1],
-                                          self.fingerprints[id2])
-            if jaccard > min_jaccard:
-                res.add((id1, id2))
+        res = filter_pairs(candidate_id_pairs, self._fingerprint_matrix,
+                           min_jaccard, estimate=self.hasher.estimate_jaccard)
         logging.info('Keeping %d/%d candidate duplicate pairs',
                      len(res), len(candidate_id_pairs))
         return res
@@ -75,16 +247,41 @@ class Cache(object):
         for bin_i, bucket in self.bins_(fingerprint):
             bucket_id = hash(tuple(bucket))
             self.bins[bin_i][bucket_id].remove(doc_id)
+            if not self.bins[bin_i][bucket_id]:
+                del self.bins[bin_i][bucket_id]
 
+        key = self._content_key(fingerprint)
+        self.contents[key].discard(doc_id)
+        if not self.contents[key]:
+            del self.contents[key]
         del self.fingerprints[doc_id]
 
     def remove_doc(self, doc):
-        fingerprint = self.hasher.fingerprint(doc.encode('utf8'))
-        doc_ids = {id for id, finger in self.fingerprints.items()
-                  if all(a == b for a, b in zip(finger, fingerprint))}
-        for i in doc_ids:
+        for i in self.get_exact_duplicates_of(doc=doc):
             self.remove_id(i)
 
+    def get_exact_duplicates_of(self, doc=None, doc_id=None,
+                                fingerprint=None):
+        """Return the ids of the documents with exactly the same fingerprint.
+
+        The lookup goes through the reverse content index and does not scan
+        the cache.
+        """
+        if fingerprint is not None:
+            fingerprint = np.asarray(fingerprint)
+        elif doc_id is not None and doc_id in self.fingerprints:
+            fingerprint = self.fingerprints[doc_id]
+        elif doc is not None:
+            fingerprint = self.hasher.fingerprint(doc.encode('utf8'))
+        else:
+            raise ValueError('Must provide a document or a known document id')
+        return {i for i in self.contents.get(self._content_key(fingerprint),
+                                             ())
+                if np.array_equal(self.fingerprints[i], fingerprint)}
+
+    def _content_key(self, fingerprint):
+        return content_key(fingerprint, self.hasher.dtype)
+
     def get_all_duplicates(self, min_jaccard=None):
         candidate_pairs = set()
         for b in self.bins:
@@ -97,8 +294,40 @@ class Cache(object):
 
         return self.filter_candidates(candidate_pairs, min_jaccard)
 
-    def get_duplicates_of(self, doc=None, doc_id=None, min_jaccard=None):
-        if doc_id is not None and doc_id in self.fingerprints:
+    def iter_buckets(self):
+        """Yield the doc ids of every bucket with more than one document."""
+        for b in self.bins:
+            for bucket_id in b:
+                if len(b[bucket_id]) > 1:
+                    yield list(b[bucket_id])
+
+    def get_clusters(self, min_jaccard=None, similarity=None):
+        """Yield clusters of duplicate documents as lists of doc ids.
+
+        Clusters are the connected components of the graph linking the
+        members of every bucket, computed with a union-find without
+        enumerating candidate pairs. With `min_jaccard` only members whose
+        estimated Jaccard similarity with the first member of the bucket
+        exceeds `min_jaccard` are linked. A custom `similarity(main_id,
+        other_ids)` function, e.g. an exact shingle Jaccard, can be used
+        instead of the MinHash estimate, `min_jaccard` is then its threshold
+        and is required.
+        """
+        if similarity is None and min_jaccard is not None:
+            similarity = self._estimate_similarity
+        return cluster_buckets(self.iter_buckets(), similarity=similarity,
+                               threshold=min_jaccard)
+
+    def _estimate_similarity(self, main_id, other_ids):
+        return self.hasher.estimate_jaccard(
+            self._fingerprint_matrix(other_ids),
+            self._fingerprint_matrix([main_id])[0])
+
+    def get_duplicates_of(self, doc=None, doc_id=None, min_jaccard=None,
+                          fingerprint=None):
+        if fingerprint is not None:
+            fingerprint = np.asarray(fingerprint)
+        elif doc_id is not None and doc_id in self.fingerprints:
             fingerprint = self.fingerprints[doc_id]
         elif doc is not None:
             fingerprint = self.hasher.fingerprint(doc.encode('utf8'))
@@ -113,9 +342,322 @@ class Cache(object):
         if min_jaccard is None:
             return candidates
         else:
-            return {x for x in candidates
-                    if self.hasher.jaccard(fingerprint,
-                                           self.fingerprints[x]) > min_jaccard}
+            candidates = list(candidates)
+            jaccard = self.hasher.estimate_jaccard(
+                self._fingerprint_matrix(candidates), fingerprint)
+            return {x for x, j in zip(candidates, jaccard) if j > min_jaccard}
+
+    def _fingerprint_matrix(self, doc_ids):
+        return np.array([self.fingerprints[doc_id] for doc_id in doc_ids],
+                        dtype=self.hasher.dtype).reshape(
+                            len(doc_ids), self.hasher.fingerprint_size)
+
+    def is_duplicate(self, doc, doc_id=None):
+        return len(self.get_duplicates_of(doc, doc_id=doc_id)) > 0
+
+    def save(self, directory):
+        """Save the fingerprints and band tables of the cache to `directory`.
+
+        The format is shared with `ArrayCache.save`, see `save_arrays`.
+        """
+        doc_ids = list(self.fingerprints)
+        save_arrays(directory, self.hasher, self.num_bands,
+                    self._fingerprint_matrix(doc_ids), doc_ids)
+
+    @classmethod
+    def load(cls, directory, hasher=None, mmap=True):
+        """Load a cache saved with `save` or `ArrayCache.save`.
+
+        The bands are rebuilt in memory. With `mmap=True` the fingerprints
+        stay memory-mapped, each stored fingerprint is a view on the file.
+        """
+        meta, hasher, arrays = load_arrays(directory, hasher=hasher,
+                                           mmap=mmap)
+        cache = cls(hasher, num_bands=meta['num_bands'])
+        for doc_id, fingerprint in zip(arrays['ids'], arrays['fingerprints']):
+            cache.add_fingerprint(fingerprint, doc_id)
+        return cache
+
+
+class ArrayCache(object):
+    """A compact, array backed alternative to `Cache`.
+
+    All fingerprints are kept in a single contiguous `(n_docs, num_seeds)`
+    matrix together with a `(n_docs, num_bands)` matrix of band keys, and a
+    dict maps document ids to rows. Instead of one python set per bucket the
+    buckets are built in bulk by sorting the band keys of every band and
+    grouping equal keys, which is done lazily the first time duplicates are
+    queried after the cache was modified.
+
+    Removed documents only release their id, their row stays allocated until
+    the cache is cleared.
+    """
+
+    def __init__(self, hasher, num_bands=10, capacity=1024, **kwargs):
+        self.hasher = hasher
+        msg = 'The number of seeds in the fingerprint must ' \
+              'be divisible by the number of bands'
+        assert hasher.num_seeds % num_bands == 0, msg
+        self.band_width = hasher.num_seeds // num_bands
+        self.num_bands = num_bands
+        self._initial_capacity = max(1, capacity)
+        self._allocate(self._initial_capacity)
+
+    def _allocate(self, capacity):
+        self._fingerprints = np.zeros(
+            (capacity, self.hasher.fingerprint_size), dtype=self.hasher.dtype)
+        self._keys = np.zeros((capacity, self.num_bands), dtype=np.uint64)
+        self._live = np.zeros(capacity, dtype=bool)
+        self._row_ids = []
+        self._row_map = dict()
+        self._content_map = defaultdict(set)
+        self._index = None
+
+    @property
+    def _rows(self):
+        # the id -> row map of a loaded cache is only built when needed
+        if self._row_map is None:
+            live = self._live
+            self._row_map = {doc_id: row
+                             for row, doc_id in enumerate(self._row_ids)
+                             if live[row]}
+        return self._row_map
+
+    @property
+    def _contents(self):
+        # content key of a fingerprint -> ids, built on first use after a load
+        if self._content_map is None:
+            self._content_map = defaultdict(set)
+            for doc_id, row in self._rows.items():
+                self._content_map[
+                    self._content_key(self._fingerprints[row])].add(doc_id)
+        return self._content_map
+
+    def _grow(self, min_capacity):
+        capacity = max(1, len(self._live))
+        while capacity < min_capacity:
+            capacity *= 2
+        if capacity == len(self._live) and \
+                self._fingerprints.flags.writeable:
+            return
+        n_rows = len(self._row_ids)
+        for name in ('_fingerprints', '_keys', '_live'):
+            old = getattr(self, name)
+            new = np.zeros((capacity, ) + old.shape[1:], dtype=old.dtype)
+            new[:n_rows] = old[:n_rows]
+            setattr(self, name, new)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._rows
+
+    @property
+    def fingerprints(self):
+        """The fingerprint matrix of all rows, including removed ones."""
+        return self._fingerprints[:len(self._row_ids)]
+
+    def clear(self):
+        self._allocate(self._initial_capacity)
+        self.hasher.fingerprint.cache_clear()
+
+    def add_doc(self, doc, doc_id):
+        fingerprint = self.hasher.fingerprint(doc.encode('utf8'))
+        self.add_fingerprint(fingerprint, doc_id)
+
+    def add_fingerprint(self, fingerprint, doc_id):
+        self.add_fingerprints(np.asarray(fingerprint)[np.newaxis], [doc_id])
+
+    def add_fingerprints(self, fingerprints, doc_ids):
+        """Add a `(n_docs, fingerprint_size)` fingerprint matrix in one go.
+
+        An id repeated in the batch is added once with its last fingerprint,
+        like successive calls to `Cache.add_fingerprint`.
+        """
+        doc_ids = list(doc_ids)
+        last = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+        if len(last) < len(doc_ids):
+            keep = sorted(last.values())
+            fingerprints = np.asarray(fingerprints)[keep]
+            doc_ids = [doc_ids[i] for i in keep]
+        for doc_id in doc_ids:
+            if doc_id in self._rows:
+                self.remove_id(doc_id)
+        if not isinstance(self._row_ids, list):
+            self._row_ids = list(self._row_ids)
+        start = len(self._row_ids)
+        stop = start + len(doc_ids)
+        self._grow(stop)
+        self._fingerprints[start:stop] = fingerprints
+        self._keys[start:stop] = band_keys(
+            self.hasher.unpack(self._fingerprints[start:stop]), self.num_bands)
+        self._live[start:stop] = True
+        contents = self._contents
+        for row, doc_id in enumerate(doc_ids, start):
+            self._rows[doc_id] = row
+            contents[self._content_key(self._fingerprints[row])].add(doc_id)
+        self._row_ids.extend(doc_ids)
+        self._index = None
+
+    def remove_id(self, doc_id):
+        row = self._rows.pop(doc_id)
+        key = self._content_key(self._fingerprints[row])
+        self._contents[key].discard(doc_id)
+        if not self._contents[key]:
+            del self._contents[key]
+        self._live[row] = False
+        self._index = None
+
+    def remove_doc(self, doc):
+        for doc_id in self.get_exact_duplicates_of(doc=doc):
+            self.remove_id(doc_id)
+
+    def get_exact_duplicates_of(self, doc=None, doc_id=None,
+                                fingerprint=None):
+        """Return the ids of the documents with exactly the same fingerprint.
+
+        See `Cache.get_exact_duplicates_of`.
+        """
+        if fingerprint is None:
+            fingerprint = self._fingerprint_of(doc, doc_id)
+        return {i for i in self._contents.get(self._content_key(fingerprint),
+                                              ())
+                if np.array_equal(self._fingerprints[self._rows[i]],
+                                  fingerprint)}
+
+    def _content_key(self, fingerprint):
+        return content_key(fingerprint, self.hasher.dtype)
+
+    def _build_index(self):
+        """Sort the band keys of the live rows, one sort per band."""
+        if self._index is not None:
+            return self._index
+        rows = np.flatnonzero(self._live[:len(self._row_ids)])
+        order = np.argsort(self._keys[rows], axis=0, kind='stable')
+        sorted_rows = rows[order]
+        sorted_keys = np.take_along_axis(self._keys[rows], order, axis=0)
+        self._index = sorted_rows.T.copy(), sorted_keys.T.copy()
+        return self._index
+
+    def buckets(self, min_size=2):
+        """Yield the rows of each bucket of at least `min_size` documents."""
+        sorted_rows, sorted_keys = self._build_index()
+        for band_rows, band_keys_ in zip(sorted_rows, sorted_keys):
+            if len(band_keys_) == 0:
+                continue
+            starts = np.flatnonzero(
+                np.r_[True, band_keys_[1:] != band_keys_[:-1]])
+            sizes = np.diff(np.r_[starts, len(band_keys_)])
+            for start, size in zip(starts[sizes >= min_size],
+                                   sizes[sizes >= min_size]):
+                yield band_rows[start:start + size]
+
+    def filter_candidates(self, candidate_id_pairs, min_jaccard):
+        logging.info('Computing Jaccard sim of %d pairs',
+                     len(candidate_id_pairs))
+        res = filter_pairs(candidate_id_pairs, self._fingerprint_matrix,
+                           min_jaccard, estimate=self.hasher.estimate_jaccard)
+        logging.info('Keeping %d/%d candidate duplicate pairs',
+                     len(res), len(candidate_id_pairs))
+        return res
+
+    def get_all_duplicates(self, min_jaccard=None):
+        candidate_pairs = set()
+        for ids in self.iter_buckets():
+            candidate_pairs.update(itertools.combinations(ids, r=2))
+        if min_jaccard is None:
+            return candidate_pairs
+
+        return self.filter_candidates(candidate_pairs, min_jaccard)
+
+    def iter_buckets(self):
+        """Yield the doc ids of every bucket with more than one document."""
+        for rows in self.buckets():
+            yield [self._row_ids[row] for row in np.sort(rows)]
+
+    def get_clusters(self, min_jaccard=None, similarity=None):
+        """Yield clusters of duplicate documents as lists of doc ids.
+
+        See `Cache.get_clusters`.
+        """
+        if similarity is None and min_jaccard is not None:
+            similarity = self._estimate_similarity
+        return cluster_buckets(self.iter_buckets(), similarity=similarity,
+                               threshold=min_jaccard)
+
+    def _estimate_similarity(self, main_id, other_ids):
+        return self.hasher.estimate_jaccard(
+            self._fingerprint_matrix(other_ids),
+            self._fingerprint_matrix([main_id])[0])
+
+    def get_duplicates_of(self, doc=None, doc_id=None, min_jaccard=None,
+                          fingerprint=None):
+        if fingerprint is None:
+            fingerprint = self._fingerprint_of(doc, doc_id)
+
+        keys = band_keys(self.hasher.unpack(fingerprint)[np.newaxis],
+                         self.num_bands)[0]
+        sorted_rows, sorted_keys = self._build_index()
+        candidates = set()
+        for band_i, key in enumerate(keys):
+            lo = np.searchsorted(sorted_keys[band_i], key, side='left')
+            hi = np.searchsorted(sorted_keys[band_i], key, side='right')
+            candidates.update(self._row_ids[row]
+                              for row in sorted_rows[band_i][lo:hi])
+
+        if min_jaccard is None:
+            return candidates
+        else:
+            candidates = list(candidates)
+            jaccard = self.hasher.estimate_jaccard(
+                self._fingerprint_matrix(candidates), fingerprint)
+            return {x for x, j in zip(candidates, jaccard) if j > min_jaccard}
+
+    def _fingerprint_matrix(self, doc_ids):
+        rows = np.array([self._rows[doc_id] for doc_id in doc_ids],
+                        dtype=np.int64)
+        return self._fingerprints[rows]
+
+    def _fingerprint_of(self, doc, doc_id):
+        if doc_id is not None and doc_id in self._rows:
+            return self._fingerprints[self._rows[doc_id]]
+        elif doc is not None:
+            return self.hasher.fingerprint(doc.encode('utf8'))
+        raise ValueError('Must provide a document or a known document id')
 
     def is_duplicate(self, doc, doc_id=None):
         return len(self.get_duplicates_of(doc, doc_id=doc_id)) > 0
+
+    def save(self, directory):
+        """Save the live fingerprints, ids and band tables to `directory`.
+
+        Removed rows are dropped. The saved cache can be loaded with
+        `ArrayCache.load` or `Cache.load`, see `save_arrays` for the format.
+        """
+        rows = np.flatnonzero(self._live[:len(self._row_ids)])
+        save_arrays(directory, self.hasher, self.num_bands,
+                    self._fingerprints[rows],
+                    (self._row_ids[row] for row in rows))
+
+    @classmethod
+    def load(cls, directory, hasher=None, mmap=True):
+        """Load a cache saved with `save` or `Cache.save`.
+
+        With `mmap=True` the fingerprints, band keys, sorted band tables and
+        ids are memory-mapped and only the pages touched by queries are read,
+        so a large corpus can be checked for duplicates of new documents
+        without reading it into memory. Adding documents to a memory-mapped
+        cache copies its arrays into memory.
+        """
+        meta, hasher, arrays = load_arrays(directory, hasher=hasher,
+                                           mmap=mmap)
+        cache = cls(hasher, num_bands=meta['num_bands'])
+        cache._fingerprints = arrays['fingerprints']
+        cache._keys = arrays['keys']
+        cache._live = np.ones(len(arrays['fingerprints']), dtype=bool)
+        cache._row_ids = arrays['ids']
+        cache._row_map = None
+        cache._content_map = None
+        cache._index = arrays['band_rows'], arrays['band_keys']
+        return cache
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""Group near duplicate documents into clusters with a disjoint-set forest.
+
+Every bucket of an LSH cache links its members together. Instead of
+enumerating every candidate pair of a bucket, each member is merged with the
+first member of the bucket, which is linear in the size of the bucket, and
+the connected components are read off the forest at the end.
+"""
+from __future__ import division
+
+from array import array
+
+import numpy as np
+
+
+class DisjointSet(object):
+    """A union-find structure over arbitrary hashable items.
+
+    Items are interned to consecutive integers the first time they are seen
+    and the forest is kept in two compact integer arrays, `find` uses path
+    compression and `union` links by size.
+    """
+
+    def __init__(self):
+        self._index = dict()
+        self._items = []
+        self._parent = array('q')
+        self._size = array('q')
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return item in self._index
+
+    def add(self, item):
+        """Return the integer id of `item`, adding it as a singleton."""
+        index = self._index.get(item)
+        if index is None:
+            index = len(self._items)
+            self._index[item] = index
+            self._items.append(item)
+            self._parent.append(index)
+            self._size.append(1)
+        return index
+
+    def _find(self, index):
+        parent = self._parent
+        root = index
+        while parent[root] != root:
+            root = parent[root]
+        while parent[index] != root:
+            parent[index], index = root, parent[index]
+        return root
+
+    def find(self, item):
+        return self._items[self._find(self._index[item])]
+
+    def union(self, item_a, item_b):
+        root_a = self._find(self.add(item_a))
+        root_b = self._find(self.add(item_b))
+        if root_a == root_b:
+            return
+        if self._size[root_a] < self._size[root_b]:
+            root_a, root_b = root_b, root_a
+        self._parent[root_b] = root_a
+        self._size[root_a] += self._size[root_b]
+
+    def components(self, min_size=2):
+        """Yield the items of each component of at least `min_size` items.
+
+        Components are yielded as lists ordered by insertion, in the order in
+        which their first item was added.
+        """
+        roots = np.array([self._find(i) for i in range(len(self._items))],
+                         dtype=np.int64)
+        if len(roots) == 0:
+            return
+        order = np.argsort(roots, kind='stable')
+        sorted_roots = roots[order]
+        starts = np.flatnonzero(np.r_[True, sorted_roots[1:] !=
+                                      sorted_roots[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        groups = [(order[start], order[start:end])
+                  for start, end in zip(starts, ends)
+                  if end - start >= min_size]
+        for _, members in sorted(groups, key=lambda group: group[0]):
+            yield [self._items[i] for i in members]
+
+
+def cluster_buckets(buckets, similarity=None, threshold=None):
+    """Merge the members of every bucket and yield the connected components.
+
+    Parameters:
+    -----------
+    buckets: iterable of lists
+        The document ids of each bucket with more than one member.
+
+    similarity: None, callable
+        Optional verification, `similarity(main_id, other_ids)` returns the
+        similarity of the first member of a bucket with every other member.
+        Only members with a similarity above `threshold` are merged.
+
+    threshold: None, float
+        The similarity a member must exceed to be merged, required when
+        `similarity` is given.
+    """
+    if similarity is not None and threshold is None:
+        raise ValueError('A threshold is required to verify buckets with a '
+                         'similarity function.')
+    return _cluster_buckets(buckets, similarity, threshold)
+
+
+def _cluster_buckets(buckets, similarity, threshold):
+    forest = DisjointSet()
+    for bucket in buckets:
+        main_id, other_ids = bucket[0], bucket[1:]
+        if similarity is not None:
+            scores = similarity(main_id, other_ids)
+            other_ids = [other for other, score in zip(other_ids, scores)
+                         if score > threshold]
+        for other_id in other_ids:
+            forest.union(main_id, other_id)
+    for component in forest.components():
+        yield component
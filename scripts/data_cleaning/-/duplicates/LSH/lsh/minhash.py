@@ -3,14 +3,57 @@ try:
     from functools import lru_cache
 except ImportError:
     from functools32 import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+import os
 
 import numpy as np
 
-from .cMinhash import minhash_32, minhash_64
+from .cMinhash import minhash_32, minhash_64, minhash_universal
+
+# modulus of the universal hash family used by `method='universal'`
+MERSENNE_61 = (1 << 61) - 1
+# number of lowest bits of every min hash kept by b-bit MinHash fingerprints
+B_BITS = (1, 2, 4)
+
+
+def pack_bits(values, b_bits):
+    """Pack the lowest `b_bits` bits of every min hash into bytes.
+
+    `values` is a fingerprint or a `(n_docs, num_seeds)` fingerprint matrix,
+    the result has `ceil(num_seeds * b_bits / 8)` `uint8` columns.
+    """
+    values = np.asarray(values)
+    low = (values & ((1 << b_bits) - 1)).astype(np.uint8)
+    bits = np.unpackbits(low[..., np.newaxis], axis=-1)[..., 8 - b_bits:]
+    bits = bits.reshape(values.shape[:-1] + (-1, ))
+    return np.packbits(bits, axis=-1)
+
+
+def unpack_bits(packed, b_bits, num_values):
+    """Inverse of `pack_bits`, returns `num_values` `uint8` values per row."""
+    packed = np.asarray(packed, dtype=np.uint8)
+    bits = np.unpackbits(packed, axis=-1, count=num_values * b_bits)
+    bits = bits.reshape(packed.shape[:-1] + (num_values, b_bits))
+    weights = (1 << np.arange(b_bits - 1, -1, -1)).astype(np.uint8)
+    return (bits * weights).sum(axis=-1, dtype=np.uint8)
+
+
+def bbit_jaccard(match_fraction, b_bits):
+    """Correct the fraction of equal b-bit min hashes for chance matches.
+
+    Two unrelated documents agree on the lowest `b_bits` bits of a min hash
+    with probability `2**-b_bits`, so for shingle sets that are small
+    compared to the hash space the Jaccard similarity is estimated by
+    `(P - 2**-b) / (1 - 2**-b)` (Li and Koenig, b-Bit Minwise Hashing).
+    """
+    chance = 0.5 ** b_bits
+    return np.clip((np.asarray(match_fraction) - chance) / (1. - chance),
+                   0., 1.)
 
 
 class MinHasher(object):
-    def __init__(self, seeds, char_ngram=8, random_state=None, hashbytes=8):
+    def __init__(self, seeds, char_ngram=8, random_state=None, hashbytes=8,
+                 method='murmur', b_bits=None):
         """The MinHasher creates fingerprints from raw documents.
 
         The MinHasher facilitates the creation of MinHash document
@@ -32,6 +75,26 @@ class MinHasher(object):
 
         random_state: None, int, np.random.RandomState
             A random state to initialise the random number generator with.
+
+        hashbytes: int
+            The size in bytes of each min hash, 4 or 8.
+
+        method: str
+            How the min hashes are computed. `'murmur'` runs MurmurHash3 over
+            every shingle once per seed. `'universal'` hashes every shingle
+            only once and derives one min hash per seed with a universal hash
+            permutation `(a * h + b) mod (2**61 - 1)`, which is considerably
+            faster for large numbers of seeds. The permutation parameters are
+            derived deterministically from `seeds`. Fingerprints of the two
+            methods have the same shape and dtype but are not comparable with
+            each other.
+
+        b_bits: None, int
+            Keep only the lowest 1, 2 or 4 bits of every min hash and pack
+            them into a `uint8` array of `ceil(num_seeds * b_bits / 8)` bytes,
+            which is 8 to 32 times smaller than the full fingerprint. Use
+            `unpack` to get the b-bit values and `estimate_jaccard` to
+            compare packed fingerprints. None keeps the full min hashes.
         """
         self.char_ngram = char_ngram
         random_state = np.random.RandomState(random_state)
@@ -41,6 +104,14 @@ class MinHasher(object):
         if hashbytes == 16:
             raise NotImplementedError()
 
+        if method not in ('murmur', 'universal'):
+            raise ValueError('Method has to be "murmur" or "universal".')
+        self.method = method
+
+        if b_bits is not None and b_bits not in B_BITS:
+            raise ValueError('b_bits has to be None, 1, 2 or 4.')
+        self.b_bits = b_bits
+
         self.hashbytes = hashbytes
         if isinstance(seeds, np.ndarray):
             self._seeds = seeds.astype(np.uint32)
@@ -48,22 +119,121 @@ class MinHasher(object):
             self._seeds = np.array(random_state.randint(0, 1e6, seeds),
                                    dtype=np.uint32)
 
+        if method == 'universal':
+            # 32bit hashes use 32bit permutation parameters so that the
+            # kernel can skip the overflow-safe modular multiplication
+            high = (1 << 32) if hashbytes == 4 else MERSENNE_61
+            permutation_state = np.random.RandomState(self._seeds)
+            self._perm_a = permutation_state.randint(
+                1, high, self.num_seeds, dtype=np.uint64)
+            self._perm_b = permutation_state.randint(
+                0, high, self.num_seeds, dtype=np.uint64)
+
     @property
     def num_seeds(self):
         return len(self._seeds)
 
+    @property
+    def dtype(self):
+        if self.b_bits is not None:
+            return np.uint8
+        return np.uint32 if self.hashbytes == 4 else np.uint64
+
+    @property
+    def fingerprint_size(self):
+        """Number of elements of a fingerprint, packed with `b_bits`."""
+        if self.b_bits is not None:
+            return -(-self.num_seeds * self.b_bits // 8)
+        return self.num_seeds
+
+    def unpack(self, fingerprints):
+        """Return the `num_seeds` (b-bit) min hashes of packed fingerprints.
+
+        Fingerprints of a hasher without `b_bits` are returned unchanged.
+        """
+        if self.b_bits is None:
+            return np.asarray(fingerprints)
+        return unpack_bits(fingerprints, self.b_bits, self.num_seeds)
+
+    def estimate_jaccard(self, fingerprints_a, fingerprints_b):
+        """Estimate the Jaccard similarity of rows of two fingerprint matrices.
+
+        The fraction of equal min hashes, corrected with `bbit_jaccard` for
+        b-bit fingerprints.
+        """
+        match_fraction = (self.unpack(fingerprints_a) ==
+                          self.unpack(fingerprints_b)).mean(axis=-1)
+        if self.b_bits is None:
+            return match_fraction
+        return bbit_jaccard(match_fraction, self.b_bits)
+
     @lru_cache(maxsize=10000)
     def fingerprint(self, text):
+        return self._fingerprint(text)
+
+    def _fingerprint(self, text):
         if isinstance(text, str):
             text = text.encode('utf8')
-        if self.hashbytes == 4:
+        if self.method == 'universal':
+            fingerprint = minhash_universal(text, len(text),
+                                            self._perm_a, self._perm_b,
+                                            self._seeds[0], self.char_ngram,
+                                            self.hashbytes)
+        elif self.hashbytes == 4:
             fingerprint = minhash_32(text, len(text),
                                      self._seeds, self.char_ngram)
         elif self.hashbytes == 8:
             fingerprint = minhash_64(text, len(text),
                                      self._seeds, self.char_ngram)
+        if self.b_bits is not None:
+            fingerprint = pack_bits(fingerprint, self.b_bits)
         return fingerprint
 
+    def fingerprint_batch(self, docs, n_threads=None):
+        """Fingerprint a sequence of documents into a single matrix.
+
+        The hashing kernels release the GIL while shingling, so the documents
+        are split into chunks that are fingerprinted concurrently by a pool of
+        `n_threads` threads. The results bypass the `fingerprint` cache.
+
+        Parameters:
+        -----------
+        docs: list of bytes or str
+            The documents to fingerprint, `str` documents are utf8 encoded.
+
+        n_threads: None, int
+            The number of threads to use, defaults to the number of CPUs.
+
+        Returns:
+        --------
+        np.ndarray of shape `(len(docs), fingerprint_size)` with one
+        fingerprint per row, `uint32` for 4 byte hashes, `uint64` for 8 byte
+        hashes and packed `uint8` for b-bit fingerprints.
+        """
+        n_docs = len(docs)
+        fingerprints = np.empty((n_docs, self.fingerprint_size),
+                                dtype=self.dtype)
+        if n_threads is None:
+            n_threads = os.cpu_count() or 1
+
+        def fingerprint_range(start, stop):
+            for i in range(start, stop):
+                fingerprints[i] = self._fingerprint(docs[i])
+
+        if n_threads <= 1 or n_docs <= 1:
+            fingerprint_range(0, n_docs)
+            return fingerprints
+
+        # a few chunks per thread keeps the threads busy when doc lengths vary
+        chunk_size = max(1, -(-n_docs // (n_threads * 4)))
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            futures = [executor.submit(fingerprint_range, start,
+                                       min(start + chunk_size, n_docs))
+                       for start in range(0, n_docs, chunk_size)]
+            for future in futures:
+                future.result()
+        return fingerprints
+
     def jaccard(self, doc1, doc2):
         if isinstance(doc1, str):
             f_a = set(self.fingerprint(doc1))
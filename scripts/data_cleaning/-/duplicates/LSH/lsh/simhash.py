@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""Near duplicate detection with 64bit SimHash signatures.
+
+The signature of a document is the sign of the weighted sum of the 64bit
+hashes of its tokens, every bit counting as +1 or -1 (Charikar). Documents
+with similar token distributions have signatures that differ in only a few
+bits.
+
+Signatures within Hamming distance `k` are found with the permuted tables of
+Manku, Jain and Das Sarma: the 64 bits are split into `num_blocks > k`
+blocks, two signatures within distance `k` agree exactly on at least
+`num_blocks - k` blocks, so one table is sorted by every choice of
+`num_blocks - k` blocks and only signatures with equal keys in some table are
+compared. Sorting by the masked signature is the same as sorting by the
+signature with the chosen blocks permuted to the top.
+"""
+from __future__ import division
+
+from collections import Counter
+from functools import lru_cache
+import hashlib
+import itertools
+import re
+
+import numpy as np
+
+SIGNATURE_BITS = 64
+TOKEN_REGEX = re.compile(r'\w+', re.UNICODE)
+# number of set bits of every byte value
+POPCOUNT_8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+BIT_SHIFTS = np.arange(SIGNATURE_BITS, dtype=np.uint64)
+
+
+@lru_cache(maxsize=1 << 18)
+def token_hash(token):
+    """Stable 64bit hash of a token, independent of `PYTHONHASHSEED`."""
+    return int.from_bytes(hashlib.blake2b(token.encode('utf8'),
+                                          digest_size=8).digest(), 'little')
+
+
+def simhash(text, ngram=1):
+    """Return the 64bit SimHash signature of text as a `np.uint64`.
+
+    The features are the lower cased word `ngram`s of the text, weighted by
+    their number of occurrences. A document without words has signature 0.
+    """
+    if isinstance(text, bytes):
+        text = text.decode('utf8')
+    tokens = TOKEN_REGEX.findall(text.lower())
+    if ngram > 1:
+        tokens = [' '.join(tokens[i:i + ngram])
+                  for i in range(len(tokens) - ngram + 1)]
+    if not tokens:
+        return np.uint64(0)
+    counts = Counter(tokens)
+    hashes = np.array([token_hash(token) for token in counts],
+                      dtype=np.uint64)
+    weights = np.array(list(counts.values()), dtype=np.float64)
+    bits = ((hashes[:, np.newaxis] >> BIT_SHIFTS) & np.uint64(1)).astype(
+        np.float64)
+    votes = weights.dot(2. * bits - 1.)
+    return np.packbits(votes > 0, bitorder='little').view('<u8')[0]
+
+
+def simhash_batch(docs, ngram=1):
+    """Return the signatures of a sequence of documents as a `uint64` array."""
+    return np.array([simhash(doc, ngram=ngram) for doc in docs],
+                    dtype=np.uint64)
+
+
+def hamming_distance(signatures_a, signatures_b):
+    """Number of differing bits of two arrays of 64bit signatures."""
+    xor = np.bitwise_xor(np.asarray(signatures_a, dtype=np.uint64),
+                         np.asarray(signatures_b, dtype=np.uint64))
+    flat = np.ascontiguousarray(xor).reshape(-1)
+    counts = POPCOUNT_8[flat.view(np.uint8)].reshape(len(flat), 8).sum(
+        axis=1, dtype=np.int64)
+    return counts.reshape(xor.shape)
+
+
+def block_masks(max_distance, num_blocks):
+    """Return the key masks of the permuted tables.
+
+    Every mask selects `num_blocks - max_distance` of `num_blocks` contiguous
+    blocks of bits, there is one mask per combination of blocks.
+    """
+    if not 0 <= max_distance < num_blocks <= SIGNATURE_BITS:
+        raise ValueError('Need 0 <= max_distance < num_blocks <= 64.')
+    bounds = [SIGNATURE_BITS * i // num_blocks for i in range(num_blocks + 1)]
+    blocks = [((1 << (end - start)) - 1) << start
+              for start, end in zip(bounds, bounds[1:])]
+    masks = []
+    for combination in itertools.combinations(blocks,
+                                              num_blocks - max_distance):
+        mask = 0
+        for block in combination:
+            mask |= block
+        masks.append(np.uint64(mask))
+    return masks
+
+
+class SimHashIndex(object):
+    """Find signatures within a Hamming distance of each other.
+
+    Signatures and their document ids are kept in a growable `uint64` array
+    and a list. The tables are not stored as permuted copies of the
+    signatures, each table only keeps the order of the rows sorted by its
+    key, a 32bit row index per document, built lazily the first time the
+    index is queried after it was modified.
+
+    Parameters:
+    -----------
+    max_distance: int
+        The largest Hamming distance of two near duplicate signatures.
+
+    num_blocks: None, int
+        The number of blocks the signatures are split in, defaults to
+        `max_distance + 2`. More blocks mean more tables with longer keys,
+        i.e. fewer candidates per lookup.
+    """
+
+    def __init__(self, max_distance=3, num_blocks=None, capacity=1024):
+        if num_blocks is None:
+            num_blocks = max_distance + 2
+        self.max_distance = max_distance
+        self.num_blocks = num_blocks
+        self.masks = block_masks(max_distance, num_blocks)
+        self._signatures = np.zeros(max(1, capacity), dtype=np.uint64)
+        self._ids = []
+        self._orders = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def signatures(self):
+        return self._signatures[:len(self._ids)]
+
+    def add(self, signatures, doc_ids):
+        """Add an array of signatures with their document ids."""
+        signatures = np.asarray(signatures, dtype=np.uint64).reshape(-1)
+        doc_ids = list(doc_ids)
+        start = len(self._ids)
+        stop = start + len(doc_ids)
+        if stop > len(self._signatures):
+            capacity = len(self._signatures)
+            while capacity < stop:
+                capacity *= 2
+            grown = np.zeros(capacity, dtype=np.uint64)
+            grown[:start] = self._signatures[:start]
+            self._signatures = grown
+        self._signatures[start:stop] = signatures
+        self._ids.extend(doc_ids)
+        self._orders = None
+
+    def add_doc(self, doc, doc_id, ngram=1):
+        self.add([simhash(doc, ngram=ngram)], [doc_id])
+
+    def _row_dtype(self):
+        return np.uint32 if len(self._ids) < (1 << 32) else np.int64
+
+    def _build_orders(self):
+        if self._orders is None:
+            signatures = self.signatures
+            self._orders = [np.argsort(signatures & mask, kind='stable')
+                            .astype(self._row_dtype())
+                            for mask in self.masks]
+        return self._orders
+
+    def query(self, signatures, max_distance=None):
+        """Find the indexed documents near every signature of a batch.
+
+        Returns one list of `(doc_id, distance)` per query signature, sorted
+        by distance. `max_distance` can be lowered below the distance the
+        index was built for.
+        """
+        if max_distance is None:
+            max_distance = self.max_distance
+        if max_distance > self.max_distance:
+            raise ValueError('The index only finds signatures within a '
+                             'distance of {}.'.format(self.max_distance))
+        queries = np.asarray(signatures, dtype=np.uint64).reshape(-1)
+        index = self.signatures
+        found_queries = []
+        found_rows = []
+        for mask, order in zip(self.masks, self._build_orders()):
+            sorted_keys = index[order] & mask
+            keys = queries & mask
+            lo = np.searchsorted(sorted_keys, keys, side='left')
+            hi = np.searchsorted(sorted_keys, keys, side='right')
+            counts = hi - lo
+            query_rows = np.repeat(np.arange(len(queries)), counts)
+            # positions lo[i] .. hi[i] - 1 of every query, concatenated
+            positions = np.arange(counts.sum()) - np.repeat(
+                np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)
+            found_queries.append(query_rows)
+            found_rows.append(order[positions].astype(np.int64))
+        query_rows = np.concatenate(found_queries)
+        rows = np.concatenate(found_rows)
+        pair_keys = np.unique(query_rows * max(len(index), 1) + rows)
+        query_rows, rows = np.divmod(pair_keys, max(len(index), 1))
+        distances = hamming_distance(queries[query_rows], index[rows])
+        near = distances <= max_distance
+
+        results = [[] for _ in range(len(queries))]
+        for query_row, row, distance in sorted(zip(query_rows[near].tolist(),
+                                                   rows[near].tolist(),
+                                                   distances[near].tolist()),
+                                               key=lambda x: (x[0], x[2])):
+            results[query_row].append((self._ids[row], distance))
+        return results
+
+    def pairs(self):
+        """Find every pair of indexed signatures within `max_distance`.
+
+        Rows with identical signatures are only paired with the first of
+        them, the remaining distinct signatures are compared within runs of
+        equal keys of every table. Returns three arrays with the first row,
+        the other row and the distance of each pair, first rows were added
+        before the other rows.
+        """
+        signatures = self.signatures
+        order = np.argsort(signatures, kind='stable')
+        sorted_signatures = signatures[order]
+        starts = np.ones(len(order), dtype=bool)
+        np.not_equal(sorted_signatures[1:], sorted_signatures[:-1],
+                     out=starts[1:])
+        run_ids = np.cumsum(starts) - 1
+        first_rows = order[starts]
+        # identical signatures, paired with the first row of their run
+        firsts = [first_rows[run_ids[~starts]]]
+        others = [order[~starts]]
+        distances = [np.zeros(len(others[0]), dtype=np.int64)]
+
+        unique = signatures[first_rows]
+        for mask in self.masks:
+            keys = unique & mask
+            key_order = np.argsort(keys, kind='stable')
+            sorted_keys = keys[key_order]
+            # runs are contiguous, offsets beyond the longest run are empty
+            for offset in range(1, len(sorted_keys)):
+                same = sorted_keys[offset:] == sorted_keys[:-offset]
+                if not same.any():
+                    break
+                a = key_order[:-offset][same]
+                b = key_order[offset:][same]
+                distance = hamming_distance(unique[a], unique[b])
+                near = distance <= self.max_distance
+                rows_a, rows_b = first_rows[a[near]], first_rows[b[near]]
+                firsts.append(np.minimum(rows_a, rows_b))
+                others.append(np.maximum(rows_a, rows_b))
+                distances.append(distance[near])
+
+        firsts = np.concatenate(firsts).astype(np.int64)
+        others = np.concatenate(others).astype(np.int64)
+        distances = np.concatenate(distances)
+        # a pair found in several tables is kept once
+        _, keep = np.unique(firsts * max(len(signatures), 1) + others,
+                            return_index=True)
+        return firsts[keep], others[keep], distances[keep]
+
+    def iter_duplicates(self):
+        """Yield `(main_id, [(other_id, distance), ...])` for every document
+        that has near duplicates added after it, in order of addition."""
+        firsts, others, distances = self.pairs()
+        order = np.lexsort((others, firsts))
+        firsts = firsts[order].tolist()
+        others = others[order].tolist()
+        distances = distances[order].tolist()
+        for first, group in itertools.groupby(
+                zip(firsts, others, distances), key=lambda pair: pair[0]):
+            yield self._ids[first], [(self._ids[other], distance)
+                                     for _, other, distance in group]
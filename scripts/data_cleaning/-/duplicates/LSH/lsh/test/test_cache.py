@@ -1,8 +1,8 @@
 import numpy as np
 import pytest
 
-from lsh.cache import Cache
-from lsh.minhash import MinHasher
+from lsh.cache import ArrayCache, Cache
+from lsh.minhash import MinHasher, pack_bits, unpack_bits
 
 
 @pytest.fixture
@@ -10,9 +10,9 @@ def default_hasher():
     return MinHasher(seeds=100)
 
 
-@pytest.fixture
-def default_cache(default_hasher):
-    return Cache(default_hasher)
+@pytest.fixture(params=[Cache, ArrayCache])
+def default_cache(request, default_hasher):
+    return request.param(default_hasher)
 
 
 def is_nondecreasing(L):
@@ -24,10 +24,12 @@ def is_nondecreasing(L):
 @pytest.mark.parametrize("hashbytes", [4, 8])
 @pytest.mark.parametrize("num_bands", [20, 40, 50])
 @pytest.mark.parametrize("seed", range(3))
-def test_cache(char_ngram, hashbytes, num_bands, seed):
+@pytest.mark.parametrize("method", ['murmur', 'universal'])
+@pytest.mark.parametrize("cache_class", [Cache, ArrayCache])
+def test_cache(char_ngram, hashbytes, num_bands, seed, method, cache_class):
     hasher = MinHasher(seeds=200, char_ngram=char_ngram,
-                       hashbytes=hashbytes, random_state=seed)
-    lsh = Cache(hasher, num_bands=num_bands)
+                       hashbytes=hashbytes, random_state=seed, method=method)
+    lsh = cache_class(hasher, num_bands=num_bands)
     # very small band width => always find duplicates
 
     short_doc = 'This is a simple document'
@@ -135,6 +137,76 @@ def test_filtering_by_jaccard(default_cache):
     assert dupes == set()
 
 
+def test_filtering_uses_minhash_estimate(default_cache):
+    default_cache.add_doc(mc_long_doc, 0)
+    default_cache.add_doc(mc_long_doc + ' Retired.', 1)
+    f0 = default_cache.hasher.fingerprint(mc_long_doc)
+    f1 = default_cache.hasher.fingerprint(mc_long_doc + ' Retired.')
+    estimate = np.mean(f0 == f1)
+    assert 0 < estimate < 1
+
+    assert default_cache.get_all_duplicates(
+        min_jaccard=estimate - 0.01) == {(0, 1)}
+    assert default_cache.get_all_duplicates(min_jaccard=estimate) == set()
+    assert default_cache.get_duplicates_of(
+        doc_id=0, min_jaccard=estimate) == {0}
+
+
+def test_exact_duplicates(default_cache):
+    default_cache.add_doc(mc_long_doc, 0)
+    default_cache.add_doc(mc_short_doc, 1)
+    default_cache.add_doc(mc_short_doc, 2)
+
+    assert default_cache.get_exact_duplicates_of(mc_short_doc) == {1, 2}
+    assert default_cache.get_exact_duplicates_of(doc_id=0) == {0}
+    assert default_cache.get_exact_duplicates_of(mc_med_doc) == set()
+    f = default_cache.hasher.fingerprint(mc_short_doc)
+    assert default_cache.get_exact_duplicates_of(
+        fingerprint=f.astype(np.int64)) == {1, 2}
+
+    # re-adding an id replaces its fingerprint everywhere
+    default_cache.add_doc(mc_med_doc, 2)
+    assert default_cache.get_exact_duplicates_of(mc_short_doc) == {1}
+    assert default_cache.get_exact_duplicates_of(mc_med_doc) == {2}
+    assert default_cache.get_duplicates_of(mc_short_doc) == {1}
+
+    default_cache.remove_id(1)
+    assert default_cache.get_exact_duplicates_of(mc_short_doc) == set()
+
+    default_cache.clear()
+    assert default_cache.get_exact_duplicates_of(mc_med_doc) == set()
+    assert default_cache.get_all_duplicates() == set()
+    default_cache.add_doc(mc_med_doc, 2)
+    assert default_cache.get_exact_duplicates_of(mc_med_doc) == {2}
+
+
+def test_clusters(default_cache):
+    default_cache.add_doc(mc_long_doc, 0)
+    default_cache.add_doc(mc_med_doc, 1)
+    default_cache.add_doc(mc_med_doc, 2)
+    default_cache.add_doc(mc_short_doc, 3)
+    default_cache.add_doc(mc_short_doc, 4)
+    default_cache.add_doc(mc_short_doc, 5)
+
+    clusters = [set(c) for c in default_cache.get_clusters()]
+    assert {1, 2} <= next(c for c in clusters if 1 in c)
+    assert {3, 4, 5} in clusters
+    # every candidate pair ends up in the same cluster
+    for id1, id2 in default_cache.get_all_duplicates():
+        assert any({id1, id2} <= c for c in clusters)
+
+    clusters = [set(c) for c in default_cache.get_clusters(min_jaccard=0.9)]
+    assert sorted(clusters, key=min) == [{1, 2}, {3, 4, 5}]
+
+    def never_similar(main_id, other_ids):
+        return [0.] * len(other_ids)
+
+    assert list(default_cache.get_clusters(min_jaccard=0.5,
+                                           similarity=never_similar)) == []
+    with pytest.raises(ValueError):
+        default_cache.get_clusters(similarity=never_similar)
+
+
 def test_jaccard(default_hasher):
     assert default_hasher.jaccard("This is a doc", "This is a doc") == 1
 
@@ -143,6 +215,209 @@ def test_jaccard(default_hasher):
     assert 0 <= low_j < high_j <= 1
 
 
+@pytest.mark.parametrize("hashbytes", [4, 8])
+def test_universal_fingerprint(hashbytes):
+    hasher = MinHasher(seeds=100, char_ngram=5, hashbytes=hashbytes,
+                       random_state=0, method='universal')
+    f = hasher.fingerprint(mc_long_doc)
+    assert f.shape == (100,)
+    assert f.dtype == (np.uint32 if hashbytes == 4 else np.uint64)
+
+    # same seeds => same permutations => same fingerprint
+    other = MinHasher(seeds=hasher._seeds, char_ngram=5, hashbytes=hashbytes,
+                      method='universal')
+    np.testing.assert_array_equal(f, other.fingerprint(mc_long_doc))
+
+    # the fraction of equal min hashes estimates the shingle jaccard
+    def shingles(text):
+        return {text[i:i + 5] for i in range(len(text) - 4)}
+
+    a, b = shingles(mc_long_doc), shingles(mc_med_doc)
+    true_jaccard = len(a & b) / len(a | b)
+    estimate = np.mean(f == hasher.fingerprint(mc_med_doc))
+    assert abs(estimate - true_jaccard) < 0.2
+
+
+@pytest.mark.parametrize("hashbytes", [4, 8])
+@pytest.mark.parametrize("method", ['murmur', 'universal'])
+@pytest.mark.parametrize("n_threads", [1, 4])
+def test_fingerprint_batch(hashbytes, method, n_threads):
+    hasher = MinHasher(seeds=100, char_ngram=5, hashbytes=hashbytes,
+                       random_state=0, method=method)
+    docs = [mc_long_doc, mc_med_doc, mc_short_doc] * 7 + ['Hi there']
+    batch = hasher.fingerprint_batch(docs, n_threads=n_threads)
+    assert batch.shape == (len(docs), 100)
+    assert batch.dtype == hasher.fingerprint(mc_long_doc).dtype
+    for doc, row in zip(docs, batch):
+        np.testing.assert_array_equal(row, hasher.fingerprint(doc))
+
+    assert hasher.fingerprint_batch([], n_threads=n_threads).shape == (0, 100)
+
+
+@pytest.mark.parametrize("hashbytes", [4, 8])
+def test_array_cache_matches_cache(hashbytes):
+    hasher = MinHasher(seeds=100, char_ngram=3, hashbytes=hashbytes,
+                       random_state=0)
+    rng = np.random.RandomState(0)
+    words = ['net', 'bert', 'cisco', 'router', 'switch', 'vlan', 'ospf']
+    docs = [' '.join(rng.choice(words, 6)) for _ in range(60)]
+
+    cache = Cache(hasher, num_bands=20)
+    array_cache = ArrayCache(hasher, num_bands=20, capacity=4)
+    for i, doc in enumerate(docs):
+        cache.add_doc(doc, i)
+    array_cache.add_fingerprints(hasher.fingerprint_batch(docs),
+                                 range(len(docs)))
+    assert len(array_cache) == len(docs)
+
+    def normalize(pairs):
+        return {tuple(sorted(p)) for p in pairs}
+
+    assert normalize(array_cache.get_all_duplicates()) == \
+        normalize(cache.get_all_duplicates())
+    for i, doc in enumerate(docs):
+        assert array_cache.get_duplicates_of(doc_id=i) == \
+            cache.get_duplicates_of(doc_id=i)
+
+    for i in range(0, len(docs), 3):
+        cache.remove_id(i)
+        array_cache.remove_id(i)
+    assert normalize(array_cache.get_all_duplicates()) == \
+        normalize(cache.get_all_duplicates())
+
+
+def test_array_cache_batch_with_repeated_id():
+    hasher = MinHasher(seeds=100, char_ngram=3, random_state=0)
+    docs = ['the cisco router forwards packets',
+            'a vlan splits the switch in domains',
+            'the cisco router forwards packets']
+    array_cache = ArrayCache(hasher, num_bands=20)
+    array_cache.add_fingerprints(hasher.fingerprint_batch(docs),
+                                 ['x', 'y', 'x'])
+    assert len(array_cache) == 2
+    assert array_cache.get_all_duplicates() == set()
+
+    cache = Cache(hasher, num_bands=20)
+    for doc_id, doc in zip(['x', 'y', 'x'], docs):
+        cache.add_doc(doc, doc_id)
+    assert array_cache.get_duplicates_of(doc_id='x') == \
+        cache.get_duplicates_of(doc_id='x')
+
+    array_cache.remove_id('x')
+    assert 'x' not in array_cache
+    assert array_cache.get_all_duplicates() == set()
+    assert array_cache.get_duplicates_of(docs[0]) == set()
+
+
+@pytest.mark.parametrize("save_class", [Cache, ArrayCache])
+@pytest.mark.parametrize("load_class", [Cache, ArrayCache])
+@pytest.mark.parametrize("mmap", [True, False])
+@pytest.mark.parametrize("b_bits", [None, 4])
+def test_save_load(tmpdir, save_class, load_class, mmap, b_bits):
+    hasher = MinHasher(seeds=100, char_ngram=5, hashbytes=4, random_state=0,
+                       method='universal', b_bits=b_bits)
+    cache = save_class(hasher, num_bands=20)
+    cache.add_doc(mc_long_doc, 'http://a.com')
+    cache.add_doc(mc_med_doc, 'http://b.com')
+    cache.add_doc(mc_med_doc, 3)
+    cache.add_doc(mc_short_doc, u'http://ü.com')
+    cache.remove_id(u'http://ü.com')
+    cache.save(str(tmpdir))
+
+    loaded = load_class.load(str(tmpdir), mmap=mmap)
+    assert loaded.num_bands == 20
+    assert loaded.hasher.method == 'universal'
+    assert loaded.hasher.b_bits == b_bits
+    np.testing.assert_array_equal(loaded.hasher.fingerprint(mc_long_doc),
+                                  hasher.fingerprint(mc_long_doc))
+
+    def normalize(pairs):
+        return {frozenset(p) for p in pairs}
+
+    assert normalize(loaded.get_all_duplicates()) == \
+        normalize(cache.get_all_duplicates())
+    dupes = cache.get_duplicates_of(doc_id=3)
+    assert {'http://b.com', 3} <= dupes
+    assert loaded.get_duplicates_of(doc_id=3) == dupes
+    assert loaded.get_duplicates_of(
+        fingerprint=hasher.fingerprint(mc_med_doc)) == dupes
+    assert not loaded.is_duplicate(mc_short_doc)
+
+    # a loaded cache can still be modified
+    loaded.add_doc(mc_short_doc, 5)
+    assert loaded.get_duplicates_of(mc_short_doc) == {5}
+    loaded.remove_id('http://b.com')
+    assert loaded.get_duplicates_of(doc_id=3) == dupes - {'http://b.com'}
+
+
+def test_invalid_method():
+    with pytest.raises(ValueError):
+        MinHasher(seeds=100, method='sha1')
+    with pytest.raises(ValueError):
+        MinHasher(seeds=100, b_bits=3)
+
+
+@pytest.mark.parametrize("b_bits", [1, 2, 4])
+@pytest.mark.parametrize("num_values", [1, 7, 8, 100])
+def test_pack_bits(b_bits, num_values):
+    rng = np.random.RandomState(0)
+    values = rng.randint(0, 2 ** 32, size=(3, num_values), dtype=np.uint64)
+    packed = pack_bits(values, b_bits)
+    assert packed.dtype == np.uint8
+    assert packed.shape == (3, -(-num_values * b_bits // 8))
+    np.testing.assert_array_equal(unpack_bits(packed, b_bits, num_values),
+                                  values & ((1 << b_bits) - 1))
+    np.testing.assert_array_equal(pack_bits(values[0], b_bits), packed[0])
+
+
+@pytest.mark.parametrize("b_bits", [1, 2, 4])
+@pytest.mark.parametrize("hashbytes", [4, 8])
+def test_bbit_fingerprint(b_bits, hashbytes):
+    full = MinHasher(seeds=400, char_ngram=5, hashbytes=hashbytes,
+                     random_state=1)
+    hasher = MinHasher(seeds=400, char_ngram=5, hashbytes=hashbytes,
+                       random_state=1, b_bits=b_bits)
+    assert hasher.fingerprint_size == 400 * b_bits // 8
+    fingerprint = hasher.fingerprint(mc_long_doc)
+    assert fingerprint.dtype == np.uint8
+    assert fingerprint.nbytes * 8 * hashbytes // b_bits == \
+        full.fingerprint(mc_long_doc).nbytes
+    np.testing.assert_array_equal(
+        hasher.unpack(fingerprint),
+        full.fingerprint(mc_long_doc) & ((1 << b_bits) - 1))
+    batch = hasher.fingerprint_batch([mc_long_doc, mc_med_doc])
+    np.testing.assert_array_equal(batch[0], fingerprint)
+
+    # the corrected estimate is close to the full MinHash estimate
+    expected = full.estimate_jaccard(full.fingerprint(mc_long_doc),
+                                     full.fingerprint(mc_med_doc))
+    estimate = hasher.estimate_jaccard(fingerprint, batch[1])
+    assert abs(estimate - expected) < 0.15
+    assert hasher.estimate_jaccard(fingerprint, fingerprint) == 1.
+    assert hasher.estimate_jaccard(
+        fingerprint, hasher.fingerprint('Some text about animals.')) < 0.15
+
+
+@pytest.mark.parametrize("b_bits", [1, 2, 4])
+@pytest.mark.parametrize("cache_class", [Cache, ArrayCache])
+def test_bbit_cache(b_bits, cache_class):
+    # with b bits, `rows` bits per band need about 8 rows per band to be as
+    # selective as a single full min hash
+    hasher = MinHasher(seeds=480, char_ngram=5, random_state=0,
+                       b_bits=b_bits)
+    lsh = cache_class(hasher, num_bands=480 // (8 // b_bits * 2))
+    lsh.add_doc(mc_long_doc, 0)
+    lsh.add_doc(mc_med_doc, 1)
+    lsh.add_doc('Some text about animals and plants.', 2)
+    lsh.add_doc(mc_long_doc + ' Word.', 3)
+    assert {0, 3} <= lsh.get_duplicates_of(mc_long_doc)
+    assert 2 not in lsh.get_duplicates_of(mc_long_doc, min_jaccard=0.5)
+    assert lsh.get_duplicates_of(mc_long_doc, min_jaccard=0.9) == {0, 3}
+    pairs = {frozenset(p) for p in lsh.get_all_duplicates(min_jaccard=0.8)}
+    assert pairs == {frozenset((0, 3))}
+    assert lsh.get_exact_duplicates_of(mc_long_doc) == {0}
+
+
 @pytest.mark.parametrize("num_bands", [3, 6, 7, 9, 71, 99, 101])
 def test_invalid_settings(num_bands, default_hasher, default_cache):
     with pytest.raises(AssertionError):
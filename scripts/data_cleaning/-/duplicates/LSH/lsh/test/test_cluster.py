@@ -0,0 +1,47 @@
+import pytest
+
+from lsh.cluster import DisjointSet, cluster_buckets
+
+
+def test_disjoint_set():
+    forest = DisjointSet()
+    for item in 'abcdef':
+        forest.add(item)
+    forest.union('a', 'b')
+    forest.union('c', 'd')
+    forest.union('d', 'b')
+    forest.union('e', 'e')
+    assert len(forest) == 6
+    assert forest.find('a') == forest.find('d')
+    assert forest.find('e') != forest.find('a')
+    assert list(forest.components()) == [['a', 'b', 'c', 'd']]
+    assert list(forest.components(min_size=1)) == \
+        [['a', 'b', 'c', 'd'], ['e'], ['f']]
+
+    with pytest.raises(KeyError):
+        forest.find('z')
+    forest.union('z', 'f')
+    assert 'z' in forest
+    assert list(forest.components()) == [['a', 'b', 'c', 'd'], ['f', 'z']]
+
+
+def test_long_chain():
+    forest = DisjointSet()
+    for i in range(10000):
+        forest.union(i, i + 1)
+    assert list(forest.components()) == [list(range(10001))]
+
+
+def test_cluster_buckets():
+    buckets = [[1, 2, 3], [3, 4], [5, 6], [7, 8, 9]]
+    assert list(cluster_buckets(buckets)) == [[1, 2, 3, 4], [5, 6], [7, 8, 9]]
+
+    def similarity(main_id, other_ids):
+        return [1. if abs(main_id - other) == 1 else 0. for other in other_ids]
+
+    assert list(cluster_buckets(buckets, similarity, threshold=0.5)) == \
+        [[1, 2], [3, 4], [5, 6], [7, 8]]
+    assert list(cluster_buckets([])) == []
+
+    with pytest.raises(ValueError):
+        cluster_buckets(buckets, similarity)
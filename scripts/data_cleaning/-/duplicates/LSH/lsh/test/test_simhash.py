@@ -0,0 +1,130 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from lsh.simhash import (SimHashIndex, block_masks, hamming_distance,
+                         simhash, simhash_batch)
+
+
+def random_signatures(num_docs, num_near, max_flips, random_state=0):
+    """Random signatures followed by copies with a few flipped bits."""
+    rng = np.random.RandomState(random_state)
+    signatures = rng.randint(0, 2 ** 63, num_docs, dtype=np.uint64) * \
+        np.uint64(2) + rng.randint(0, 2, num_docs).astype(np.uint64)
+    near = []
+    for i in rng.randint(0, num_docs, num_near):
+        signature = int(signatures[i])
+        for bit in rng.choice(64, rng.randint(0, max_flips + 1),
+                              replace=False):
+            signature ^= 1 << int(bit)
+        near.append(signature)
+    return np.concatenate([signatures, np.array(near, dtype=np.uint64)])
+
+
+def brute_force_pairs(signatures, max_distance):
+    return {(i, j) for i, j in itertools.combinations(range(len(signatures)),
+                                                      2)
+            if bin(int(signatures[i]) ^ int(signatures[j])).count('1') <=
+            max_distance}
+
+
+def test_hamming_distance():
+    signatures = random_signatures(50, 0, 0)
+    a, b = signatures[:25], signatures[25:]
+    expected = [bin(int(x) ^ int(y)).count('1') for x, y in zip(a, b)]
+    assert hamming_distance(a, b).tolist() == expected
+    assert hamming_distance(np.uint64(2 ** 64 - 1), np.uint64(0)) == 64
+
+
+@pytest.mark.parametrize("max_distance,num_blocks", [(0, 1), (3, 4), (3, 5),
+                                                     (4, 7)])
+def test_block_masks(max_distance, num_blocks):
+    masks = block_masks(max_distance, num_blocks)
+    assert len(masks) == len(list(itertools.combinations(
+        range(num_blocks), num_blocks - max_distance)))
+    full = 0
+    for mask in masks:
+        full |= int(mask)
+    assert full == 2 ** 64 - 1
+    with pytest.raises(ValueError):
+        block_masks(num_blocks, num_blocks)
+
+
+def test_simhash():
+    doc = ' '.join('word{}'.format(i % 300) for i in range(1000))
+    edited = doc.replace('word7 ', 'other ', 1)
+    unrelated = ' '.join('term{}'.format(i) for i in range(500))
+    assert simhash(doc) == simhash(doc.encode('utf8'))
+    assert simhash(doc) == simhash(doc.upper())
+    assert hamming_distance(simhash(doc), simhash(edited)) <= 3
+    assert hamming_distance(simhash(doc), simhash(unrelated)) > 10
+    assert simhash('') == 0
+    assert simhash_batch([doc, edited]).tolist() == [simhash(doc),
+                                                     simhash(edited)]
+    assert simhash(doc, ngram=2) != simhash(doc)
+
+
+@pytest.mark.parametrize("max_distance,num_blocks", [(0, 2), (2, 4), (3, 5),
+                                                     (3, 6)])
+def test_pairs(max_distance, num_blocks):
+    signatures = random_signatures(300, 100, max_distance + 2)
+    index = SimHashIndex(max_distance=max_distance, num_blocks=num_blocks,
+                         capacity=7)
+    index.add(signatures[:200], range(200))
+    index.add(signatures[200:], range(200, len(signatures)))
+    assert len(index) == len(signatures)
+
+    firsts, others, distances = index.pairs()
+    found = set(zip(firsts.tolist(), others.tolist()))
+    # identical signatures are only paired with the first of them, distinct
+    # signatures are compared through the first row of each signature
+    first_row = {}
+    for row, signature in enumerate(signatures.tolist()):
+        first_row.setdefault(signature, row)
+    is_first = [first_row[s] == row
+                for row, s in enumerate(signatures.tolist())]
+    expected = {(i, j) for i, j in brute_force_pairs(signatures, max_distance)
+                if is_first[i] and (is_first[j] or
+                                    signatures[i] == signatures[j])}
+    assert found == expected
+    assert np.all(distances == hamming_distance(signatures[firsts],
+                                                signatures[others]))
+
+    duplicates = list(index.iter_duplicates())
+    mains = [main for main, _ in duplicates]
+    assert mains == sorted(set(firsts.tolist()))
+    for main, near in duplicates:
+        assert all(other > main for other, _ in near)
+
+
+def test_query():
+    signatures = random_signatures(500, 200, 5, random_state=1)
+    index = SimHashIndex(max_distance=3)
+    index.add(signatures, ['doc{}'.format(i) for i in range(len(signatures))])
+    queries = signatures[::7]
+    results = index.query(queries)
+    assert len(results) == len(queries)
+    for query, result in zip(queries, results):
+        expected = {('doc{}'.format(i), bin(int(query) ^ int(s)).count('1'))
+                    for i, s in enumerate(signatures)
+                    if bin(int(query) ^ int(s)).count('1') <= 3}
+        assert set(result) == expected
+        assert [d for _, d in result] == sorted(d for _, d in result)
+    exact = index.query(queries, max_distance=0)
+    assert all(all(d == 0 for _, d in result) for result in exact)
+    with pytest.raises(ValueError):
+        index.query(queries, max_distance=4)
+    assert SimHashIndex().query([1, 2]) == [[], []]
+
+
+def test_add_doc():
+    index = SimHashIndex(max_distance=3)
+    doc = ' '.join('word{}'.format(i % 300) for i in range(1000))
+    index.add_doc(doc, 'a')
+    index.add_doc(doc.replace('word7 ', 'other ', 1), 'b')
+    index.add_doc(' '.join('term{}'.format(i) for i in range(500)), 'c')
+    duplicates = list(index.iter_duplicates())
+    assert len(duplicates) == 1
+    assert duplicates[0][0] == 'a'
+    assert [other for other, _ in duplicates[0][1]] == ['b']
@@ -0,0 +1,107 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from lsh.cluster import DisjointSet
+from lsh.minhash import MinHasher
+from lsh.tuning import (band_settings, bucket_comparisons,
+                        collision_probability, evaluate_setting,
+                        false_negative_rate, project_costs, recommend,
+                        s_curve_threshold, tune)
+
+
+def test_collision_probability():
+    assert collision_probability(1., 10, 10) == 1.
+    assert collision_probability(0., 10, 10) == 0.
+    # one band of one row collides with the probability of the similarity
+    assert collision_probability(0.3, 1, 1) == pytest.approx(0.3)
+    similarities = np.linspace(0, 1, 11)
+    assert np.all(np.diff(collision_probability(similarities, 20, 5)) >= 0)
+    assert false_negative_rate(0.5, 10, 10) == pytest.approx(
+        (1 - 0.5 ** 10) ** 10)
+    assert s_curve_threshold(10, 10) == pytest.approx(0.1 ** 0.1)
+
+
+@pytest.mark.parametrize("threshold,max_false_negative", [(0.5, 0.05),
+                                                          (0.8, 0.01)])
+def test_band_settings(threshold, max_false_negative):
+    settings = band_settings(threshold, max_false_negative, max_seeds=200)
+    assert len(settings) > 0
+    for num_bands, rows in settings:
+        assert num_bands * rows <= 200
+        assert false_negative_rate(threshold, num_bands,
+                                   rows) <= max_false_negative
+        if num_bands > 1:
+            # one band less is not enough
+            assert false_negative_rate(threshold, num_bands - 1,
+                                       rows) > max_false_negative
+
+
+def brute_force_comparisons(fingerprints, num_bands, rows):
+    pairs = set()
+    for band in range(num_bands):
+        columns = fingerprints[:, band * rows:(band + 1) * rows]
+        for i, j in itertools.combinations(range(len(fingerprints)), 2):
+            if np.array_equal(columns[i], columns[j]):
+                pairs.add((i, j))
+    return pairs
+
+
+def components(pairs):
+    groups = DisjointSet()
+    for i, j in pairs:
+        groups.union(i, j)
+    return sorted(sorted(c) for c in groups.components())
+
+
+def test_bucket_comparisons():
+    rng = np.random.RandomState(0)
+    fingerprints = rng.randint(0, 3, size=(40, 12)).astype(np.uint32)
+    for num_bands, rows in [(12, 1), (6, 2), (4, 3), (2, 6), (1, 12)]:
+        firsts, others, max_bucket = bucket_comparisons(fingerprints,
+                                                        num_bands, rows)
+        # every other member of a bucket is compared with its first member
+        found = {tuple(sorted(pair)) for pair in zip(firsts.tolist(),
+                                                     others.tolist())}
+        expected = brute_force_comparisons(fingerprints, num_bands, rows)
+        assert found <= expected
+        # the comparisons connect the same documents as all pairs
+        assert components(found) == components(expected)
+        assert max_bucket >= 1
+
+
+def test_evaluate_and_tune():
+    base = ' '.join('word{}'.format(i) for i in range(200))
+    docs = [base.replace('word{} '.format(i), 'other ') for i in range(20)]
+    rng = np.random.RandomState(1)
+    docs += [' '.join('w{}'.format(w) for w in rng.randint(0, 10000, 200))
+             for _ in range(80)]
+    hasher = MinHasher(seeds=100, char_ngram=5, hashbytes=4, random_state=0)
+    fingerprints = hasher.fingerprint_batch(docs)
+
+    stats = evaluate_setting(fingerprints, 10, 10, threshold=0.5)
+    assert stats['seeds'] == 100
+    # the near duplicates collide, the random documents do not
+    assert stats['comparisons'] >= 19
+    assert stats['similar_comparisons'] == stats['comparisons']
+    assert stats['max_bucket'] >= 2
+
+    projected = project_costs(stats, sample_size=100, num_docs=1000,
+                              seconds_per_seed=1e-6,
+                              seconds_per_comparison=1e-3)
+    assert projected['projected_comparisons'] == pytest.approx(
+        stats['comparisons'] * 10)
+    assert projected['total_seconds'] == pytest.approx(
+        1000 * 100 * 1e-6 + projected['projected_comparisons'] * 1e-3)
+
+    results, best = tune(fingerprints, 0.5, 0.05, num_docs=1000,
+                         seconds_per_seed=1e-6, seconds_per_comparison=1e-3,
+                         extra_settings=[(10, 10), (50, 50)])
+    assert best in results
+    assert best['false_negative_rate'] <= 0.05
+    assert (10, 10) in [(s['bands'], s['rows']) for s in results]
+    assert all(s['seeds'] <= 100 for s in results)
+    assert best == recommend(results, 0.05)
+    assert recommend(results, 0.)['false_negative_rate'] == min(
+        s['false_negative_rate'] for s in results)
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from lsh.verify import jaccard, jaccard_to_first, shingle_hashes
+
+
+def shingles(text, char_ngram=5):
+    return {text[i:i + char_ngram] for i in range(len(text) - char_ngram + 1)}
+
+
+def set_jaccard(a, b):
+    union = a | b
+    return len(a & b) / len(union) if union else 0.
+
+
+docs = ['Jang MC Min Chul is a Protoss player from South Korea.',
+        'Jang MC Min Chul is a Zerg player from South Korea.',
+        'Jang MC Min Chul is currently retired.',
+        u'Überall sind Router und Switches – überall.',
+        'abc',
+        '']
+
+
+@pytest.mark.parametrize("char_ngram", [1, 3, 5, 8])
+def test_shingle_hashes(char_ngram):
+    for doc in docs:
+        hashes = shingle_hashes(doc, char_ngram)
+        assert hashes.dtype == np.uint64
+        assert len(hashes) == len(shingles(doc, char_ngram))
+        assert np.all(np.diff(hashes) > 0)
+    np.testing.assert_array_equal(shingle_hashes(docs[3].encode('utf8')),
+                                  shingle_hashes(docs[3]))
+
+
+@pytest.mark.parametrize("char_ngram", [2, 5])
+def test_jaccard_matches_sets(char_ngram):
+    arrays = [shingle_hashes(doc, char_ngram) for doc in docs]
+    expected = [set_jaccard(shingles(docs[0], char_ngram),
+                            shingles(doc, char_ngram)) for doc in docs[1:]]
+    np.testing.assert_allclose(jaccard_to_first(arrays), expected)
+    assert jaccard(arrays[0], arrays[0]) == 1
+    assert jaccard(arrays[-1], arrays[-1]) == 0
+    assert len(jaccard_to_first(arrays[:1])) == 0
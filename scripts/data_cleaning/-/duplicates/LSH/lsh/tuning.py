@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""Choose the number of bands and rows of an LSH cache.
+
+Two documents with Jaccard similarity `s` share at least one of `b` bands of
+`r` min hashes with probability `1 - (1 - s^r)^b`, the S-curve of the
+setting. The curve fixes the false-negative rate at the similarity threshold,
+while the number of candidate comparisons, and the time spent verifying them,
+depends on the corpus and is measured on a fingerprinted sample.
+
+A fingerprint matrix computed with `max_seeds` seeds is evaluated for every
+setting with `b * r <= max_seeds` by using its first `b * r` columns. With
+`method='murmur'` they are the fingerprints of a `MinHasher` built from the
+first `b * r` seeds. With `method='universal'` the permutations are drawn
+from the whole seed array, so they are only distributed like the
+fingerprints of such a hasher, which is all the estimates depend on.
+"""
+from __future__ import division
+
+import numpy as np
+
+from lsh.cache import band_keys, estimate_jaccard
+
+
+def collision_probability(similarity, num_bands, rows):
+    """Probability that two documents share at least one band."""
+    return 1. - (1. - np.asarray(similarity, dtype=np.float64) ** rows) ** \
+        num_bands
+
+
+def false_negative_rate(threshold, num_bands, rows):
+    """Probability of missing a pair at the similarity threshold.
+
+    The S-curve is increasing, so this bounds the miss rate of every pair
+    that is at least as similar as `threshold`.
+    """
+    return 1. - collision_probability(threshold, num_bands, rows)
+
+
+def s_curve_threshold(num_bands, rows):
+    """Similarity at which the S-curve is steepest, about `(1/b)^(1/r)`."""
+    return (1. / num_bands) ** (1. / rows)
+
+
+def band_settings(threshold, max_false_negative, max_seeds, max_rows=None):
+    """List the `(num_bands, rows)` settings worth evaluating.
+
+    Adding bands only adds candidates, so for every number of rows only the
+    smallest number of bands whose false-negative rate at `threshold` is at
+    most `max_false_negative` is kept. Settings need at most `max_seeds`
+    seeds.
+    """
+    if max_rows is None:
+        max_rows = max_seeds
+    settings = []
+    for rows in range(1, max_rows + 1):
+        for num_bands in range(1, max_seeds // rows + 1):
+            if false_negative_rate(threshold, num_bands,
+                                   rows) <= max_false_negative:
+                settings.append((num_bands, rows))
+                break
+    return settings
+
+
+def bucket_comparisons(fingerprints, num_bands, rows):
+    """Find the comparisons made when verifying the buckets of a setting.
+
+    Like `find_duplicates.py`, the first document of every bucket is compared
+    with every other document of the bucket. Returns two arrays with the row
+    of the first and of the other document of every comparison and the size
+    of the largest bucket.
+    """
+    fingerprints = np.ascontiguousarray(fingerprints[:, :num_bands * rows])
+    keys = band_keys(fingerprints, num_bands)
+    firsts = []
+    others = []
+    max_bucket = 1 if len(keys) else 0
+    for band in range(num_bands):
+        order = np.argsort(keys[:, band], kind='stable')
+        sorted_keys = keys[order, band]
+        starts = np.ones(len(order), dtype=bool)
+        np.not_equal(sorted_keys[1:], sorted_keys[:-1], out=starts[1:])
+        run_ids = np.cumsum(starts) - 1
+        run_starts = np.flatnonzero(starts)
+        if len(run_starts):
+            max_bucket = max(max_bucket, int(
+                np.diff(np.append(run_starts, len(order))).max()))
+        members = ~starts
+        firsts.append(order[run_starts[run_ids[members]]])
+        others.append(order[members])
+    if not firsts:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), 0
+    return np.concatenate(firsts), np.concatenate(others), max_bucket
+
+
+def evaluate_setting(fingerprints, num_bands, rows, threshold):
+    """Measure the candidate comparisons of a setting on a sample.
+
+    `fingerprints` is the `(n_docs, max_seeds)` fingerprint matrix of the
+    sample, all of its columns are used to estimate the similarity of the
+    compared documents. Comparisons of documents below `threshold` are false
+    positives. Returns a dict of statistics of the setting.
+    """
+    firsts, others, max_bucket = bucket_comparisons(fingerprints, num_bands,
+                                                    rows)
+    similar = 0
+    if len(firsts):
+        jaccard = estimate_jaccard(fingerprints[firsts], fingerprints[others])
+        similar = int((jaccard >= threshold).sum())
+    return {'bands': num_bands,
+            'rows': rows,
+            'seeds': num_bands * rows,
+            's_curve_threshold': s_curve_threshold(num_bands, rows),
+            'false_negative_rate': false_negative_rate(threshold, num_bands,
+                                                       rows),
+            'comparisons': len(firsts),
+            'similar_comparisons': similar,
+            'max_bucket': max_bucket}
+
+
+def project_costs(stats, sample_size, num_docs, seconds_per_seed=0.,
+                  seconds_per_comparison=0.):
+    """Extrapolate the statistics of a sample to a corpus of `num_docs`.
+
+    A document has about as many near duplicates in the corpus as in the
+    sample, so comparisons of similar documents are scaled linearly. False
+    positives are chance collisions and are scaled by the ratio of the
+    number of document pairs. The cost is the time to fingerprint every
+    document plus the time to verify every comparison, `seconds_per_seed` is
+    the fingerprinting time of one document per seed. Adds the projections
+    to a copy of `stats`.
+    """
+    stats = dict(stats)
+    scale = num_docs / max(sample_size, 1)
+    pair_scale = num_docs * (num_docs - 1) / max(
+        sample_size * (sample_size - 1), 1)
+    false_positives = stats['comparisons'] - stats['similar_comparisons']
+    comparisons = stats['similar_comparisons'] * scale + \
+        false_positives * pair_scale
+    stats['projected_comparisons'] = comparisons
+    stats['fingerprint_seconds'] = num_docs * stats['seeds'] * \
+        seconds_per_seed
+    stats['verify_seconds'] = comparisons * seconds_per_comparison
+    stats['total_seconds'] = stats['fingerprint_seconds'] + \
+        stats['verify_seconds']
+    return stats
+
+
+def recommend(settings_stats, max_false_negative):
+    """Pick the cheapest setting whose false-negative rate is acceptable.
+
+    `settings_stats` are dicts returned by `project_costs`. Ties are broken
+    by the number of seeds. If no setting is acceptable the one with the
+    lowest false-negative rate is returned.
+    """
+    acceptable = [s for s in settings_stats
+                  if s['false_negative_rate'] <= max_false_negative]
+    if not acceptable:
+        return min(settings_stats, key=lambda s: s['false_negative_rate'])
+    return min(acceptable, key=lambda s: (s['total_seconds'], s['seeds']))
+
+
+def tune(fingerprints, threshold, max_false_negative, num_docs=None,
+         seconds_per_seed=0., seconds_per_comparison=0., max_rows=None,
+         extra_settings=()):
+    """Evaluate the settings of `band_settings` on a fingerprinted sample.
+
+    `fingerprints` is the fingerprint matrix of the sample, its number of
+    columns bounds the number of seeds. `extra_settings` are further
+    `(num_bands, rows)` settings to report, e.g. the one currently in use,
+    settings needing more seeds than the sample has are ignored.
+    Returns the list of projected statistics, sorted by total cost, and the
+    recommended one.
+    """
+    sample_size, max_seeds = fingerprints.shape
+    if num_docs is None:
+        num_docs = sample_size
+    settings = band_settings(threshold, max_false_negative, max_seeds,
+                             max_rows=max_rows)
+    settings += [(num_bands, rows) for num_bands, rows in extra_settings
+                 if num_bands * rows <= max_seeds and
+                 (num_bands, rows) not in settings]
+    results = [project_costs(evaluate_setting(fingerprints, num_bands, rows,
+                                              threshold),
+                             sample_size, num_docs,
+                             seconds_per_seed=seconds_per_seed,
+                             seconds_per_comparison=seconds_per_comparison)
+               for num_bands, rows in settings]
+    results.sort(key=lambda s: (s['total_seconds'], s['seeds']))
+    return results, recommend(results, max_false_negative)
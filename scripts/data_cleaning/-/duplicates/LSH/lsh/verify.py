@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Exact shingle Jaccard verification of LSH candidates.
+
+Documents are turned into sorted arrays of 64bit shingle hashes once, the
+Jaccard similarity of a document with many others is then computed with a
+single vectorised set intersection instead of one python `set` operation per
+pair.
+"""
+from __future__ import division
+
+import numpy as np
+
+# odd multiplier of the polynomial rolling hash over the shingle characters
+SHINGLE_BASE = np.uint64(0x9E3779B97F4A7C15)
+
+
+def shingle_hashes(text, char_ngram=5):
+    """Return the sorted unique 64bit hashes of the character shingles of text.
+
+    A shingle is a sequence of `char_ngram` consecutive characters, the
+    shingles are taken over a sliding window.
+    """
+    if isinstance(text, bytes):
+        text = text.decode('utf8')
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+    num_shingles = len(codes) - char_ngram + 1
+    if num_shingles <= 0:
+        return np.empty(0, dtype=np.uint64)
+    codes = codes.astype(np.uint64)
+    hashes = np.zeros(num_shingles, dtype=np.uint64)
+    for k in range(char_ngram):
+        hashes *= SHINGLE_BASE
+        hashes += codes[k:k + num_shingles]
+    hashes.sort()
+    unique = np.empty(num_shingles, dtype=bool)
+    unique[0] = True
+    np.not_equal(hashes[1:], hashes[:-1], out=unique[1:])
+    return hashes[unique]
+
+
+def jaccard_to_first(hash_arrays):
+    """Jaccard similarity of the first hash array with every other one.
+
+    `hash_arrays` is a list of arrays returned by `shingle_hashes`. Returns an
+    array of `len(hash_arrays) - 1` similarities, pairs of empty documents
+    have a similarity of 0.
+    """
+    main, others = hash_arrays[0], hash_arrays[1:]
+    if len(others) == 0:
+        return np.empty(0, dtype=np.float64)
+    lengths = np.array([len(other) for other in others])
+    hashes = np.concatenate(others)
+    if len(main) == 0:
+        hits = np.zeros(len(hashes), dtype=bool)
+    else:
+        # main is sorted, a binary search finds each hash or its successor
+        positions = np.searchsorted(main, hashes)
+        positions[positions == len(main)] = 0
+        hits = main[positions] == hashes
+    segments = np.repeat(np.arange(len(others)), lengths)
+    intersection = np.bincount(segments, weights=hits,
+                               minlength=len(others))
+    union = len(main) + lengths - intersection
+    return np.divide(intersection, union, out=np.zeros(len(others)),
+                     where=union > 0)
+
+
+def jaccard(hashes_a, hashes_b):
+    """Jaccard similarity of two arrays returned by `shingle_hashes`."""
+    return jaccard_to_first([hashes_a, hashes_b])[0]
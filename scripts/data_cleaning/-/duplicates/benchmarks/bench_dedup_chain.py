@@ -0,0 +1,230 @@
+# coding=utf-8
+# Copyright (c) 2019, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Run the dedup chain on a corpus from make_corpus.py and score every stage.
+
+Usage:
+    python benchmarks/bench_dedup_chain.py <corpus file> <work dir>
+        [--engine minhash] [--workers 1] [--find_args "--exact"]
+
+The stages find_duplicates.py (or find_duplicates_simhash.py with `--engine
+simhash`), group_duplicates_url.py and remove_group_duplicates.py are run
+as separate processes on the corpus. For each stage the wall time, the
+documents per second and the peak RSS of the process are reported, for the
+first stage also the number of verified candidate pairs and reported pairs.
+
+The quality of a stage is measured against the `dup_of` ground truth of the
+corpus. The pairs of the first stage and the groups of the second stage are
+turned into clusters with a union-find and scored by pair counting:
+precision is the fraction of the document pairs put in one cluster that are
+true near duplicates, recall is the fraction of true near duplicate pairs
+put in one cluster. For the last stage precision is the fraction of removed
+documents that have a kept copy, recall the fraction of the documents that
+should have been removed that were removed.
+"""
+
+import argparse
+from collections import Counter, defaultdict
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+import time
+
+from lsh.cluster import DisjointSet
+
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIND_SCRIPTS = {'minhash': 'find_duplicates.py',
+                'simhash': 'find_duplicates_simhash.py'}
+CANDIDATES_REGEX = re.compile(r'verified (\d+) candidate pairs')
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('corpus', type=str)
+    parser.add_argument('workdir', type=str)
+    parser.add_argument('--engine', choices=sorted(FIND_SCRIPTS),
+                        default='minhash')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--find_args', type=str, default='',
+                        help='Extra arguments of the first stage, with '
+                             '`--grouped` the grouping stage is skipped.')
+    return parser.parse_args()
+
+
+def run_stage(script, arguments):
+    """Run a script of the chain, return its output, wall time and peak RSS.
+
+    `os.wait4` reports the resource usage of this child alone, unlike
+    `RUSAGE_CHILDREN` which is the maximum over all waited children.
+    """
+    command = [sys.executable, os.path.join(SCRIPTS_DIR, script)] + arguments
+    print('$ ' + ' '.join(shlex.quote(part) for part in command), flush=True)
+    start_time = time.time()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT)
+    output = process.stdout.read().decode('utf-8', 'replace')
+    _, status, usage = os.wait4(process.pid, 0)
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    elapsed = time.time() - start_time
+    if process.returncode != 0:
+        print(output)
+        raise SystemExit('{} failed with exit code {}'.format(
+            script, process.returncode))
+    # ru_maxrss is reported in kilobytes on linux
+    return output, elapsed, usage.ru_maxrss / 1024
+
+
+def read_truth(corpus):
+    """Return the number of documents and the true cluster of every document
+    that has near duplicates, as a dict from url to the url of the original."""
+    num_docs = 0
+    cluster = dict()
+    with open(corpus, 'rb') as f:
+        for line in f:
+            myjson = json.loads(line)
+            num_docs += 1
+            if myjson.get('dup_of') is not None:
+                cluster[myjson['url']] = myjson['dup_of']
+                cluster[myjson['dup_of']] = myjson['dup_of']
+    return num_docs, cluster
+
+
+def num_pairs(sizes):
+    return sum(size * (size - 1) // 2 for size in sizes)
+
+
+def score_clusters(clusters, truth):
+    """Pair counting precision and recall of predicted clusters of urls."""
+    predicted_pairs = 0
+    true_positives = 0
+    for urls in clusters:
+        predicted_pairs += num_pairs([len(urls)])
+        true_positives += num_pairs(Counter(truth[url] for url in urls
+                                            if url in truth).values())
+    true_pairs = num_pairs(Counter(truth.values()).values())
+    precision = true_positives / predicted_pairs if predicted_pairs else 1.
+    recall = true_positives / true_pairs if true_pairs else 1.
+    return precision, recall
+
+
+def pairs_clusters(filename):
+    """Clusters linking the urls of every line of find_duplicates.py output,
+    and the number of reported pairs."""
+    groups = DisjointSet()
+    reported = 0
+    with open(filename, 'r') as f:
+        for line in f:
+            for main_url, others in json.loads(line).items():
+                for other in others:
+                    for other_url in other:
+                        groups.union(main_url, other_url)
+                        reported += 1
+    return list(groups.components()), reported
+
+
+def group_clusters(filename):
+    with open(filename, 'r') as f:
+        return [urls for line in f for urls in json.loads(line).values()]
+
+
+def score_removal(output, num_docs, truth):
+    """Precision and recall of the documents removed from the corpus."""
+    kept = set()
+    num_kept = 0
+    with open(output, 'rb') as f:
+        for line in f:
+            num_kept += 1
+            url = json.loads(line)['url']
+            if url in truth:
+                kept.add(url)
+    clusters = defaultdict(list)
+    for url, original in truth.items():
+        clusters[original].append(url)
+    # a cluster should keep one document, a removed document is correct if
+    # another document of its cluster was kept
+    should_remove = sum(len(urls) - 1 for urls in clusters.values())
+    correct = sum(sum(url not in kept for url in urls) -
+                  (not any(url in kept for url in urls))
+                  for urls in clusters.values())
+    removed = num_docs - num_kept
+    precision = correct / removed if removed else 1.
+    recall = correct / should_remove if should_remove else 1.
+    return precision, recall
+
+
+def report(name, num_docs, elapsed, peak_rss, precision, recall, extra=''):
+    print('{:24s} | {:8.1f} s | {:10.1f} docs/s | peak RSS {:8.1f} MB | '
+          'precision {:.4f} | recall {:.4f}{}'.format(
+              name, elapsed, num_docs / max(elapsed, 1e-9), peak_rss,
+              precision, recall, extra), flush=True)
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    if not os.path.isdir(args.workdir):
+        os.makedirs(args.workdir)
+    pairs_file = os.path.join(args.workdir, 'possible_duplicate_urls.json')
+    groups_file = os.path.join(args.workdir, 'similar_urls.json')
+    output_file = os.path.join(args.workdir, 'deduped.json')
+    find_args = shlex.split(args.find_args)
+    grouped = '--grouped' in find_args
+
+    num_docs, truth = read_truth(args.corpus)
+    print('> {} documents, {} in near duplicate clusters'.format(
+        num_docs, len(truth)), flush=True)
+
+    results = []
+    script = FIND_SCRIPTS[args.engine]
+    output, elapsed, peak_rss = run_stage(
+        script, [args.corpus, groups_file if grouped else pairs_file,
+                 '--workers', str(args.workers)] + find_args)
+    if grouped:
+        clusters = group_clusters(groups_file)
+        extra = ''
+    else:
+        clusters, reported = pairs_clusters(pairs_file)
+        extra = ' | {} pairs'.format(reported)
+    candidates = CANDIDATES_REGEX.search(output)
+    if candidates is not None:
+        extra = ' | {} candidates'.format(candidates.group(1)) + extra
+    results.append((script, elapsed, peak_rss) +
+                   score_clusters(clusters, truth) + (extra, ))
+
+    if not grouped:
+        output, elapsed, peak_rss = run_stage(
+            'group_duplicates_url.py', [pairs_file, groups_file])
+        results.append(('group_duplicates_url.py', elapsed, peak_rss) +
+                        score_clusters(group_clusters(groups_file), truth) +
+                        ('', ))
+
+    output, elapsed, peak_rss = run_stage(
+        'remove_group_duplicates.py', [groups_file, args.corpus, output_file,
+                                       '--workers', str(args.workers)])
+    results.append(('remove_group_duplicates.py', elapsed, peak_rss) +
+                   score_removal(output_file, num_docs, truth) + ('', ))
+
+    print('> {} documents, engine {}, {} workers {}'.format(
+        num_docs, args.engine, args.workers, ' '.join(find_args)))
+    for name, elapsed, peak_rss, precision, recall, extra in results:
+        report(name, num_docs, elapsed, peak_rss, precision, recall, extra)
+    total = sum(result[1] for result in results)
+    print('{:24s} | {:8.1f} s | {:10.1f} docs/s'.format(
+        'total', total, num_docs / max(total, 1e-9)))
@@ -0,0 +1,137 @@
+# coding=utf-8
+# Copyright (c) 2019, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Generate a synthetic loose json corpus with known near duplicates.
+
+Usage:
+    python benchmarks/make_corpus.py <output file> [--num_docs 10000]
+        [--duplicate_rate 0.2] [--max_edit_rate 0.1]
+
+Every line is `{"url": ..., "text": ..., "dup_of": ...}`. Original documents
+are sequences of words drawn from a Zipf distributed vocabulary and have
+`dup_of` null. A fraction `--duplicate_rate` of the documents are copies of
+a recent original with a random fraction of up to `--max_edit_rate` of their
+words substituted, deleted or inserted, `dup_of` is the url of the original.
+The dedup scripts ignore the extra field and remove_group_duplicates.py
+copies it, so the ground truth travels with the data.
+
+Only the last `--window` originals are kept to be copied, which bounds the
+memory for corpora of millions of documents.
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('output', type=str)
+    parser.add_argument('--num_docs', type=int, default=10000)
+    parser.add_argument('--duplicate_rate', type=float, default=0.2)
+    parser.add_argument('--max_edit_rate', type=float, default=0.1)
+    parser.add_argument('--doc_words', type=int, default=400,
+                        help='Median number of words of a document.')
+    parser.add_argument('--vocab_size', type=int, default=50000)
+    parser.add_argument('--window', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+def make_vocabulary(vocab_size, rng):
+    """Random lower case words of 2 to 10 letters with Zipf frequencies."""
+    letters = np.array(list('abcdefghijklmnopqrstuvwxyz'))
+    lengths = rng.randint(2, 11, vocab_size)
+    words = np.array([''.join(rng.choice(letters, length))
+                      for length in lengths], dtype=object)
+    weights = 1. / np.arange(1, vocab_size + 1)
+    return words, np.cumsum(weights / weights.sum())
+
+
+class CorpusGenerator(object):
+
+    def __init__(self, doc_words=400, vocab_size=50000, max_edit_rate=0.1,
+                 window=10000, seed=0):
+        self.rng = np.random.RandomState(seed)
+        self.words, self.cumulative = make_vocabulary(vocab_size, self.rng)
+        self.doc_words = doc_words
+        self.max_edit_rate = max_edit_rate
+        self.window = window
+        self.originals = []
+
+    def sample_words(self, num_words):
+        return self.words[np.searchsorted(self.cumulative,
+                                          self.rng.random_sample(num_words))]
+
+    def original(self, url):
+        num_words = max(16, int(self.rng.lognormal(np.log(self.doc_words),
+                                                   0.5)))
+        words = self.sample_words(num_words)
+        if len(self.originals) < self.window:
+            self.originals.append((url, words))
+        else:
+            self.originals[self.rng.randint(self.window)] = (url, words)
+        return words
+
+    def near_duplicate(self):
+        """Return the url of a random original and an edited copy of it."""
+        url, words = self.originals[self.rng.randint(len(self.originals))]
+        num_edits = self.rng.randint(0, int(self.max_edit_rate *
+                                            len(words)) + 1)
+        words = list(words)
+        for kind, position in zip(self.rng.randint(0, 3, num_edits),
+                                  self.rng.random_sample(num_edits)):
+            position = int(position * len(words))
+            if kind == 0 and position < len(words):
+                words[position] = self.sample_words(1)[0]
+            elif kind == 1 and position < len(words) and len(words) > 1:
+                del words[position]
+            else:
+                words.insert(position, self.sample_words(1)[0])
+        return url, words
+
+    def documents(self, num_docs, duplicate_rate):
+        """Yield `(url, text, dup_of)` for `num_docs` documents."""
+        for i in range(num_docs):
+            url = 'https://synthetic.example/doc/{}'.format(i)
+            if self.originals and self.rng.random_sample() < duplicate_rate:
+                dup_of, words = self.near_duplicate()
+            else:
+                dup_of, words = None, self.original(url)
+            yield url, ' '.join(words), dup_of
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    generator = CorpusGenerator(doc_words=args.doc_words,
+                                vocab_size=args.vocab_size,
+                                max_edit_rate=args.max_edit_rate,
+                                window=args.window, seed=args.seed)
+    start_time = time.time()
+    num_duplicates = 0
+    with open(args.output, 'wb') as f:
+        for i, (url, text, dup_of) in enumerate(
+                generator.documents(args.num_docs, args.duplicate_rate), 1):
+            num_duplicates += dup_of is not None
+            myjson = json.dumps({'url': url, 'text': text, 'dup_of': dup_of},
+                                ensure_ascii=False)
+            f.write(myjson.encode('utf-8'))
+            f.write('\n'.encode('utf-8'))
+            if i % 100000 == 0:
+                print('> {} documents in {:.2f} seconds'.format(
+                    i, time.time() - start_time), flush=True)
+    print('> wrote {} documents, {} near duplicates, in {:.2f} seconds'.format(
+        args.num_docs, num_duplicates, time.time() - start_time))
@@ -14,11 +14,54 @@
 # limitations under the License.
 
 
+import argparse
+from functools import lru_cache
 import glob
+import hashlib
+import heapq
+from multiprocessing import Pool
+import os
 import re
+import tempfile
 import time
 import tldextract
-import sys
+
+
+# Number of hosts whose registered domain is kept by `host_domain`.
+DOMAIN_CACHE_SIZE = 2**18
+# Approximate memory of a buffered `(hash, url)` line besides the url itself.
+RUN_ENTRY_OVERHEAD = 100
+# Maximum number of sorted runs merged at once by `merge_runs`.
+MAX_OPEN_RUNS = 256
+
+
+def parse_arguments():
+    """
+    Parser.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', type=str,
+                        help='Directory of the `.txt` url files.')
+    parser.add_argument('output', type=str,
+                        help='Output file of the cleaned up urls.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes filtering the url files, '
+                             'the counters and urls of every file are '
+                             'merged at the end.')
+    parser.add_argument('--quiet', action='store_true',
+                        help='Do not print every rejected url.')
+    parser.add_argument('--external', action='store_true',
+                        help='Deduplicate out of core: the kept urls of '
+                             'every file are written to sorted runs of '
+                             '`(url hash, url)` and merged into the output, '
+                             'instead of held in one set.')
+    parser.add_argument('--memory_budget', type=int, default=1024,
+                        help='With `--external`, memory in MB shared by the '
+                             'workers for the buffered urls of the runs.')
+    parser.add_argument('--tmp_dir', type=str, default=None,
+                        help='With `--external`, directory of the sorted '
+                             'runs, by default next to the output file.')
+    return parser.parse_args()
 
 
 # List of the domains to blacklist.
@@ -135,9 +178,11 @@ domain_blacklist = set([
     'zillexplorer',
 ])
 
-def domain_is_in_blacklist(url):
-    domain = tldextract.extract(url).domain
-    return domain in domain_blacklist
+
+@lru_cache(maxsize=DOMAIN_CACHE_SIZE)
+def host_domain(host):
+    """Registered domain of a host, most urls of a crawl share few hosts."""
+    return tldextract.extract(host).domain
 
 
 # List of extentions to blacklist.
@@ -211,6 +256,7 @@ extentions_blacklist = (
     '.zip',
 )
 
+
 def extention_is_in_blacklist(url):
     if url.split('?')[0].lower().endswith(extentions_blacklist):
         return True
@@ -220,14 +266,168 @@ def extention_is_in_blacklist(url):
 # Malformed urls.
 # This function is adapted from:
 #   https://stackoverflow.com/questions/7160737/python-how-to-validate-a-url-in-python-malformed-or-not
+# The host is captured so that a single match both validates the url and
+# gives the key of the `host_domain` cache.
 url_regex = re.compile(
-    r'^(?:http)s?://' # http:// or https://
-    r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|' #domain...
-    r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})' # ...or ip
-    r'(?::\d+)?' # optional port
+    r'^(?:http)s?://'  # http:// or https://
+    # domain...
+    r'(?P<host>(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+'
+    r'(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|'
+    r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # ...or ip
+    r'(?::\d+)?'  # optional port
     r'(?:/?|[/?]\S+)$', re.IGNORECASE)
-def url_is_malformed(url):
-    return re.match(url_regex, url) is None
+
+
+# Reasons of rejection, in the order in which they are checked.
+DOMAIN, EXTENTION, SHORT, MALFORMED, DUPLICATE = range(5)
+REJECTION_LABELS = ['DOMAIN BLACKLIST', 'EXTENTION BLACKLIST', 'SHORT URL',
+                    'MALFORMED URL', 'DUPLICATE URL']
+
+
+def rejection_reason(url, match_url=url_regex.match):
+    """Return the reason to reject a url, or None to keep it.
+
+    The url regex is matched once, it both validates the url and gives the
+    host whose registered domain is looked up in the domain cache. Only
+    malformed urls are passed to tldextract as a whole.
+    """
+    match = match_url(url)
+    if match is not None:
+        domain = host_domain(match.group('host'))
+    else:
+        domain = tldextract.extract(url).domain
+    if domain in domain_blacklist:
+        return DOMAIN
+    if extention_is_in_blacklist(url):
+        return EXTENTION
+    if len(url) <= 8:
+        return SHORT
+    if match is None:
+        return MALFORMED
+    return None
+
+
+def filter_file(task):
+    """Return the set of kept urls of a file and its rejection counters.
+
+    Runs in worker processes with `--workers`, duplicates are only counted
+    within the file here and across files when the sets are merged.
+    """
+    filename, quiet = task
+    urls = set()
+    counters = [0] * len(REJECTION_LABELS)
+    with open(filename, 'r') as f:
+        for line in f:
+            url = line.strip()
+            reason = rejection_reason(url)
+            if reason is None and url in urls:
+                reason = DUPLICATE
+            if reason is None:
+                urls.add(url)
+                continue
+            counters[reason] += 1
+            if not quiet:
+                print('[{}]: {}'.format(REJECTION_LABELS[reason], url),
+                      flush=True)
+    return urls, counters
+
+
+def run_line(url):
+    """A line of a sorted run, ordered by the 64bit hash of the url.
+
+    The hash is written as fixed width hex, so sorting and merging the lines
+    as strings sorts them by hash and then by url.
+    """
+    digest = hashlib.blake2b(url.encode('utf-8'), digest_size=8).hexdigest()
+    return digest + '\t' + url + '\n'
+
+
+def write_run(lines, tmp_dir):
+    lines.sort()
+    fd, run_filename = tempfile.mkstemp(prefix='urls_', suffix='.run',
+                                        dir=tmp_dir)
+    with os.fdopen(fd, 'w') as f:
+        f.writelines(lines)
+    return run_filename
+
+
+def sort_file_runs(task):
+    """Write the kept urls of a file to sorted runs of at most `budget` bytes.
+
+    Returns the run filenames, the number of urls written and the rejection
+    counters of the file. Duplicates are only found by `merge_runs`.
+    """
+    filename, quiet, budget, tmp_dir = task
+    runs = []
+    lines = []
+    buffered = 0
+    num_urls = 0
+    counters = [0] * len(REJECTION_LABELS)
+    with open(filename, 'r') as f:
+        for line in f:
+            url = line.strip()
+            reason = rejection_reason(url)
+            if reason is not None:
+                counters[reason] += 1
+                if not quiet:
+                    print('[{}]: {}'.format(REJECTION_LABELS[reason], url),
+                          flush=True)
+                continue
+            lines.append(run_line(url))
+            num_urls += 1
+            buffered += len(url) + RUN_ENTRY_OVERHEAD
+            if buffered >= budget:
+                runs.append(write_run(lines, tmp_dir))
+                lines = []
+                buffered = 0
+    if lines:
+        runs.append(write_run(lines, tmp_dir))
+    return runs, num_urls, counters
+
+
+def merge_runs(runs, output, quiet=True):
+    """K-way merge sorted runs into `output` without repeated lines.
+
+    With more than `MAX_OPEN_RUNS` runs, groups of runs are first merged
+    into larger runs. Runs are removed once merged. Returns the number of
+    duplicates dropped.
+    """
+    duplicates = 0
+    while len(runs) > MAX_OPEN_RUNS:
+        merged = []
+        for i in range(0, len(runs), MAX_OPEN_RUNS):
+            fd, run_filename = tempfile.mkstemp(
+                prefix='urls_', suffix='.run',
+                dir=os.path.dirname(runs[i]))
+            os.close(fd)
+            duplicates += _merge(runs[i:i + MAX_OPEN_RUNS], run_filename,
+                                 strip_hash=False, quiet=quiet)
+            merged.append(run_filename)
+        runs = merged
+    return duplicates + _merge(runs, output, strip_hash=True, quiet=quiet)
+
+
+def _merge(runs, output, strip_hash, quiet):
+    duplicates = 0
+    files = [open(run, 'r') for run in runs]
+    try:
+        with open(output, 'w') as f:
+            previous = None
+            for line in heapq.merge(*files):
+                if line == previous:
+                    duplicates += 1
+                    if not quiet:
+                        print('[DUPLICATE URL]: {}'.format(line[17:-1]),
+                              flush=True)
+                    continue
+                previous = line
+                f.write(line[17:] if strip_hash else line)
+    finally:
+        for run_file in files:
+            run_file.close()
+    for run in runs:
+        os.remove(run)
+    return duplicates
 
 
 def print_progress(prefix, start_time, urls_counter,
@@ -246,67 +446,98 @@ def print_progress(prefix, start_time, urls_counter,
     print(string, flush=True)
 
 
+def filter_urls(files, quiet=True, workers=1):
+    """Filter the url files and deduplicate the kept urls in one set.
+
+    Returns the set of kept urls, the number of urls read and the rejection
+    counters.
+    """
+    urls = set()
+    urls_counter = 0
+    counters = [0] * len(REJECTION_LABELS)
+    start_time = time.time()
+    pool = Pool(workers) if workers > 1 else None
+    imap = pool.imap_unordered if pool is not None else map
+    tasks = [(filename, quiet) for filename in files]
+    for file_urls, file_counters in imap(filter_file, tasks):
+        urls_counter += len(file_urls) + sum(file_counters)
+        for reason, count in enumerate(file_counters):
+            counters[reason] += count
+        for url in file_urls:
+            if url in urls:
+                if not quiet:
+                    print('[DUPLICATE URL]: {}'.format(url), flush=True)
+                counters[DUPLICATE] += 1
+            else:
+                urls.add(url)
+        print_progress('PROGRESS', start_time, urls_counter, *counters)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    return urls, urls_counter, counters
+
+
+def filter_urls_external(files, output, quiet=True, workers=1,
+                         memory_budget=1024, tmp_dir=None):
+    """Filter the url files and deduplicate the kept urls out of core.
+
+    The kept urls of every file are written to sorted runs of at most
+    `memory_budget` MB shared by the workers, and merged into `output`.
+    Returns the number of urls read and the rejection counters.
+    """
+    tmp_dir = tmp_dir or os.path.dirname(os.path.abspath(output))
+    budget = memory_budget * 1024 * 1024 // max(1, workers)
+    runs = []
+    urls_counter = 0
+    counters = [0] * len(REJECTION_LABELS)
+    start_time = time.time()
+    pool = Pool(workers) if workers > 1 else None
+    imap = pool.imap_unordered if pool is not None else map
+    tasks = [(filename, quiet, budget, tmp_dir) for filename in files]
+    for file_runs, num_urls, file_counters in imap(sort_file_runs, tasks):
+        runs.extend(file_runs)
+        urls_counter += num_urls + sum(file_counters)
+        for reason, count in enumerate(file_counters):
+            counters[reason] += count
+        print_progress('PROGRESS', start_time, urls_counter, *counters)
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    # The sorted runs are the final set of urls.
+    print('> merging {} sorted runs into {}'.format(len(runs), output))
+    counters[DUPLICATE] += merge_runs(runs, output, quiet)
+    return urls_counter, counters
+
+
 if __name__ == '__main__':
 
+    args = parse_arguments()
 
     print('remove blacklisted urls ..')
 
-    # Path to the url files.
-    path = sys.argv[1]
-    # Output url file.
-    output = sys.argv[2]
-
     # Get the list of url files.
-    files = glob.glob(path + '/*.txt')
+    files = glob.glob(args.path + '/*.txt')
     print('> found {} files'.format(len(files)))
 
-    urls = set()
-    urls_counter = 0
-    domain_blacklist_counter = 0
-    extention_blacklist_counter = 0
-    short_url_counter = 0
-    malformed_url_counter = 0
-    duplicate_url_counter = 0
+    # Load the public suffix list once, before the workers are forked.
+    host_domain('example.com')
+
     start_time = time.time()
-    for filename in files:
-        with open(filename, 'r') as f:
-            for line in f:
-                url = line.strip()
-                urls_counter += 1
-                if domain_is_in_blacklist(url):
-                    print('[DOMAIN BLACKLIST]: {}'.format(url), flush=True)
-                    domain_blacklist_counter += 1
-                elif extention_is_in_blacklist(url):
-                    print('[EXTENTION BLACKLIST]: {}'.format(url), flush=True)
-                    extention_blacklist_counter += 1
-                elif len(url) <= 8:
-                    print('[SHORT URL]: {}'.format(url), flush=True)
-                    short_url_counter += 1
-                elif url_is_malformed(url):
-                    print('[MALFORMED URL]: {}'.format(url), flush=True)
-                    malformed_url_counter += 1
-                elif url in urls:
-                    print('[DUPLICATE URL]: {}'.format(url), flush=True)
-                    duplicate_url_counter += 1
-                else:
-                    urls.add(url)
-                if urls_counter % 100000 == 0:
-                    print_progress('PROGRESS', start_time, urls_counter,
-                                   domain_blacklist_counter,
-                                   extention_blacklist_counter,
-                                   short_url_counter, malformed_url_counter,
-                                   duplicate_url_counter)
-
-    print_progress('FINAL', start_time, urls_counter,
-                   domain_blacklist_counter,
-                   extention_blacklist_counter,
-                   short_url_counter, malformed_url_counter,
-                   duplicate_url_counter)
+    if args.external:
+        urls_counter, counters = filter_urls_external(
+            files, args.output, args.quiet, args.workers, args.memory_budget,
+            args.tmp_dir)
+        print_progress('FINAL', start_time, urls_counter, *counters)
+    else:
+        urls, urls_counter, counters = filter_urls(files, args.quiet,
+                                                   args.workers)
+        print_progress('FINAL', start_time, urls_counter, *counters)
 
-    # Write the final set of urls.
-    print('> writing cleaned up url list to {}'.format(output))
-    with open(output, 'w') as f:
-        for url in urls:
-            f.write(url + '\n')
+        # Write the final set of urls.
+        print('> writing cleaned up url list to {}'.format(args.output))
+        with open(args.output, 'w') as f:
+            for url in urls:
+                f.write(url + '\n')
 
     print('done :-)')
@@ -0,0 +1,130 @@
+# coding=utf-8
+# Copyright (c) 2019, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Find documents that are identical after whitespace normalization.
+
+Exact duplicates are detected with a 128bit hash of the normalized text, so
+they can be removed before shingling and MinHashing. The groups are written in
+the output format of group_duplicates_url.py and can be passed directly to
+remove_group_duplicates.py.
+"""
+
+import argparse
+from collections import defaultdict
+import hashlib
+import json
+import time
+import unicodedata
+
+
+def normalize_text(text):
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def content_hash(text):
+    """128bit hash of the normalized text."""
+    return hashlib.blake2b(normalize_text(text).encode('utf-8'),
+                           digest_size=16).digest()
+
+
+class ExactDeduplicator(object):
+    """Remember the first url of every content hash and group the repeats."""
+
+    def __init__(self):
+        self.first_url = dict()
+        self.duplicates = defaultdict(list)
+        self.num_docs = 0
+        self.num_duplicates = 0
+        self.duplicate_chars = 0
+
+    def add(self, url, text):
+        """Return the url of the first copy if the document was seen before,
+        None otherwise."""
+        return self.add_digest(url, content_hash(text), len(text))
+
+    def add_digest(self, url, digest, num_chars):
+        """Same as `add` for a document whose content hash is known."""
+        self.num_docs += 1
+        if digest not in self.first_url:
+            self.first_url[digest] = url
+            return None
+        main_url = self.first_url[digest]
+        # a copy crawled again under the same url is dropped but cannot be
+        # told apart from the first copy in the url groups
+        if url != main_url:
+            self.duplicates[main_url].append(url)
+        self.num_duplicates += 1
+        self.duplicate_chars += num_chars
+        return main_url
+
+    def groups(self):
+        for main_url, urls in self.duplicates.items():
+            yield [main_url] + urls
+
+    def summary(self):
+        return 'exact duplicates: {} out of {} documents | skipped ' \
+               'characters: {}'.format(self.num_duplicates, self.num_docs,
+                                       self.duplicate_chars)
+
+
+def parse_arguments():
+    """
+    Parser.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input', type=str,
+                        help='Loose json file with `url` and `text` fields.')
+    parser.add_argument('output', type=str,
+                        help='Output file of groups of identical urls.')
+    parser.add_argument('--deduped_output', type=str, default=None,
+                        help='Also write the input without exact repeats.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    print('finding exact duplicate content ...')
+
+    args = parse_arguments()
+    dedup = ExactDeduplicator()
+    fout = None
+    if args.deduped_output is not None:
+        fout = open(args.deduped_output, 'wb')
+    start_time = time.time()
+    with open(args.input, 'rb') as f:
+        for line in f:
+            try:
+                myjson = json.loads(line)
+                is_repeat = dedup.add(myjson['url'], myjson['text'])
+            except Exception as e:
+                print('Error:', e)
+                continue
+            if fout is not None and is_repeat is None:
+                fout.write(line if line.endswith(b'\n') else line + b'\n')
+            if dedup.num_docs % 100000 == 0:
+                print(' > processed {} documents in {:.2f} seconds | {}'.
+                      format(dedup.num_docs, time.time() - start_time,
+                             dedup.summary()), flush=True)
+    if fout is not None:
+        fout.close()
+
+    with open(args.output, 'wb') as f:
+        for i, urls in enumerate(dedup.groups()):
+            myjson = json.dumps({str(i): urls}, ensure_ascii=False)
+            f.write(myjson.encode('utf-8'))
+            f.write('\n'.encode('utf-8'))
+
+    print(dedup.summary())
+    print('done :-)')
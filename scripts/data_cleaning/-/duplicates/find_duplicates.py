@@ -14,87 +14,273 @@
 # limitations under the License.
 
 
-import itertools
+import argparse
+from functools import lru_cache
 import json
 from lsh import cache, minhash
+from lsh.cluster import DisjointSet
+from lsh.verify import jaccard_to_first, shingle_hashes
+from multiprocessing import Pool
+import os
 import time
-import sys
 
+from exact_dedup import ExactDeduplicator, content_hash
+from sharding import (SHARD_BYTES, MappedDocuments, find_shards,
+                      iter_shard_lines)
 
-# This function is adapted from:
-#   https://github.com/mattilyra/LSH/blob/master/examples/Introduction.ipynb
-def shingles(text, char_ngram=5):
-    return set(text[head:head + char_ngram]
-               for head in range(0, len(text) - char_ngram))
 
+# Number of documents fingerprinted together by `MinHasher.fingerprint_batch`.
+BATCH_SIZE = 10000
+# Number of threads used to fingerprint a batch, defaults to all CPUs.
+NUM_THREADS = None
+# Length of the character shingles compared when verifying candidates.
+CHAR_NGRAM = 5
+# Number of documents whose shingle hashes are cached by each process.
+SHINGLE_CACHE_SIZE = 10000
+# Default minimum shingle Jaccard similarity of a duplicate.
+MIN_JACCARD = 0.5
+# Minimum shingle Jaccard similarity of two urls merged into a group with
+# `--grouped`, the same as `is_similar` in group_duplicates_url.py.
+GROUP_MIN_JACCARD = 0.9
 
-# This function is adapted from:
-#  https://github.com/mattilyra/LSH/blob/master/examples/Introduction.ipynb
-def jaccard(set_a, set_b):
-    intersection = set_a & set_b
-    union = set_a | set_b
-    return len(intersection) / len(union)
+
+@lru_cache(maxsize=SHINGLE_CACHE_SIZE)
+def doc_shingles(url):
+    return shingle_hashes(url_doc[url], char_ngram=CHAR_NGRAM)
+
+
+def verify_bucket(items):
+    """Compute the shingle Jaccard similarity of a bucket's first document
+    with every other document of the bucket.
+
+    With `--workers` this runs in forked worker processes, which read the
+    documents from the `url_doc` inherited from the parent.
+    """
+    similarities = jaccard_to_first([doc_shingles(url) for url in items])
+    return items[0], list(zip(items[1:], similarities.tolist()))
+
+
+def add_batch(lshcache, hasher, urls, texts):
+    """Fingerprint a batch of documents, add them to the cache and empty it."""
+    fingerprints = hasher.fingerprint_batch(texts, n_threads=NUM_THREADS)
+    for url, fingerprint in zip(urls, fingerprints):
+        lshcache.add_fingerprint(fingerprint, url)
+    del urls[:]
+    del texts[:]
+
+
+def parse_arguments():
+    """
+    Parser.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input', type=str,
+                        help='Loose json file with `url` and `text` fields.')
+    parser.add_argument('output', type=str,
+                        help='Output file of possible duplicate urls.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes parsing and fingerprinting '
+                             'byte-range shards of the input file.')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Keep only the byte offset of each document in '
+                             'memory and read the candidate documents back '
+                             'from the input file when verifying them.')
+    parser.add_argument('--grouped', action='store_true',
+                        help='Merge similar urls with a union-find and write '
+                             'the groups in the output format of '
+                             'group_duplicates_url.py instead of the '
+                             'possible duplicate urls.')
+    parser.add_argument('--seeds', type=int, default=100,
+                        help='Number of min hashes of a fingerprint.')
+    parser.add_argument('--bands', type=int, default=10,
+                        help='Number of LSH bands, must divide the number of '
+                             'seeds. See tune_lsh.py to choose both.')
+    parser.add_argument('--threshold', type=float, default=MIN_JACCARD,
+                        help='Minimum shingle Jaccard similarity of a '
+                             'duplicate.')
+    parser.add_argument('--exact', action='store_true',
+                        help='Detect documents with identical normalized text '
+                             'with a content hash and report them as '
+                             'duplicates without fingerprinting them.')
+    args = parser.parse_args()
+    if args.seeds % args.bands != 0:
+        parser.error('the number of seeds must be divisible by the number '
+                     'of bands')
+    return args
+
+
+def init_worker(hasher, filename, streaming, exact):
+    global worker_hasher, worker_filename, worker_streaming, worker_exact
+    worker_hasher = hasher
+    worker_filename = filename
+    worker_streaming = streaming
+    worker_exact = exact
+
+
+def fingerprint_shard(shard):
+    """Parse and fingerprint the documents of a `(start, end)` byte range.
+
+    Runs in a worker process, returns a list of `(url, document, digest,
+    num_chars, row)` entries and the fingerprint matrix of the shard. A
+    document is either its text or, with `--streaming`, the `(offset,
+    length)` of its line. With `--exact` the content hash of each document
+    is returned as its digest and repeats within the shard are not
+    fingerprinted, their row is -1.
+    """
+    entries = []
+    texts = []
+    seen = set()
+    for offset, line in iter_shard_lines(worker_filename, *shard):
+        try:
+            myjson = json.loads(line)
+            url = myjson['url']
+            text = myjson['text']
+        except Exception as e:
+            print('Error:', e)
+            continue
+        doc = (offset, len(line)) if worker_streaming else text
+        digest = content_hash(text) if worker_exact else None
+        if worker_exact and digest in seen:
+            entries.append((url, doc, digest, len(text), -1))
+            continue
+        seen.add(digest)
+        entries.append((url, doc, digest, len(text), len(texts)))
+        texts.append(text.encode('utf-8'))
+    fingerprints = worker_hasher.fingerprint_batch(texts, n_threads=1)
+    return entries, fingerprints
 
 
 if __name__ == '__main__':
 
     print('finding possible duplicate content ...')
 
-    input = sys.argv[1]
-    output = sys.argv[2]
+    args = parse_arguments()
+    input = args.input
+    output = args.output
 
-    hasher = minhash.MinHasher(seeds=100, char_ngram=5, hashbytes=4)
-    lshcache = cache.Cache(bands=10, hasher=hasher)
+    hasher = minhash.MinHasher(seeds=args.seeds, char_ngram=5, hashbytes=4)
+    lshcache = cache.Cache(num_bands=args.bands, hasher=hasher)
 
     counter = 0
-    url_doc = {}
+    exact = ExactDeduplicator() if args.exact else None
+    if args.streaming:
+        url_doc = MappedDocuments(input)
+    else:
+        url_doc = {}
+    batch_urls = []
+    batch_texts = []
     start_time = time.time()
-    with open(input, 'r') as f:
-        for line in f:
-            try:
-                myjson = json.loads(line)
-                url = myjson['url']
-                text = myjson['text']
-                counter += 1
-                url_doc[url] = text
-                lshcache.add_fingerprint(hasher.fingerprint(text), url)
-            except Exception as e:
-                print('Error:', e)
-            if counter % 10000 == 0:
+    if args.workers > 1:
+        # Workers parse and fingerprint shards, the bands are filled here.
+        num_shards = max(4 * args.workers,
+                         -(-os.path.getsize(input) // SHARD_BYTES))
+        shards = find_shards(input, num_shards=num_shards)
+        print(' > fingerprinting {} shards with {} workers ...'.format(
+            len(shards), args.workers), flush=True)
+        with Pool(args.workers, initializer=init_worker,
+                  initargs=(hasher, input, args.streaming,
+                            args.exact)) as pool:
+            for entries, fingerprints in pool.imap(fingerprint_shard, shards):
+                for url, doc, digest, num_chars, row in entries:
+                    counter += 1
+                    if exact is not None and \
+                            exact.add_digest(url, digest, num_chars):
+                        continue
+                    if args.streaming:
+                        url_doc.add(url, *doc)
+                    else:
+                        url_doc[url] = doc
+                    lshcache.add_fingerprint(fingerprints[row], url)
                 print(' [read]> processed {} documents in {:.2f} seconds ...'.
                       format(counter, time.time() - start_time), flush=True)
+    else:
+        with open(input, 'rb') as f:
+            offset = 0
+            for line in f:
+                line_offset = offset
+                offset += len(line)
+                try:
+                    myjson = json.loads(line)
+                    url = myjson['url']
+                    text = myjson['text']
+                    counter += 1
+                    if exact is not None and exact.add(url, text):
+                        continue
+                    if args.streaming:
+                        url_doc.add(url, line_offset, len(line))
+                    else:
+                        url_doc[url] = text
+                    batch_urls.append(url)
+                    batch_texts.append(text.encode('utf-8'))
+                except Exception as e:
+                    print('Error:', e)
+                if len(batch_urls) == BATCH_SIZE:
+                    add_batch(lshcache, hasher, batch_urls, batch_texts)
+                if counter % 10000 == 0:
+                    print(' [read]> processed {} documents in {:.2f} '
+                          'seconds ...'.format(counter,
+                                               time.time() - start_time),
+                          flush=True)
+            add_batch(lshcache, hasher, batch_urls, batch_texts)
 
     counter = 0
     start_time = time.time()
     deduped = 0
+    pool = None
+    if args.workers > 1:
+        # Forked workers inherit `url_doc`, only bucket urls are sent to them.
+        pool = Pool(args.workers)
+        verified = pool.imap(verify_bucket, lshcache.iter_buckets(),
+                             chunksize=64)
+    else:
+        verified = map(verify_bucket, lshcache.iter_buckets())
+    if exact is not None:
+        print(' [read]> ' + exact.summary(), flush=True)
+    groups = DisjointSet()
     with open(output, 'wb') as f:
-        for b in lshcache.bins:
-            for bucket_id in b:
-                if len(b[bucket_id]) > 1:
-                    items = list(b[bucket_id])
-                    main_url = items[0]
-                    main_dhingles = shingles(url_doc[main_url])
-                    remove_urls = []
-                    for i in range(1, len(items)):
-                        counter += 1
-                        other_url= items[i]
-                        other_shingles = shingles(url_doc[other_url])
-                        try:
-                            jaccard_sim = jaccard(main_dhingles, other_shingles)
-                        except Exception as e:
-                            print('Error:', e)
-                        if jaccard_sim > 0.5:
-                            remove_urls.append({other_url: jaccard_sim})
-                            deduped += 1
-                        if counter % 10000 == 0:
-                            print(' [write]> processed {} documents in {:.2f} '
-                                  'seoncds and deduped {} documents ...'.
-                                  format(counter, time.time() - start_time,
-                                         deduped), flush=True)
-                    if len(remove_urls) > 0:
-                        myjson = json.dumps({main_url: remove_urls},
-                                            ensure_ascii=False)
-                        f.write(myjson.encode('utf-8'))
-                        f.write('\n'.encode('utf-8'))
+        if exact is not None:
+            # exact duplicates are reported with a similarity of 1
+            for urls in exact.groups():
+                if args.grouped:
+                    for other_url in urls[1:]:
+                        groups.union(urls[0], other_url)
+                else:
+                    myjson = json.dumps({urls[0]: [{other_url: 1.0}
+                                                   for other_url in urls[1:]]},
+                                        ensure_ascii=False)
+                    f.write(myjson.encode('utf-8'))
+                    f.write('\n'.encode('utf-8'))
+        for main_url, similarities in verified:
+            remove_urls = []
+            for other_url, jaccard_sim in similarities:
+                counter += 1
+                if jaccard_sim > args.threshold:
+                    remove_urls.append({other_url: jaccard_sim})
+                    deduped += 1
+                    if args.grouped and jaccard_sim >= GROUP_MIN_JACCARD:
+                        groups.union(main_url, other_url)
+                if counter % 10000 == 0:
+                    print(' [write]> processed {} documents in {:.2f} '
+                          'seoncds and deduped {} documents ...'.
+                          format(counter, time.time() - start_time,
+                                 deduped), flush=True)
+            if len(remove_urls) > 0 and not args.grouped:
+                myjson = json.dumps({main_url: remove_urls},
+                                    ensure_ascii=False)
+                f.write(myjson.encode('utf-8'))
+                f.write('\n'.encode('utf-8'))
+        if args.grouped:
+            for i, urls in enumerate(groups.components()):
+                myjson = json.dumps({str(i): urls}, ensure_ascii=False)
+                f.write(myjson.encode('utf-8'))
+                f.write('\n'.encode('utf-8'))
+    print(' [write]> verified {} candidate pairs and found {} duplicates in '
+          '{:.2f} seconds'.format(counter, deduped, time.time() - start_time),
+          flush=True)
+    if pool is not None:
+        pool.close()
+        pool.join()
 
+    if args.streaming:
+        url_doc.close()
     print('done :-)')
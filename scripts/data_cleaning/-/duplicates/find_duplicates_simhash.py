@@ -0,0 +1,119 @@
+# coding=utf-8
+# Copyright (c) 2019, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Find near duplicate documents with SimHash signatures.
+
+An alternative to find_duplicates.py with the same output format: every line
+maps a url to the urls of its near duplicates and their similarity, here
+`1 - hamming_distance / 64` of the 64bit signatures. Only the url and the
+signature of every document are kept in memory.
+"""
+
+import argparse
+import json
+from lsh.simhash import SIGNATURE_BITS, SimHashIndex, simhash
+from multiprocessing import Pool
+import os
+import time
+
+from sharding import SHARD_BYTES, find_shards, iter_shard_lines
+
+
+def parse_arguments():
+    """
+    Parser.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input', type=str,
+                        help='Loose json file with `url` and `text` fields.')
+    parser.add_argument('output', type=str,
+                        help='Output file of possible duplicate urls.')
+    parser.add_argument('--distance', type=int, default=3,
+                        help='Largest Hamming distance of the signatures of '
+                             'two near duplicates.')
+    parser.add_argument('--blocks', type=int, default=None,
+                        help='Number of blocks of the permuted tables, '
+                             'defaults to distance + 2.')
+    parser.add_argument('--ngram', type=int, default=1,
+                        help='Number of words of a SimHash feature.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes parsing and hashing '
+                             'byte-range shards of the input file.')
+    return parser.parse_args()
+
+
+def init_worker(filename, ngram):
+    global worker_filename, worker_ngram
+    worker_filename = filename
+    worker_ngram = ngram
+
+
+def hash_shard(shard):
+    """Return the urls and signatures of a `(start, end)` byte range."""
+    urls = []
+    signatures = []
+    for _, line in iter_shard_lines(worker_filename, *shard):
+        try:
+            myjson = json.loads(line)
+            signature = simhash(myjson['text'], ngram=worker_ngram)
+            urls.append(myjson['url'])
+            signatures.append(signature)
+        except Exception as e:
+            print('Error:', e)
+    return urls, signatures
+
+
+if __name__ == '__main__':
+
+    print('finding possible duplicate content with simhash ...')
+
+    args = parse_arguments()
+    index = SimHashIndex(max_distance=args.distance, num_blocks=args.blocks)
+
+    counter = 0
+    start_time = time.time()
+    num_shards = max(4 * args.workers,
+                     -(-os.path.getsize(args.input) // SHARD_BYTES))
+    shards = find_shards(args.input, num_shards=num_shards)
+    init_worker(args.input, args.ngram)
+    if args.workers > 1:
+        pool = Pool(args.workers, initializer=init_worker,
+                    initargs=(args.input, args.ngram))
+        hashed = pool.imap(hash_shard, shards)
+    else:
+        pool = None
+        hashed = map(hash_shard, shards)
+    for urls, signatures in hashed:
+        index.add(signatures, urls)
+        counter += len(urls)
+        print(' [read]> processed {} documents in {:.2f} seconds ...'.format(
+            counter, time.time() - start_time), flush=True)
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    counter = 0
+    deduped = 0
+    with open(args.output, 'wb') as f:
+        for main_url, near in index.iter_duplicates():
+            counter += 1
+            deduped += len(near)
+            remove_urls = [{other_url: 1. - distance / SIGNATURE_BITS}
+                           for other_url, distance in near]
+            myjson = json.dumps({main_url: remove_urls}, ensure_ascii=False)
+            f.write(myjson.encode('utf-8'))
+            f.write('\n'.encode('utf-8'))
+    print(' [write]> {} urls have {} near duplicates, {:.2f} seconds'.format(
+        counter, deduped, time.time() - start_time), flush=True)
+    print('done :-)')
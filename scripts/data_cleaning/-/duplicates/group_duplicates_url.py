@@ -14,12 +14,20 @@
 # limitations under the License.
 
 import json
+import resource
 import time
 import sys
 
+from lsh.cluster import DisjointSet
+
 
 def is_similar(jaccard_similarity):
-    return (js >= 0.9)
+    return (jaccard_similarity >= 0.9)
+
+
+def peak_memory_mb():
+    # ru_maxrss is reported in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
 
 
 if __name__ == '__main__':
@@ -30,40 +38,21 @@ if __name__ == '__main__':
     input = sys.argv[1]
     output = sys.argv[2]
 
-    url_to_index = {}
-    index_to_urls = []
+    # Every url is interned once to an integer id, groups are merged with an
+    # array-backed union-find over those ids.
+    groups = DisjointSet()
     counter = 0
     start_time = time.time()
     with open(input, 'r') as f:
         for line in f:
             counter += 1
             myjson = json.loads(line)
-            urls = []
             for main_url in myjson.keys():
-                urls.append(main_url)
+                groups.add(main_url)
                 for value in myjson[main_url]:
                     for other_url, js in value.items():
                         if is_similar(js):
-                            urls.append(other_url)
-            current_index = -1
-            other_indices = set()
-            for url in urls:
-                if url in url_to_index:
-                    if current_index == -1:
-                        current_index = url_to_index[url]
-                    elif current_index != url_to_index[url]:
-                        other_indices.add(url_to_index[url])
-            if current_index == -1:
-                current_index = len(index_to_urls)
-                index_to_urls.append(set())
-            for url in urls:
-                url_to_index[url] = current_index
-                index_to_urls[current_index].add(url)
-            for index in other_indices:
-                for url in index_to_urls[index]:
-                    index_to_urls[current_index].add(url)
-                    url_to_index[url] = current_index
-                index_to_urls[index] = None
+                            groups.union(main_url, other_url)
 
             if counter % 100000 == 0:
                 print(' > processed {} lines in {} seconds ...'.format(
@@ -72,19 +61,14 @@ if __name__ == '__main__':
 
     total_remove = 0
     total_remain = 0
-    for urls in index_to_urls:
-        if urls is not None:
-            if len(urls) > 1:
-                total_remove += (len(urls) - 1)
-                total_remain += 1
+    with open(output, 'wb') as f:
+        for i, urls in enumerate(groups.components()):
+            total_remove += (len(urls) - 1)
+            total_remain += 1
+            myjson = json.dumps({str(i): urls}, ensure_ascii=False)
+            f.write(myjson.encode('utf-8'))
+            f.write('\n'.encode('utf-8'))
     print('out of {} urls, only {} are unique and {} should be removed'.format(
         total_remove+total_remain, total_remain, total_remove))
-
-    with open(output, 'wb') as f:
-        for i, urls in enumerate(index_to_urls):
-            if urls is not None:
-                if len(urls) > 1:
-                    myjson = json.dumps({str(i): list(urls)},
-                                        ensure_ascii=False)
-                    f.write(myjson.encode('utf-8'))
-                    f.write('\n'.encode('utf-8'))
+    print('time elapsed (s): {:.2f} | peak memory (MB): {:.1f}'.format(
+        time.time() - start_time, peak_memory_mb()))
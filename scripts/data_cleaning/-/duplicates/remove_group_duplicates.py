@@ -14,17 +14,50 @@
 # limitations under the License.
 
 
+import argparse
 import json
+from multiprocessing import Pool
+import os
+import re
+import shutil
 import time
-import sys
 
+from sharding import find_shards, iter_shard_lines
+
+
+# Matches the `url` field of a loose json line without decoding the line,
+# only when it is the first or the last key of the line so that it cannot be
+# the key of a nested object. Other lines are decoded.
+URL_REGEX = re.compile(rb'^\s*\{\s*"url"\s*:\s*("(?:[^"\\]|\\.)*")\s*[,}]|'
+                       rb'[{,]\s*"url"\s*:\s*("(?:[^"\\]|\\.)*")\s*\}\s*$')
+
+
+def parse_arguments():
+    """
+    Parser.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('url_filename', type=str,
+                        help='File of similar urls from group_duplicates_url.py.')
+    parser.add_argument('data_filename', type=str,
+                        help='Loose json file with `url` and `text` fields.')
+    parser.add_argument('output_filename', type=str,
+                        help='Output loose json file of deduplicated data.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes filtering byte-range '
+                             'shards of the data file. With more than one '
+                             'worker the url is extracted without decoding '
+                             'the whole line and kept lines are copied '
+                             'unchanged.')
+    return parser.parse_args()
 
-if __name__ == '__main__':
 
-    url_filename = sys.argv[1]
-    data_filename = sys.argv[2]
-    output_filename = sys.argv[3]
+# Urls to remove, set before the worker pool is forked so that the workers
+# inherit it.
+urls = set()
 
+
+def read_urls_to_remove(url_filename):
     urls = set()
     with open(url_filename, 'r') as f:
         for line in f:
@@ -33,8 +66,56 @@ if __name__ == '__main__':
                 this_urls = myjson[key]
                 for i in range(1, len(this_urls)):
                     urls.add(this_urls[i])
-    print('will be removing {} urls'.format(len(urls)), flush=True)
+    return urls
+
+
+def extract_url(line):
+    """Return the top-level `url` field of a raw json line, decoding only
+    that field when it is the first or the last key."""
+    match = URL_REGEX.search(line)
+    if match is not None:
+        return json.loads(match.group(1) or match.group(2))
+    return json.loads(line)['url']
+
+
+def filter_shard(task):
+    """Copy the lines of a byte range whose url is not in `urls`.
 
+    Runs in forked worker processes which inherit `urls`, writes the kept
+    lines to `shard_filename` and returns the counters of the shard.
+    """
+    data_filename, start, end, shard_filename = task
+    written_docs = 0
+    removed_docs = 0
+    removed_chars = 0
+    skipped_docs = 0
+    with open(shard_filename, 'wb') as fout:
+        for _, line in iter_shard_lines(data_filename, start, end):
+            try:
+                if extract_url(line) in urls:
+                    removed_docs += 1
+                    removed_chars += len(json.loads(line)['text'])
+                    continue
+                fout.write(line if line.endswith(b'\n') else line + b'\n')
+                written_docs += 1
+            except Exception:
+                skipped_docs += 1
+    return written_docs, removed_docs, removed_chars, skipped_docs
+
+
+def print_progress(start_time, written_docs, removed_docs, removed_chars):
+    print(' [PROCESSED] time (s): {:.2f} | written: {} '
+          '| removed: {} (char: {})'.format(
+              time.time() - start_time,
+              written_docs, removed_docs, removed_chars), flush=True)
+
+
+def remove_urls(data_filename, output_filename, urls_to_remove):
+    """Decode every line and write the documents whose url is kept.
+
+    Returns the number of written and removed documents and the number of
+    characters removed.
+    """
     written_docs = 0
     removed_docs = 0
     removed_chars = 0
@@ -45,7 +126,7 @@ if __name__ == '__main__':
                 try:
                     myjson = json.loads(line)
                     url = myjson['url']
-                    if url in urls:
+                    if url in urls_to_remove:
                         print('removing', myjson)
                         removed_docs += 1
                         removed_chars += len(myjson['text'])
@@ -55,15 +136,66 @@ if __name__ == '__main__':
                     fout.write('\n'.encode('utf-8'))
                     written_docs += 1
                     if written_docs % 10000 == 0:
-                        print(' [PROCESSED] time (s): {:.2f} | written: {} '
-                              '| removed: {} (char: {})'.format(
-                                  time.time() - start_time,
-                                  written_docs, removed_docs, removed_chars))
+                        print_progress(start_time, written_docs,
+                                       removed_docs, removed_chars)
                 except Exception as e:
                     print('[SKIPPING]', line, e)
+    return written_docs, removed_docs, removed_chars
 
-    print(' [PROCESSED] time (s): {:.2f} | written: {} '
-          '| removed: {} (char: {})'.format(
-              time.time() - start_time,
-              written_docs, removed_docs, removed_chars))
+
+def remove_urls_sharded(data_filename, output_filename, urls_to_remove,
+                        workers):
+    """Filter byte-range shards of the data file with `filter_shard` in a
+    pool of `workers` processes, and concatenate their outputs in order.
+
+    Returns the same counters as `remove_urls` and the number of malformed
+    documents skipped.
+    """
+    global urls
+    urls = urls_to_remove
+    written_docs = 0
+    removed_docs = 0
+    removed_chars = 0
+    skipped_docs = 0
+    start_time = time.time()
+    num_shards = 4 * workers
+    tasks = [(data_filename, start, end,
+              '{}.shard{:05d}'.format(output_filename, i))
+             for i, (start, end) in enumerate(
+                 find_shards(data_filename, num_shards=num_shards))]
+    # Forked workers inherit `urls`, shard outputs are merged in order.
+    with Pool(workers) as pool:
+        for counters in pool.imap(filter_shard, tasks):
+            written_docs += counters[0]
+            removed_docs += counters[1]
+            removed_chars += counters[2]
+            skipped_docs += counters[3]
+            print_progress(start_time, written_docs, removed_docs,
+                           removed_chars)
+    with open(output_filename, 'wb') as fout:
+        for task in tasks:
+            with open(task[3], 'rb') as fin:
+                shutil.copyfileobj(fin, fout)
+            os.remove(task[3])
+    return written_docs, removed_docs, removed_chars, skipped_docs
+
+
+if __name__ == '__main__':
+
+    args = parse_arguments()
+
+    urls_to_remove = read_urls_to_remove(args.url_filename)
+    print('will be removing {} urls'.format(len(urls_to_remove)), flush=True)
+
+    start_time = time.time()
+    if args.workers > 1:
+        written_docs, removed_docs, removed_chars, skipped_docs = \
+            remove_urls_sharded(args.data_filename, args.output_filename,
+                                urls_to_remove, args.workers)
+        print(' [SKIPPED] {} malformed documents'.format(skipped_docs))
+    else:
+        written_docs, removed_docs, removed_chars = remove_urls(
+            args.data_filename, args.output_filename, urls_to_remove)
+
+    print_progress(start_time, written_docs, removed_docs, removed_chars)
     print('done :-)')
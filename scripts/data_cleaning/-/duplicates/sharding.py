@@ -0,0 +1,103 @@
+# coding=utf-8
+# Copyright (c) 2019, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Split loose json files into byte-range shards on line boundaries."""
+
+import json
+import mmap
+import os
+
+
+# Target size of a shard, a file is split in at least this many bytes per shard.
+SHARD_BYTES = 64 * 1024 * 1024
+
+
+def find_shards(filename, num_shards=None, shard_bytes=SHARD_BYTES):
+    """Return a list of `(start, end)` byte ranges covering `filename`.
+
+    Every range starts at the beginning of a line and ends right after a
+    newline (or at the end of the file), so the shards can be processed
+    independently. If `num_shards` is None the file is split in shards of
+    about `shard_bytes` bytes.
+    """
+    size = os.path.getsize(filename)
+    if num_shards is None:
+        num_shards = -(-size // shard_bytes)
+    num_shards = max(1, num_shards)
+
+    boundaries = [0]
+    with open(filename, 'rb') as f:
+        for i in range(1, num_shards):
+            offset = size * i // num_shards
+            if offset <= boundaries[-1]:
+                continue
+            # move to the start of the next line
+            f.seek(offset - 1)
+            f.readline()
+            offset = f.tell()
+            if boundaries[-1] < offset < size:
+                boundaries.append(offset)
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:])
+            if start < end]
+
+
+def iter_shard_lines(filename, start, end):
+    """Yield `(offset, line)` for the raw lines of the byte range."""
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        offset = start
+        while offset < end:
+            line = f.readline()
+            if not line:
+                break
+            yield offset, line
+            offset += len(line)
+
+
+class MappedDocuments(object):
+    """Read the `text` of loose json documents back from their byte offsets.
+
+    Only the `(offset, length)` of each line is kept in memory, the text is
+    parsed from a memory map of the file every time a document is accessed.
+    """
+
+    def __init__(self, filename, field='text'):
+        self.filename = filename
+        self.field = field
+        self.offsets = {}
+        self._file = open(filename, 'rb')
+        self._mmap = None
+        if os.path.getsize(filename) > 0:
+            self._mmap = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+
+    def add(self, key, offset, length):
+        self.offsets[key] = (offset, length)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, key):
+        return key in self.offsets
+
+    def __getitem__(self, key):
+        offset, length = self.offsets[key]
+        return json.loads(self._mmap[offset:offset + length])[self.field]
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
@@ -0,0 +1,70 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import blacklist_urls  # noqa: E402
+from blacklist_urls import (DOMAIN, DUPLICATE, EXTENTION, MALFORMED, SHORT,  # noqa: E402
+                            filter_urls, filter_urls_external)
+
+URL_FILES = {
+    'a.txt': [
+        'https://www.cisco.com/c/en/us/products/routers.html',
+        'https://www.cisco.com/c/en/us/products/switches.html',
+        'https://www.youtube.com/watch?v=1',
+        'https://www.cisco.com/c/en/us/products/routers.html',
+        'https://www.cisco.com/logo.png',
+        'http://a',
+        'not a url at all',
+    ],
+    'b.txt': [
+        'https://www.cisco.com/c/en/us/products/switches.html',
+        'https://community.cisco.com/t5/routing/1',
+        'https://www.cisco.com/c/en/us/products/routers.html',
+    ],
+    'c.txt': [
+        'https://community.cisco.com/t5/routing/1',
+        'https://community.cisco.com/t5/routing/2',
+    ],
+}
+
+
+@pytest.fixture
+def url_files(tmp_path):
+    files = []
+    for name, urls in URL_FILES.items():
+        filename = str(tmp_path / name)
+        with open(filename, 'w') as f:
+            f.write('\n'.join(urls) + '\n')
+        files.append(filename)
+    return files
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_external_matches_in_memory(tmp_path, monkeypatch, url_files, workers):
+    urls, urls_counter, counters = filter_urls(url_files, workers=workers)
+    assert sorted(urls) == [
+        'https://community.cisco.com/t5/routing/1',
+        'https://community.cisco.com/t5/routing/2',
+        'https://www.cisco.com/c/en/us/products/routers.html',
+        'https://www.cisco.com/c/en/us/products/switches.html',
+    ]
+    assert urls_counter == 12
+    assert counters[DOMAIN] == counters[EXTENTION] == counters[SHORT] == counters[MALFORMED] == 1
+    assert counters[DUPLICATE] == 4
+
+    # One run per url, merged by cascades of 2 runs
+    monkeypatch.setattr(blacklist_urls, 'MAX_OPEN_RUNS', 2)
+    tmp_dir = tmp_path / 'runs'
+    tmp_dir.mkdir()
+    output = str(tmp_path / 'urls.out')
+    external_counter, external_counters = filter_urls_external(
+        url_files, output, workers=workers, memory_budget=0, tmp_dir=str(tmp_dir))
+    with open(output, 'r') as f:
+        lines = f.read().splitlines()
+    assert sorted(lines) == sorted(urls)
+    assert external_counter == urls_counter
+    assert external_counters == counters
+    assert os.listdir(str(tmp_dir)) == []
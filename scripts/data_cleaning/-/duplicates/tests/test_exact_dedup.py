@@ -0,0 +1,27 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exact_dedup import ExactDeduplicator  # noqa: E402
+
+
+def test_exact_duplicates():
+    dedup = ExactDeduplicator()
+    assert dedup.add('a', 'the cisco  router') is None
+    assert dedup.add('b', 'a vlan') is None
+    assert dedup.add('c', 'the cisco router\n') == 'a'
+    assert dedup.add('d', 'the cisco router') == 'a'
+    assert list(dedup.groups()) == [['a', 'c', 'd']]
+    assert dedup.num_duplicates == 2
+
+
+def test_identical_documents_with_the_same_url():
+    dedup = ExactDeduplicator()
+    assert dedup.add('a', 'the cisco router') is None
+    assert dedup.add('a', 'the cisco router') == 'a'
+    assert dedup.add('a', 'a vlan') is None
+    assert dedup.num_duplicates == 1
+    assert dedup.duplicate_chars == len('the cisco router')
+    # removing `a` by url would also remove its first copy
+    assert list(dedup.groups()) == []
@@ -0,0 +1,56 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from remove_group_duplicates import extract_url, remove_urls, remove_urls_sharded  # noqa: E402
+
+
+@pytest.mark.parametrize('doc', [
+    # url as the first key
+    {'url': 'https://www.cisco.com/a', 'text': 'the router'},
+    # url as the last key
+    {'text': 'the router', 'url': 'https://www.cisco.com/a'},
+    # escaped quotes and backslashes in the url and the text
+    {'url': 'https://www.cisco.com/a?q="b\\"c"', 'text': 'say "url": "x"'},
+    {'text': 'say {"url": "x"}', 'url': 'https://www.cisco.com/a?q=\\"'},
+    # nested url keys, only the top-level one is the url of the document
+    {'meta': {'url': 'https://nested.com/'}, 'url': 'https://www.cisco.com/a', 'text': 'the router'},
+    {'text': 'the router', 'meta': {'url': 'https://nested.com/'}, 'url': 'https://www.cisco.com/a'},
+    {'url': 'https://www.cisco.com/a', 'meta': {'url': 'https://nested.com/'}},
+    # non-ascii text, escaped or not
+    {'url': 'https://www.cisco.com/é', 'text': 'routeur ✓'},
+])
+@pytest.mark.parametrize('ensure_ascii', [True, False])
+def test_extract_url(doc, ensure_ascii):
+    line = json.dumps(doc, ensure_ascii=ensure_ascii).encode('utf-8') + b'\n'
+    assert extract_url(line) == doc['url']
+
+
+def test_extract_url_without_top_level_url():
+    with pytest.raises(KeyError):
+        extract_url(json.dumps({'text': 'the router', 'meta': {'url': 'https://nested.com/'}}).encode('utf-8'))
+
+
+def test_sharded_output_is_identical(tmp_path):
+    docs = [{'url': 'https://www.cisco.com/{}'.format(i), 'text': 'routeur {} "é" ✓'.format(i) * (i % 5 + 1)}
+            for i in range(200)]
+    data_filename = str(tmp_path / 'data.json')
+    with open(data_filename, 'wb') as f:
+        for doc in docs:
+            f.write(json.dumps(doc, ensure_ascii=False).encode('utf-8') + b'\n')
+    urls_to_remove = set(doc['url'] for doc in docs[::3])
+
+    serial_counters = remove_urls(data_filename, str(tmp_path / 'serial.json'), urls_to_remove)
+    sharded_counters = remove_urls_sharded(data_filename, str(tmp_path / 'sharded.json'), urls_to_remove, 3)
+    with open(str(tmp_path / 'serial.json'), 'rb') as f:
+        serial = f.read()
+    with open(str(tmp_path / 'sharded.json'), 'rb') as f:
+        sharded = f.read()
+    assert sharded == serial
+    assert serial_counters == (133, 67, sum(len(doc['text']) for doc in docs[::3]))
+    assert sharded_counters == serial_counters + (0,)
+    assert sorted(os.listdir(str(tmp_path))) == ['data.json', 'serial.json', 'sharded.json']
@@ -0,0 +1,73 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sharding import MappedDocuments, find_shards, iter_shard_lines  # noqa: E402
+
+DOCS = [{'url': 'https://www.cisco.com/{}'.format(i), 'text': 'routeur {} é ✓ '.format(i) * (i % 9 + 1)}
+        for i in range(50)]
+
+
+def write_docs(tmp_path, trailing_newline=True):
+    filename = str(tmp_path / 'docs.json')
+    data = '\n'.join(json.dumps(doc, ensure_ascii=False) for doc in DOCS)
+    with open(filename, 'wb') as f:
+        f.write((data + ('\n' if trailing_newline else '')).encode('utf-8'))
+    return filename
+
+
+def read_shards(filename, shards):
+    return [item for start, end in shards for item in iter_shard_lines(filename, start, end)]
+
+
+@pytest.mark.parametrize('trailing_newline', [True, False])
+@pytest.mark.parametrize('num_shards', [1, 2, 3, 7, 50, 200])
+def test_shards_cover_every_line_once(tmp_path, trailing_newline, num_shards):
+    filename = write_docs(tmp_path, trailing_newline)
+    with open(filename, 'rb') as f:
+        data = f.read()
+    lines = data.splitlines(keepends=True)
+
+    shards = find_shards(filename, num_shards=num_shards)
+    assert shards[0][0] == 0 and shards[-1][1] == len(data)
+    assert all(end == start for (_, end), (start, _) in zip(shards, shards[1:]))
+    assert all(start == 0 or data[start - 1:start] == b'\n' for start, _ in shards)
+    items = read_shards(filename, shards)
+    assert [line for _, line in items] == lines
+    assert [offset for offset, _ in items] == [sum(len(line) for line in lines[:i]) for i in range(len(lines))]
+
+
+def test_shards_of_shard_bytes(tmp_path):
+    filename = write_docs(tmp_path)
+    size = os.path.getsize(filename)
+    # Every boundary falls in the middle of a line
+    shards = find_shards(filename, shard_bytes=size // 10 + 1)
+    assert 1 < len(shards) <= 10
+    assert len(read_shards(filename, shards)) == len(DOCS)
+
+
+def test_empty_file(tmp_path):
+    filename = str(tmp_path / 'empty.json')
+    open(filename, 'wb').close()
+    assert find_shards(filename, num_shards=4) == []
+    documents = MappedDocuments(filename)
+    assert len(documents) == 0
+    documents.close()
+
+
+def test_mapped_documents(tmp_path):
+    filename = write_docs(tmp_path, trailing_newline=False)
+    with open(filename, 'r', encoding='utf-8') as f:
+        expected = {json.loads(line)['url']: json.loads(line)['text'] for line in f}
+
+    documents = MappedDocuments(filename)
+    for offset, line in read_shards(filename, find_shards(filename, num_shards=3)):
+        documents.add(json.loads(line)['url'], offset, len(line))
+    assert len(documents) == len(DOCS)
+    assert 'https://www.cisco.com/0' in documents
+    assert {url: documents[url] for url in expected} == expected
+    documents.close()
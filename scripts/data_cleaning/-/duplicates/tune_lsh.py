@@ -0,0 +1,161 @@
+# coding=utf-8
+# Copyright (c) 2019, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Recommend the number of seeds and bands of find_duplicates.py.
+
+A sample of the corpus is fingerprinted once with `--max_seeds` seeds, the
+S-curve of every candidate `(bands, rows)` setting gives its false-negative
+rate at `--threshold` and the buckets of the sample give its candidate
+comparisons, which are extrapolated to the whole corpus together with the
+measured fingerprinting and verification times.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+from lsh import minhash
+from lsh.tuning import tune
+from lsh.verify import jaccard, shingle_hashes
+
+from sharding import find_shards, iter_shard_lines
+
+
+# The sample is read from this many evenly spaced places of the input file.
+SAMPLE_CHUNKS = 100
+# Number of random document pairs timed to estimate the verification cost.
+TIMED_PAIRS = 200
+# Length of the character shingles, as in find_duplicates.py.
+CHAR_NGRAM = 5
+# Setting of find_duplicates.py without `--seeds` and `--bands`.
+DEFAULT_SETTING = (10, 10)
+
+
+def parse_arguments():
+    """
+    Parser.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input', type=str,
+                        help='Loose json file with `url` and `text` fields.')
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help='Jaccard similarity of the duplicates to find.')
+    parser.add_argument('--max_false_negative', type=float, default=0.05,
+                        help='Acceptable probability of missing a pair at '
+                             'the threshold.')
+    parser.add_argument('--sample', type=int, default=10000,
+                        help='Number of documents in the sample.')
+    parser.add_argument('--num_docs', type=int, default=None,
+                        help='Number of documents of the corpus, estimated '
+                             'from the file size by default.')
+    parser.add_argument('--max_seeds', type=int, default=200,
+                        help='Largest number of seeds considered.')
+    parser.add_argument('--max_rows', type=int, default=None,
+                        help='Largest number of rows per band considered.')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of settings to print.')
+    return parser.parse_args()
+
+
+def read_sample(filename, sample_size):
+    """Read about `sample_size` texts from evenly spaced parts of the file.
+
+    Returns the texts and the average size in bytes of a line.
+    """
+    per_chunk = -(-sample_size // SAMPLE_CHUNKS)
+    texts = []
+    num_bytes = 0
+    for start, end in find_shards(filename, num_shards=SAMPLE_CHUNKS):
+        lines = iter_shard_lines(filename, start, end)
+        for _, line in itertools.islice(lines, per_chunk):
+            try:
+                texts.append(json.loads(line)['text'])
+                num_bytes += len(line)
+            except Exception as e:
+                print('Error:', e)
+    return texts, num_bytes / max(len(texts), 1)
+
+
+def time_verification(texts, num_pairs=TIMED_PAIRS, random_state=0):
+    """Average time to shingle and compare two documents of the sample."""
+    rng = np.random.RandomState(random_state)
+    pairs = rng.randint(0, len(texts), size=(num_pairs, 2))
+    start_time = time.time()
+    for i, j in pairs:
+        jaccard(shingle_hashes(texts[i], char_ngram=CHAR_NGRAM),
+                shingle_hashes(texts[j], char_ngram=CHAR_NGRAM))
+    return (time.time() - start_time) / num_pairs
+
+
+if __name__ == '__main__':
+
+    print('tuning the LSH bands ...')
+
+    args = parse_arguments()
+    texts, line_bytes = read_sample(args.input, args.sample)
+    if len(texts) < 2:
+        raise SystemExit('not enough documents in {}'.format(args.input))
+    num_docs = args.num_docs
+    if num_docs is None:
+        num_docs = int(os.path.getsize(args.input) / line_bytes)
+    print(' > sampled {} documents out of about {}'.format(len(texts),
+                                                           num_docs),
+          flush=True)
+
+    hasher = minhash.MinHasher(seeds=args.max_seeds, char_ngram=CHAR_NGRAM,
+                               hashbytes=4)
+    start_time = time.time()
+    fingerprints = hasher.fingerprint_batch(
+        [text.encode('utf-8') for text in texts])
+    seconds_per_seed = (time.time() - start_time) / \
+        (len(texts) * args.max_seeds)
+    seconds_per_comparison = time_verification(texts)
+    print(' > fingerprinting: {:.2e} seconds per document and seed, '
+          'verification: {:.2e} seconds per comparison'.format(
+              seconds_per_seed, seconds_per_comparison), flush=True)
+
+    results, best = tune(fingerprints, args.threshold,
+                         args.max_false_negative, num_docs=num_docs,
+                         seconds_per_seed=seconds_per_seed,
+                         seconds_per_comparison=seconds_per_comparison,
+                         max_rows=args.max_rows,
+                         extra_settings=[DEFAULT_SETTING])
+
+    print('{:>6} {:>5} {:>5} {:>7} {:>9} {:>11} {:>8} {:>14} {:>10}'.format(
+        'seeds', 'bands', 'rows', 's-curve', 'false-neg', 'comparisons',
+        'max-bkt', 'proj-compars', 'hours'))
+    shown = results[:args.top]
+    shown += [s for s in results if (s['bands'], s['rows']) ==
+              DEFAULT_SETTING and s not in shown]
+    for stats in shown:
+        print('{seeds:>6} {bands:>5} {rows:>5} {s_curve_threshold:>7.3f} '
+              '{false_negative_rate:>9.4f} {comparisons:>11} '
+              '{max_bucket:>8} {projected_comparisons:>14.3e} '
+              '{hours:>10.2f}'.format(hours=stats['total_seconds'] / 3600,
+                                      **stats))
+
+    if best['false_negative_rate'] > args.max_false_negative:
+        print('no setting with at most {} seeds reaches a false-negative '
+              'rate of {}'.format(args.max_seeds, args.max_false_negative))
+    print('recommended: {} bands of {} rows, false-negative rate {:.4f} at a '
+          'Jaccard similarity of {}'.format(best['bands'], best['rows'],
+                                            best['false_negative_rate'],
+                                            args.threshold))
+    print('python find_duplicates.py <input> <output> --seeds {} --bands {} '
+          '--threshold {}'.format(best['seeds'], best['bands'],
+                                  args.threshold))
+    print('done :-)')
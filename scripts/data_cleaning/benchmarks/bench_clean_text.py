@@ -0,0 +1,76 @@
+"""
+Compare the per-document cleaning of cleanup_dataset.py before and after clean_text.
+
+Usage:
+    python benchmarks/bench_clean_text.py --data_dir=<data_dir> [--num_files 2] [--num_docs 5000]
+
+The documents are read from the first --num_files files of <data_dir>/Original/. The baseline runs ftfy on
+every text, an uncompiled re.sub, rebuilds the special characters set and splits the text three times.
+Both versions must give the same texts and word counts, docs/sec of each is printed.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+import ftfy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cleanup_dataset import NEEDS_FTFY_REGEX, clean_text, read_original
+
+
+def parse_arguments():
+    """
+    Parser.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_dir", type=str, default='/raid/antoloui/Master-thesis/Data/',
+                        help="Path of the data directory.")
+    parser.add_argument("--num_files", type=int, default=2,
+                        help="Number of files of Original/ to sample documents from.")
+    parser.add_argument("--num_docs", type=int, default=5000,
+                        help="Maximum number of documents read from each file.")
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="The best time of this number of runs is reported.")
+    return parser.parse_args()
+
+
+def clean_text_baseline(text):
+    text = ftfy.fix_text(text)
+    text = re.sub('\s{2,}', ' ', text)
+    spec_char = set(',?;.:/=+%`¨*$€-_())°!§\'\"&@#~®†ºπ‡¬≈©◊~∞µ…÷≠<>^')
+    text = ' '.join([x for x in text.split() if len(x)<=2 or not all(c in spec_char for c in x)])
+    return text, len(text.split())
+
+
+def best_time(function, texts, repeats):
+    times = []
+    for _ in range(repeats):
+        start_time = time.time()
+        results = [function(text) for text in texts]
+        times.append(time.time() - start_time)
+    return min(times), results
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    filespath = args.data_dir + 'Original/'
+    filenames = sorted(os.path.splitext(f)[0] for f in os.listdir(filespath) if f.endswith('.json'))[:args.num_files]
+
+    texts = []
+    for filename in filenames:
+        for i, doc in enumerate(read_original(filename, args.data_dir)):
+            if i == args.num_docs:
+                break
+            if doc.get('text') is not None:
+                texts.append(' '.join(doc['text']))
+    skipped = sum(NEEDS_FTFY_REGEX.search(text) is None for text in texts)
+    print('> {} documents from {} files, {} skip ftfy'.format(len(texts), len(filenames), skipped))
+
+    baseline_time, baseline = best_time(clean_text_baseline, texts, args.repeats)
+    new_time, new = best_time(clean_text, texts, args.repeats)
+    assert baseline == new, 'clean_text does not match the baseline cleaning'
+    print('baseline   | {:8.2f} s | {:10.1f} docs/s'.format(baseline_time, len(texts) / max(baseline_time, 1e-9)))
+    print('clean_text | {:8.2f} s | {:10.1f} docs/s'.format(new_time, len(texts) / max(new_time, 1e-9)))
+    print('speedup    | {:.2f}x'.format(baseline_time / max(new_time, 1e-9)))
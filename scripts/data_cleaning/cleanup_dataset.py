@@ -1,15 +1,45 @@
 import ftfy
 import json
-from langdetect import detect
+from langdetect import detect, DetectorFactory
 import numpy as np
 import time
 import os
 import sys
 import re
 import argparse
-from multiprocessing import Process
+from collections import Counter
+from itertools import groupby
+from multiprocessing import Lock
+from operator import itemgetter
+from multiprocessing.managers import BaseManager
+
+from parallel import map_file_chunks
 
 MIN_DOCUMENT_LENGTH = 128
+# Number of characters read at once by iter_json_documents.
+READ_CHUNK_SIZE = 2**20
+# Characters of the words removed when made of these characters only.
+SPEC_CHAR = frozenset(',?;.:/=+%`¨*$€-_())°!§\'\"&@#~®†ºπ‡¬≈©◊~∞µ…÷≠<>^')
+# ftfy only changes non-ASCII text, HTML entities and control characters, other texts skip it.
+NEEDS_FTFY_REGEX = re.compile(r'[^\t\n\x20-\x7e]|&')
+# Any non-ASCII character, str.isascii needs Python 3.7.
+NON_ASCII_REGEX = re.compile(r'[^\x00-\x7f]')
+# Number of characters of a document looked at by the fast language check.
+LANG_PREFIX_LENGTH = 2000
+# Common words of English, and of the other languages of localized web pages, used by the fast language check.
+ENGLISH_STOP_WORDS = frozenset([
+    'the', 'of', 'and', 'to', 'a', 'in', 'is', 'that', 'for', 'it', 'as', 'was', 'with', 'be', 'by', 'on',
+    'not', 'this', 'are', 'or', 'from', 'at', 'which', 'an', 'have', 'has', 'can', 'you', 'your', 'will',
+    'if', 'all', 'more', 'when', 'there', 'their', 'they', 'we', 'our', 'these', 'other', 'into', 'also'])
+FOREIGN_STOP_WORDS = frozenset([
+    'le', 'la', 'les', 'des', 'du', 'et', 'est', 'une', 'pour', 'dans', 'qui', 'sur', 'avec', 'sont',
+    'der', 'die', 'das', 'und', 'ist', 'nicht', 'mit', 'sie', 'den', 'auf', 'für', 'ein', 'eine', 'werden',
+    'el', 'los', 'las', 'y', 'es', 'por', 'para', 'con', 'una', 'su', 'del', 'se', 'lo', 'como', 'más',
+    'il', 'di', 'che', 'per', 'non', 'della', 'sono', 'da', 'em', 'os', 'não', 'uma', 'het', 'een', 'van', 'zijn'])
+# Languages detected by langdetect are deterministic.
+DetectorFactory.seed = 0
+# Minimum estimated Jaccard similarity of a document dropped by --dedup, the same as `is_similar` in group_duplicates_url.py.
+DEDUP_MIN_JACCARD = 0.9
 
 
 def parse_arguments():
@@ -23,18 +53,152 @@ def parse_arguments():
                         help="Path of the input file.")
     parser.add_argument("--all", type=bool, default=False,
                         help="Create pretraining data for all json files.")
+    parser.add_argument("--dedup", action='store_true',
+                        help="Drop near-duplicate documents while cleaning, using a MinHash LSH cache shared by all processes.")
+    parser.add_argument("--dedup_threshold", type=float, default=DEDUP_MIN_JACCARD,
+                        help="Minimum estimated Jaccard similarity of a dropped duplicate.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of processes cleaning chunks of documents of all files (default: number of cores).")
     arguments, _ = parser.parse_known_args()
     return arguments
 
 
 
-def save_result(data_dir, filename, start_time, num_docs, num_written_docs, num_fixed_text, num_small_docs, num_non_english_docs):
+class OnlineDeduplicator(object):
+    """
+    A MinHash LSH cache living in a manager process, shared by all clean_chunk workers.
+    The fingerprints are computed by the processes, only the lookup and insertion happen here.
+    """
+    def __init__(self, hasher, num_bands=10, min_jaccard=DEDUP_MIN_JACCARD):
+        from lsh import cache
+        self.lshcache = cache.Cache(hasher, num_bands=num_bands)
+        self.min_jaccard = min_jaccard
+        self.lock = Lock()
+
+    def add_if_new(self, fingerprint, doc_id):
+        """
+        Add the fingerprint and return True, or return False if a near-duplicate was already added.
+        """
+        return self.add_if_new_batch([fingerprint], [doc_id])[0]
+
+    def add_if_new_batch(self, fingerprints, doc_ids):
+        """
+        add_if_new for a batch of fingerprints in one call, return the list of results in order.
+        A near-duplicate of an earlier document of the batch is not new either.
+        """
+        is_new = []
+        with self.lock:
+            for fingerprint, doc_id in zip(fingerprints, doc_ids):
+                if self.lshcache.get_duplicates_of(fingerprint=fingerprint, min_jaccard=self.min_jaccard):
+                    is_new.append(False)
+                    continue
+                self.lshcache.add_fingerprint(fingerprint, doc_id)
+                is_new.append(True)
+        return is_new
+
+
+class DedupManager(BaseManager):
+    pass
+
+
+DedupManager.register('OnlineDeduplicator', OnlineDeduplicator)
+
+
+def iter_json_documents(f_in, chunk_size=READ_CHUNK_SIZE):
+    """
+    Yield the documents of a top-level JSON array, or of loose JSON (one document per line), one at a time.
+    Only the current document and a chunk of the file are held in memory, instead of the whole parsed file.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    in_array = None
+    read_size = chunk_size
+    while True:
+        # Skip whitespace and, inside the array, the commas between documents
+        while pos < len(buffer) and (buffer[pos].isspace() or (in_array and buffer[pos] == ',')):
+            pos += 1
+        if pos == len(buffer):
+            if eof:
+                if in_array:
+                    raise ValueError('Unterminated JSON array.')
+                return
+            buffer = f_in.read(read_size)
+            pos = 0
+            eof = not buffer
+            continue
+        if in_array is None:
+            in_array = buffer[pos] == '['
+            if in_array:
+                pos += 1
+            continue
+        if in_array and buffer[pos] == ']':
+            return
+        try:
+            doc, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # The document goes past the buffer, read more of it and retry with larger reads
+            chunk = f_in.read(read_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            read_size *= 2
+            continue
+        read_size = chunk_size
+        pos = end
+        yield doc
+
+
+def is_english_fast(text):
+    """
+    Cheap language check on the first LANG_PREFIX_LENGTH characters of a text.
+    Return True for clear English, False for clear non-English and None when langdetect should decide.
+    """
+    prefix = text[:LANG_PREFIX_LENGTH]
+    letters = sum(1 for c in prefix if c.isalpha())
+    if not letters:
+        return None
+    # Text mostly in another script, or with many accented letters
+    if NON_ASCII_REGEX.search(prefix) is not None and sum(1 for c in prefix if ord(c) > 127 and c.isalpha()) > 0.3 * letters:
+        return False
+
+    words = re.findall(r'\w+', prefix.lower())
+    english = sum(1 for w in words if w in ENGLISH_STOP_WORDS) / len(words)
+    foreign = sum(1 for w in words if w in FOREIGN_STOP_WORDS) / len(words)
+    if english >= 0.15 and foreign < 0.03:
+        return True
+    if foreign >= 0.15 and english < 0.03:
+        return False
+    return None
+
+
+def is_english(text, stats):
+    """
+    Tiered language filter: is_english_fast first, langdetect on the full text for the ambiguous remainder.
+    The tier that decided is counted in stats.
+    """
+    fast = is_english_fast(text)
+    if fast is not None:
+        stats['num_lang_fast_english' if fast else 'num_lang_fast_non_english'] += 1
+        return fast
+    stats['num_lang_detector'] += 1
+    return detect(text) == 'en'
+
+
+def save_result(data_dir, filename, start_time, num_docs, num_written_docs, num_fixed_text, num_small_docs, num_non_english_docs, num_duplicate_docs=0,
+                num_lang_fast_english=0, num_lang_fast_non_english=0, num_lang_detector=0):
     """
     """
     string = 'Elapsed time: {:.2f} s| '.format(time.time() - start_time)
     string += 'Total documents: {} | '.format(num_docs)
     string += 'Small documents: {} | '.format(num_small_docs)
     string += 'Non-english documents: {} | '.format(num_non_english_docs)
+    string += 'Language by fast check (english/non-english): {}/{} | '.format(num_lang_fast_english, num_lang_fast_non_english)
+    string += 'Language by langdetect: {} | '.format(num_lang_detector)
+    string += 'Duplicate documents: {} | '.format(num_duplicate_docs)
     string += 'Fixed documents: {} | '.format(num_fixed_text)
     string += 'Written documents: {}'.format(num_written_docs)
     
@@ -43,93 +207,161 @@ def save_result(data_dir, filename, start_time, num_docs, num_written_docs, num_
         text_file.write(string)
 
 
-    
-def filter_corpus(filename, data_dir):
+def clean_text(text):
     """
+    Fix the text with ftfy, collapse whitespace and remove the words made of special characters only.
+    Return the cleaned text and its number of words.
     """
-    in_filepath = data_dir + 'Original/' + filename + '.json'
-    out_filepath = data_dir + 'Cleaned/cleaned_' + filename + '.json'
-    
-    num_docs = 0
-    num_written_docs = 0
-    num_small_docs = 0
-    num_fixed_text = 0
-    num_non_english_docs = 0
-    docs_list = []
-    
-    start_time = time.time()
-    with open(out_filepath, 'wb') as f_out:
-        with open(in_filepath, 'r+') as f_in:
-            # Load data: data is a list of dict of the form: {'text':['...'], 'uri':['...']}
-            data = json.load(f_in)
-            for doc in data:
-                num_docs += 1
-                
-                if doc.get('text') is not None:
-                    doc['text'] = ' '.join(doc['text'])
-                    
-                    # Fix text with ftfy
-                    text = ftfy.fix_text(doc['text'])
-                    
-                    # Replace two or more spaces with one
-                    text = re.sub('\s{2,}', ' ', text)
-                    
-                    # Remove sequences of special characters
-                    spec_char = set(',?;.:/=+%`¨*$€-_())°!§\'\"&@#~®†ºπ‡¬≈©◊~∞µ…÷≠<>^')
-                    text = ' '.join([x for x in text.split() if len(x)<=2 or not all(c in spec_char for c in x)])
-                    
-                    # Count number of fixed docs
-                    if text != doc['text']:
-                        num_fixed_text += 1
-                    doc['text'] = text
-                    
-                    # Skip small documents
-                    if len(text.split()) < MIN_DOCUMENT_LENGTH:
-                        #print('[small document, skipping]:', doc)
-                        num_small_docs += 1
-                        continue
-
-                    try:
-                        # Skip non-english documents.
-                        if detect(text) != 'en':
-                            #print('[non-english text]', doc)
-                            num_non_english_docs += 1
-                            continue
-                    except:
-                        print("This text throws an error:", text)
-                        continue
-
-                    # Write to output file
-                    myjson = json.dumps(doc, ensure_ascii=False)
-                    f_out.write(myjson.encode('utf-8'))
-                    f_out.write('\n'.encode('utf-8'))
-                    num_written_docs += 1
-                                         
-    save_result(data_dir, filename, start_time, num_docs, num_written_docs, num_fixed_text, num_small_docs, num_non_english_docs)
-    print("{}.json cleaned !".format(filename))
-    
+    # Fix text with ftfy, unless it has nothing ftfy could change
+    if NEEDS_FTFY_REGEX.search(text) is not None:
+        text = ftfy.fix_text(text)
+
+    # Split once: joining the words replaces two or more spaces with one, and the words are counted
+    # Remove sequences of special characters
+    words = [x for x in text.split() if len(x)<=2 or not SPEC_CHAR.issuperset(x)]
+    return ' '.join(words), len(words)
+
+
+def read_original(filename, data_dir):
+    """
+    Yield the documents of Original/<filename>.json one at a time.
+    """
+    with open(data_dir + 'Original/' + filename + '.json', 'r') as f_in:
+        # Stream data: data is a list of dict of the form: {'text':['...'], 'uri':['...']}
+        for doc in iter_json_documents(f_in):
+            yield doc
+
+
+# Set in every worker by init_worker.
+worker_hasher = None
+worker_deduplicator = None
+
+
+def init_worker(hasher, deduplicator):
+    global worker_hasher, worker_deduplicator
+    worker_hasher = hasher
+    worker_deduplicator = deduplicator
+
+
+def clean_document(doc, stats):
+    """
+    Clean the text of a document of Original/ in place and return it, or return None if the document is dropped.
+    The reasons of dropping and fixing documents are counted in stats.
+    """
+    if doc.get('text') is None:
+        return None
+    doc['text'] = ' '.join(doc['text'])
+
+    text, num_words = clean_text(doc['text'])
+
+    # Count number of fixed docs
+    if text != doc['text']:
+        stats['num_fixed_text'] += 1
+    doc['text'] = text
+
+    # Skip small documents
+    if num_words < MIN_DOCUMENT_LENGTH:
+        #print('[small document, skipping]:', doc)
+        stats['num_small_docs'] += 1
+        return None
+
+    try:
+        # Skip non-english documents.
+        if not is_english(text, stats):
+            #print('[non-english text]', doc)
+            stats['num_non_english_docs'] += 1
+            return None
+    except:
+        print("This text throws an error:", text)
+        return None
+    return doc
+
+
+def clean_chunk(task):
+    """
+    Clean a chunk of documents of a file, return the encoded lines to write and the counters of the chunk.
+    If a shared deduplicator was given to the worker, the cleaned documents of the chunk are fingerprinted
+    with its hasher in one batch, and near-duplicates of documents already written by any worker are dropped
+    with one call to the manager process per chunk.
+    """
+    filename, start, docs = task
+    lines = []
+    stats = Counter()
+    cleaned = []
+    for num_docs, doc in enumerate(docs, start + 1):
+        stats['num_docs'] += 1
+        doc = clean_document(doc, stats)
+        if doc is not None:
+            cleaned.append(('{}:{}'.format(filename, num_docs), doc))
+
+    # Skip near-duplicates of already written documents
+    if worker_deduplicator is not None and cleaned:
+        fingerprints = worker_hasher.fingerprint_batch([doc['text'].encode('utf-8') for _, doc in cleaned],
+                                                       n_threads=1)
+        is_new = worker_deduplicator.add_if_new_batch(list(fingerprints), [doc_id for doc_id, _ in cleaned])
+        stats['num_duplicate_docs'] += is_new.count(False)
+        cleaned = [item for item, new in zip(cleaned, is_new) if new]
+
+    for _, doc in cleaned:
+        # Write to output file
+        myjson = json.dumps(doc, ensure_ascii=False)
+        lines.append(myjson.encode('utf-8') + '\n'.encode('utf-8'))
+        stats['num_written_docs'] += 1
+    return lines, stats
+
+
+def filter_corpus(filenames, data_dir, workers=None, hasher=None, deduplicator=None):
+    """
+    Clean the files with a pool of workers sharing the chunks of documents of all files.
+    The cleaned documents are written in input order and the counters of each file are merged for save_result.
+    """
+    # The chunks are read ahead of the results, so each file is timed from when its first document is read
+    start_times = {}
+
+    def read_documents(filename):
+        start_times[filename] = time.time()
+        return read_original(filename, data_dir)
+
+    results = map_file_chunks(filenames, read_documents, clean_chunk,
+                              workers=workers, initializer=init_worker, initargs=(hasher, deduplicator))
+    for filename, file_results in groupby(results, key=itemgetter(0)):
+        stats = Counter()
+        out_filepath = data_dir + 'Cleaned/cleaned_' + filename + '.json'
+        with open(out_filepath, 'wb') as f_out:
+            for _, (lines, chunk_stats) in file_results:
+                f_out.writelines(lines)
+                stats.update(chunk_stats)
+        save_result(data_dir, filename, start_times[filename], stats['num_docs'], stats['num_written_docs'], stats['num_fixed_text'],
+                    stats['num_small_docs'], stats['num_non_english_docs'], stats['num_duplicate_docs'],
+                    stats['num_lang_fast_english'], stats['num_lang_fast_non_english'], stats['num_lang_detector'])
+        print("{}.json cleaned !".format(filename))
+
 
 def main(args):
     """
-    Run processes in parallel if --all=True, otherwise run one process.
+    Clean all json files if --all=True, otherwise the input file, with a pool of --workers processes.
+    With --dedup, the workers share one OnlineDeduplicator served by a manager process.
     """
+    hasher = None
+    deduplicator = None
+    if args.dedup:
+        # Only --dedup needs the LSH extension
+        from lsh import minhash
+        hasher = minhash.MinHasher(seeds=100, char_ngram=5, hashbytes=4, random_state=0)
+        manager = DedupManager()
+        manager.start()
+        deduplicator = manager.OnlineDeduplicator(hasher, num_bands=10, min_jaccard=args.dedup_threshold)
+
     if args.all:
         # Get all json files
         filespath = args.data_dir + 'Original/'
         filenames = [os.path.splitext(f)[0] for f in os.listdir(filespath) if f.endswith('.json')]
-            
-        # Instantiating process with arguments
-        process_list = [Process(target=filter_corpus, args=(f, args.data_dir,)) for f in filenames]
-        for i, p in enumerate(process_list):
-            print('Process {} is starting...'.format(i+1))
-            p.start()
-            time.sleep(1)
-        # Complete the processes
-        for p in process_list:
-            p.join()       
     else:
-        filename = os.path.splitext(args.infile)[0]
-        filter_corpus(filename, args.data_dir)
+        filenames = [os.path.splitext(args.infile)[0]]
+    filter_corpus(filenames, args.data_dir, args.workers, hasher, deduplicator)
+
+    if args.dedup:
+        manager.shutdown()
                 
 
 if __name__ == "__main__":
@@ -0,0 +1,74 @@
+"""
+Bounded process pool shared by the cleaning scripts.
+The documents of every input file are split in chunks handed to whichever worker is free,
+so a large file is processed by all the workers, and the results come back in input order.
+"""
+from collections import deque
+from multiprocessing import Pool
+import os
+
+# Number of documents handed to a worker at once.
+CHUNK_SIZE = 1000
+
+
+def default_workers():
+    """
+    Number of workers used when none is given: the number of cores.
+    """
+    return os.cpu_count() or 1
+
+
+def iter_chunks(filenames, read_documents, chunk_size=CHUNK_SIZE):
+    """
+    Yield (filename, index of the first document, list of documents) for the documents of every file,
+    read with read_documents(filename). A file without documents yields one empty chunk, so it still has an output.
+    """
+    for filename in filenames:
+        chunk = []
+        start = 0
+        for doc in read_documents(filename):
+            chunk.append(doc)
+            if len(chunk) == chunk_size:
+                yield filename, start, chunk
+                start += len(chunk)
+                chunk = []
+        if chunk or start == 0:
+            yield filename, start, chunk
+
+
+def map_file_chunks(filenames, read_documents, process_chunk, workers=None, chunk_size=CHUNK_SIZE,
+                    initializer=None, initargs=(), pool=None):
+    """
+    Yield (filename, process_chunk((filename, start, docs))) for the chunks of every file, in input order.
+    process_chunk runs in a pool of workers processes, at most 2 chunks per worker are read ahead,
+    so the memory is bounded by the chunks in flight whatever the size of the files.
+    With one worker, the chunks are processed in this process.
+    A pool of workers processes may be given to share it between several calls, it is left open
+    and initializer is not used.
+    """
+    workers = workers or default_workers()
+    chunks = iter_chunks(filenames, read_documents, chunk_size)
+    if workers == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for task in chunks:
+            yield task[0], process_chunk(task)
+        return
+
+    if pool is not None:
+        yield from _map_pool(pool, chunks, process_chunk, workers)
+        return
+    with Pool(workers, initializer=initializer, initargs=initargs) as pool:
+        yield from _map_pool(pool, chunks, process_chunk, workers)
+
+
+def _map_pool(pool, chunks, process_chunk, workers):
+    pending = deque()
+    for task in chunks:
+        pending.append((task[0], pool.apply_async(process_chunk, (task,))))
+        if len(pending) >= 2 * workers:
+            filename, result = pending.popleft()
+            yield filename, result.get()
+    while pending:
+        filename, result = pending.popleft()
+        yield filename, result.get()
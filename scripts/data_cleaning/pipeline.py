@@ -0,0 +1,371 @@
+"""
+Build the corpus in one command by chaining the cleaning steps as streaming stages.
+
+    python pipeline.py --data_dir=<data_dir> [--stages clean dedup split train_dev_test] [--write_after clean]
+
+Each stage declares the kinds of documents it consumes and the kind it produces, and the chain is checked
+before anything runs:
+- 'original': documents of Original/*.json, with lists of strings as text;
+- 'cleaned': documents cleaned by cleanup_dataset.py;
+- 'sentences': documents split to sentences by presplit_sentences_json.py.
+Consecutive per-document stages run together on chunks of documents in the worker pool of parallel.py,
+stages that need the whole corpus (dedup and the sinks) run in this process on the ordered stream.
+Documents are only written to disk by the sinks and after the stages given to --write_after.
+"""
+import argparse
+from collections import Counter, OrderedDict
+from functools import partial
+import json
+from multiprocessing import Pool
+import os
+import random
+import time
+
+from parallel import CHUNK_SIZE, default_workers, map_file_chunks
+
+
+def parse_arguments():
+    """
+    Parser.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_dir", type=str, default='/raid/antoloui/Master-thesis/Data/',
+                        help="Path of the data directory, the original documents are read from its Original/ directory.")
+    parser.add_argument("--infile", type=str,
+                        help="Name of a single file of Original/ to process, by default all of them.")
+    parser.add_argument("--input_files", type=str, nargs='+',
+                        help="Loose json files of --input_kind documents to start from instead of Original/.")
+    parser.add_argument("--input_kind", type=str, default='cleaned', choices=['cleaned', 'sentences'],
+                        help="Kind of the documents of --input_files.")
+    parser.add_argument("--output_dir", type=str, default=None,
+                        help="Directory of the written files (default: <data_dir>/Cleaned/).")
+    parser.add_argument("--stages", type=str, nargs='+', default=['clean', 'dedup', 'split', 'train_dev_test'],
+                        help="Stages to chain, among: {}.".format(', '.join(STAGES)))
+    parser.add_argument("--write_after", type=str, nargs='+', default=[],
+                        help="Write the documents produced by these stages to <output_dir>/<stage>.json.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of processes running the per-document stages (default: number of cores).")
+    parser.add_argument("--dedup_threshold", type=float, default=0.9,
+                        help="Minimum estimated Jaccard similarity of a document dropped by the dedup stage.")
+    parser.add_argument("--test_percent", type=float, nargs='+', default=[0.05, 0.05],
+                        help="Fraction of the documents sent to dev.json and test.json by the train_dev_test stage.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the train_dev_test split.")
+    parser.add_argument("--raw_text", action='store_true',
+                        help="The train_dev_test stage also writes the raw text of each split, as json2text.py.")
+    arguments, _ = parser.parse_known_args()
+    return arguments
+
+
+class Stage(object):
+    """
+    A step of the pipeline. process(docs, stats) yields the documents kept by the stage, and counts in stats.
+    Per-document stages are parallel and run in the workers, the others see every document in order.
+    """
+    name = None
+    consumes = ()
+    # None keeps the kind of the consumed documents.
+    produces = None
+    parallel = False
+
+    def setup(self):
+        """
+        Called once in the process running the stage, before its first document.
+        """
+        pass
+
+    def process(self, docs, stats):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class CleanStage(Stage):
+    name = 'clean'
+    consumes = ('original',)
+    produces = 'cleaned'
+    parallel = True
+
+    def setup(self):
+        global cleanup_dataset
+        import cleanup_dataset
+
+    def process(self, docs, stats):
+        for doc in docs:
+            stats['num_docs'] += 1
+            doc = cleanup_dataset.clean_document(doc, stats)
+            if doc is not None:
+                stats['num_written_docs'] += 1
+                yield doc
+
+
+class SplitStage(Stage):
+    name = 'split'
+    consumes = ('cleaned',)
+    produces = 'sentences'
+    parallel = True
+
+    def setup(self):
+        global presplit_sentences_json
+        import presplit_sentences_json
+
+    def process(self, docs, stats):
+        for doc in docs:
+            stats['num_docs'] += 1
+            yield presplit_sentences_json.split_document(doc)
+
+
+class DedupStage(Stage):
+    """
+    Drop near-duplicates of earlier documents with a MinHash LSH cache, the same as cleanup_dataset.py --dedup.
+    The first copy of a duplicate in input order is kept.
+    """
+    name = 'dedup'
+    consumes = ('cleaned', 'sentences')
+
+    def __init__(self, min_jaccard=0.9, batch_size=CHUNK_SIZE):
+        self.min_jaccard = min_jaccard
+        self.batch_size = batch_size
+
+    def setup(self):
+        from lsh import cache, minhash
+        self.hasher = minhash.MinHasher(seeds=100, char_ngram=5, hashbytes=4, random_state=0)
+        self.lshcache = cache.Cache(self.hasher, num_bands=10)
+
+    def process(self, docs, stats):
+        batch = []
+        for doc in docs:
+            batch.append(doc)
+            if len(batch) == self.batch_size:
+                yield from self._process_batch(batch, stats)
+                batch = []
+        yield from self._process_batch(batch, stats)
+
+    def _process_batch(self, batch, stats):
+        if not batch:
+            return
+        fingerprints = self.hasher.fingerprint_batch([doc['text'].encode('utf-8') for doc in batch])
+        for doc, fingerprint in zip(batch, fingerprints):
+            stats['num_docs'] += 1
+            if self.lshcache.get_duplicates_of(fingerprint=fingerprint, min_jaccard=self.min_jaccard):
+                stats['num_duplicate_docs'] += 1
+                continue
+            self.lshcache.add_fingerprint(fingerprint, stats['num_docs'])
+            yield doc
+
+
+class JsonWriter(Stage):
+    """
+    Write the documents to a loose json file and pass them on, inserted after the stages of --write_after.
+    """
+    consumes = ('original', 'cleaned', 'sentences')
+
+    def __init__(self, filepath):
+        self.name = 'write:' + os.path.basename(filepath)
+        self.filepath = filepath
+
+    def setup(self):
+        self.f_out = open(self.filepath, 'w')
+
+    def process(self, docs, stats):
+        for doc in docs:
+            self.f_out.write(json.dumps(doc, ensure_ascii=False) + '\n')
+            stats['num_written_docs'] += 1
+            yield doc
+
+    def close(self):
+        self.f_out.close()
+
+
+class TrainDevTestStage(Stage):
+    """
+    Send every document to train.json, dev.json or test.json of output_dir, as create_train_dev_test_json.py.
+    Documents are assigned at random with the --test_percent probabilities instead of shuffling the whole corpus,
+    so the sizes of the splits are only approximately the requested fractions.
+    """
+    name = 'train_dev_test'
+    consumes = ('sentences',)
+
+    def __init__(self, output_dir, test_percent=(0.05, 0.05), seed=0, raw_text=False):
+        self.output_dir = output_dir
+        self.dev_percent = test_percent[0]
+        self.test_percent = test_percent[1] if len(test_percent) == 2 else 0
+        self.seed = seed
+        self.raw_text = raw_text
+
+    def setup(self):
+        self.rng = random.Random(self.seed)
+        self.files = OrderedDict()
+        for split in ['train', 'dev', 'test']:
+            self.files[split] = [open(os.path.join(self.output_dir, split + '.json'), 'w')]
+            if self.raw_text:
+                self.files[split].append(open(os.path.join(self.output_dir, split + '.txt'), 'w'))
+
+    def process(self, docs, stats):
+        for doc in docs:
+            r = self.rng.random()
+            split = 'dev' if r < self.dev_percent else 'test' if r < self.dev_percent + self.test_percent else 'train'
+            files = self.files[split]
+            files[0].write(json.dumps(doc) + '\n')
+            if self.raw_text:
+                files[1].write(doc['text'] + '\n\n')
+            stats['num_' + split + '_docs'] += 1
+            yield doc
+
+    def close(self):
+        for files in self.files.values():
+            for f in files:
+                f.close()
+
+
+STAGES = OrderedDict([
+    ('clean', lambda args: CleanStage()),
+    ('dedup', lambda args: DedupStage(min_jaccard=args.dedup_threshold)),
+    ('split', lambda args: SplitStage()),
+    ('train_dev_test', lambda args: TrainDevTestStage(args.output_dir, args.test_percent, args.seed, args.raw_text)),
+])
+
+
+def check_chain(stages, input_kind):
+    """
+    Raise a ValueError if a stage does not consume the kind of documents produced by the previous one.
+    """
+    kind = input_kind
+    for stage in stages:
+        if kind not in stage.consumes:
+            raise ValueError("Stage '{}' consumes {} documents, not '{}' documents.".format(
+                stage.name, ' or '.join("'{}'".format(k) for k in stage.consumes), kind))
+        kind = stage.produces or kind
+
+
+def group_stages(stages):
+    """
+    Group consecutive parallel stages, return a list of (parallel, stages).
+    """
+    groups = []
+    for stage in stages:
+        if groups and stage.parallel and groups[-1][0]:
+            groups[-1][1].append(stage)
+        else:
+            groups.append((stage.parallel, [stage]))
+    return groups
+
+
+# Set before the worker pool is forked, so the workers inherit the stages.
+pipeline_groups = []
+worker_ready = set()
+
+
+def run_group_chunk(group_index, task):
+    """
+    Run the stages of a parallel group on a chunk of documents, return the kept documents and the counters.
+    """
+    _, start, docs = task
+    stages = pipeline_groups[group_index][1]
+    stats = {}
+    for stage in stages:
+        if stage.name not in worker_ready:
+            stage.setup()
+            worker_ready.add(stage.name)
+        stats[stage.name] = Counter()
+        docs = stage.process(docs, stats[stage.name])
+    return list(docs), stats
+
+
+def run_parallel_group(group_index, docs, stats, workers, pool=None):
+    results = map_file_chunks([None], lambda _: docs, partial(run_group_chunk, group_index), workers=workers, pool=pool)
+    for _, (chunk_docs, chunk_stats) in results:
+        for name, counter in chunk_stats.items():
+            stats[name].update(counter)
+        for doc in chunk_docs:
+            yield doc
+
+
+def run_pipeline(docs, stages, workers=None):
+    """
+    Chain the stages on a stream of documents and return the counters of every stage.
+    All the parallel groups share one pool of workers processes.
+    """
+    global pipeline_groups
+    pipeline_groups = group_stages(stages)
+    stats = OrderedDict((stage.name, Counter()) for stage in stages)
+    workers = workers or default_workers()
+    pool = None
+    if workers > 1 and any(parallel for parallel, _ in pipeline_groups):
+        pool = Pool(workers)
+    for group_index, (parallel, group) in enumerate(pipeline_groups):
+        if parallel:
+            docs = run_parallel_group(group_index, docs, stats, workers, pool)
+        else:
+            for stage in group:
+                stage.setup()
+                docs = stage.process(docs, stats[stage.name])
+    try:
+        for _ in docs:
+            pass
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        for parallel, group in pipeline_groups:
+            if not parallel:
+                for stage in group:
+                    stage.close()
+    return stats
+
+
+def read_loose_json(filenames):
+    for filename in filenames:
+        with open(filename, 'r') as f:
+            for line in f:
+                yield json.loads(line)
+
+
+def read_original_files(filenames, data_dir):
+    # Only the documents of Original/ need cleanup_dataset and its dependencies
+    import cleanup_dataset
+    for filename in filenames:
+        for doc in cleanup_dataset.read_original(filename, data_dir):
+            yield doc
+
+
+def main(args):
+    """
+    Build the stages, check the chain and run it on the input documents.
+    """
+    if args.output_dir is None:
+        args.output_dir = args.data_dir + 'Cleaned/'
+    stages = []
+    for name in args.stages:
+        if name not in STAGES:
+            raise SystemExit("Unknown stage '{}', choose among: {}.".format(name, ', '.join(STAGES)))
+        stages.append(STAGES[name](args))
+        if name in args.write_after:
+            stages.append(JsonWriter(os.path.join(args.output_dir, name + '.json')))
+
+    if args.input_files:
+        input_kind = args.input_kind
+        docs = read_loose_json(args.input_files)
+    else:
+        input_kind = 'original'
+        if args.infile:
+            filenames = [os.path.splitext(args.infile)[0]]
+        else:
+            filenames = sorted(os.path.splitext(f)[0] for f in os.listdir(args.data_dir + 'Original/') if f.endswith('.json'))
+        docs = read_original_files(filenames, args.data_dir)
+    try:
+        check_chain(stages, input_kind)
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+    start_time = time.time()
+    stats = run_pipeline(docs, stages, args.workers)
+    print('Pipeline done in {:.2f} s !'.format(time.time() - start_time))
+    for name, counter in stats.items():
+        print('{} | {}'.format(name, ' | '.join('{}: {}'.format(k, v) for k, v in sorted(counter.items()))))
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args)
@@ -1,13 +1,15 @@
 import sys
 import json
 import argparse
-import time
 import os
-from multiprocessing import Process
+from itertools import groupby
+from operator import itemgetter
 
 import nltk
 nltk.download('punkt')
 
+from parallel import map_file_chunks
+
 
 MIN_WORDS = 2
 MAX_WORDS = 200
@@ -24,66 +26,76 @@ def parse_arguments():
                         help="Name of the input file.")
     parser.add_argument("--all", type=bool, default=False,
                         help="Create pretraining data for all files.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of processes splitting chunks of documents of all files (default: number of cores).")
     arguments, _ = parser.parse_known_args()
     return arguments
 
 
-def split_sentences(infile, data_dir):
+def read_lines(infile, data_dir):
+    with open(data_dir + infile, 'r') as ifile:
+        for doc in ifile:
+            yield doc
+
+
+def split_document(parsed):
     """
+    Split the text of a parsed document to sentences in place and return the document.
     """
-    in_filename = data_dir + infile
-    out_filename = data_dir + 'split_' + infile
-
     line_seperator = "\n"
-    with open(in_filename, 'r') as ifile:
-        with open(out_filename, "w") as ofile:
-            for doc in ifile.readlines():
-                parsed = json.loads(doc)
 
-                # Split text to sentences
-                list_sent = []
-                for line in parsed['text'].split('\n'):
-                    if line != '\n':
-                        list_sent.extend(nltk.tokenize.sent_tokenize(line))
+    # Split text to sentences
+    list_sent = []
+    for line in parsed['text'].split('\n'):
+        if line != '\n':
+            list_sent.extend(nltk.tokenize.sent_tokenize(line))
+
+            # If line begins with a number, remove the number   
+            list_sent = [sent.split(maxsplit=1)[1] if (len(sent.split(maxsplit=1))>1 and sent.split(maxsplit=1)[0].isdigit()) else sent for sent in list_sent]
+
+            # If line begins with a unique special char, remove that char
+            spec_char = set(',?;.:/=+%`¨*$€–-_())°!§\'\"&@#~®†ºπ‡¬≈©◊~∞µ…÷≠<>™^')
+            list_sent = [sent.split(maxsplit=1)[1] if (len(sent.split(maxsplit=1))>1 and len(sent.split(maxsplit=1)[0])==1 and sent.split(maxsplit=1)[0] in spec_char) else sent for sent in list_sent]
+
+            # Keep only sentences with more than 2 words and less than 200 words
+            list_sent = [sent for sent in list_sent if (len(sent.split())>MIN_WORDS and len(sent.split())<MAX_WORDS)]
 
-                        # If line begins with a number, remove the number   
-                        list_sent = [sent.split(maxsplit=1)[1] if (len(sent.split(maxsplit=1))>1 and sent.split(maxsplit=1)[0].isdigit()) else sent for sent in list_sent]
+    parsed['text'] = line_seperator.join(list_sent)
+    return parsed
 
-                        # If line begins with a unique special char, remove that char
-                        spec_char = set(',?;.:/=+%`¨*$€–-_())°!§\'\"&@#~®†ºπ‡¬≈©◊~∞µ…÷≠<>™^')
-                        list_sent = [sent.split(maxsplit=1)[1] if (len(sent.split(maxsplit=1))>1 and len(sent.split(maxsplit=1)[0])==1 and sent.split(maxsplit=1)[0] in spec_char) else sent for sent in list_sent]
 
-                        # Keep only sentences with more than 2 words and less than 200 words
-                        list_sent = [sent for sent in list_sent if (len(sent.split())>MIN_WORDS and len(sent.split())<MAX_WORDS)]
-    
-                # Write to output file
-                parsed['text'] = line_seperator.join(list_sent)
-                ofile.write(json.dumps(parsed)+'\n')
-    print("{} : sentence segmentation done !".format(infile))
+def split_chunk(task):
+    """
+    Split the text of a chunk of json lines to sentences, return the output lines.
+    """
+    infile, start, docs = task
+    # Write to output file
+    return [json.dumps(split_document(json.loads(doc)))+'\n' for doc in docs]
+
+
+def split_sentences(infiles, data_dir, workers=None):
+    """
+    Split the files with a pool of workers sharing the chunks of documents of all files, in input order.
+    """
+    results = map_file_chunks(infiles, lambda infile: read_lines(infile, data_dir), split_chunk, workers=workers)
+    for infile, file_results in groupby(results, key=itemgetter(0)):
+        with open(data_dir + 'split_' + infile, "w") as ofile:
+            for _, out_lines in file_results:
+                ofile.writelines(out_lines)
+        print("{} : sentence segmentation done !".format(infile))
 
 
 def main(args):
     """
-    Run processes in parallel if --all=True, otherwise run one process.
+    Split all cleaned files if --all=True, otherwise the input file, with a pool of --workers processes.
     """
     if args.all:
         # Get the file paths
         filenames = [f for f in os.listdir(args.data_dir) if f.startswith('cleaned_') and f.endswith('.json')]
-        
-        # Instantiating process with arguments
-        process_list = [Process(target=split_sentences, args=(f, args.data_dir,)) for f in filenames]
-        for i, p in enumerate(process_list):
-            print('Process {} is starting...'.format(i+1))
-            p.start()
-            time.sleep(1)
-        # Complete the processes
-        for p in process_list:
-            p.join()       
     else:
-        file = args.infile
-        split_sentences(file, args.data_dir)
+        filenames = [args.infile]
+    split_sentences(filenames, args.data_dir, args.workers)
 
-        
 
 if __name__ == "__main__":
     args = parse_arguments()
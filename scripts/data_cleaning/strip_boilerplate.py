@@ -0,0 +1,312 @@
+import json
+import hashlib
+import argparse
+import time
+import os
+import shutil
+import tempfile
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+
+import numpy as np
+
+from parallel import map_file_chunks
+
+
+# Lines found in more than this number of documents are considered as boilerplate.
+MAX_REPEATS = 100
+# Number of line hashes buffered before they are merged into the exact counts.
+BUFFER_SIZE = 2**22
+# Bytes of memory per distinct line of the exact counts: hash, count and the copies made by a merge.
+BYTES_PER_LINE = 32
+# Number of hash ranges in which the spilled counts are summed, one range in memory at a time.
+NUM_PARTITIONS = 256
+
+
+def parse_arguments():
+    """
+    Parser.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_dir", type=str, default='/raid/antoloui/Master-thesis/Data/Cleaned/',
+                        help="Path of the data directory.")
+    parser.add_argument("--infile", type=str,
+                        help="Name of the input file.")
+    parser.add_argument("--all", type=bool, default=False,
+                        help="Strip boilerplate from all presplit files.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of processes hashing and stripping chunks of documents of all files (default: number of cores).")
+    parser.add_argument("--max_repeats", type=int, default=MAX_REPEATS,
+                        help="Drop the lines found in more than this number of documents.")
+    parser.add_argument("--memory_budget", type=int, default=1024,
+                        help="Megabytes of exact counts kept in memory before they are spilled to <data_dir>.")
+    parser.add_argument("--sketch", action='store_true',
+                        help="Count the lines with a count-min sketch of fixed size instead of exact counts.")
+    parser.add_argument("--sketch_width", type=int, default=2**22,
+                        help="Number of counters in each row of the count-min sketch, rounded up to a power of two.")
+    parser.add_argument("--sketch_depth", type=int, default=4,
+                        help="Number of rows of the count-min sketch.")
+    arguments, _ = parser.parse_known_args()
+    return arguments
+
+
+def hash_lines(lines):
+    """
+    Return the 64bit hashes of the stripped lines. Python's hash is salted per process, so blake2b is used instead.
+    """
+    return np.array([int.from_bytes(hashlib.blake2b(line.strip().encode('utf-8'), digest_size=8).digest(), 'little')
+                     for line in lines], dtype=np.uint64)
+
+
+def split_lines(text):
+    return [line for line in text.split('\n') if line.strip()]
+
+
+def sum_counts(hashes, counts):
+    """
+    Return the sorted distinct hashes and the sum of the counts of each.
+    """
+    if len(hashes) == 0:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint32)
+    order = np.argsort(hashes)
+    hashes = hashes[order]
+    starts = np.flatnonzero(np.r_[True, hashes[1:] != hashes[:-1]])
+    return hashes[starts], np.add.reduceat(counts[order], starts).astype(np.uint32)
+
+
+class LineCounter(object):
+    """
+    Exact number of documents containing each line hash.
+    Hashes are buffered and merged into sorted arrays, so memory grows with the number of
+    distinct lines and not with their text. Beyond max_lines distinct lines, the sorted counts
+    are spilled to spill_dir and summed one hash range at a time by finalize.
+    """
+    def __init__(self, buffer_size=BUFFER_SIZE, max_lines=None, spill_dir=None):
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.counts = np.zeros(0, dtype=np.uint32)
+        self.buffer_size = buffer_size
+        self.max_lines = max_lines
+        self.spill_dir = spill_dir
+        self.runs = []
+        self.buffer = []
+        self.buffered = 0
+
+    def add(self, hashes, counts):
+        self.buffer.append((hashes, counts))
+        self.buffered += len(hashes)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        hashes, counts = sum_counts(np.concatenate([h for h, _ in self.buffer]),
+                                    np.concatenate([c for _, c in self.buffer]))
+        self.buffer = []
+        self.buffered = 0
+        self._merge(hashes, counts)
+        if self.max_lines is not None and len(self.hashes) > self.max_lines:
+            self._spill()
+
+    def _merge(self, hashes, counts):
+        """
+        Merge sorted distinct hashes into the sorted counts, in time linear in their sizes.
+        """
+        positions = np.searchsorted(self.hashes, hashes)
+        found = positions < len(self.hashes)
+        found[found] = self.hashes[positions[found]] == hashes[found]
+        self.counts[positions[found]] += counts[found]
+        new = ~found
+        self.hashes = np.insert(self.hashes, positions[new], hashes[new])
+        self.counts = np.insert(self.counts, positions[new], counts[new])
+
+    def _spill(self):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp()
+        prefix = os.path.join(self.spill_dir, 'run{}'.format(len(self.runs)))
+        np.save(prefix + '_hashes.npy', self.hashes)
+        np.save(prefix + '_counts.npy', self.counts)
+        self.runs.append(prefix)
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.counts = np.zeros(0, dtype=np.uint32)
+
+    def finalize(self, max_repeats):
+        """
+        Only keep the hashes found in more than max_repeats documents, the count of the others is 0.
+        """
+        self.flush()
+        if self.runs:
+            self._spill()
+            runs = [(np.load(prefix + '_hashes.npy', mmap_mode='r'), np.load(prefix + '_counts.npy', mmap_mode='r'))
+                    for prefix in self.runs]
+            # The hashes of each run are sorted, so a hash range is a slice of every run
+            edges = np.arange(1, NUM_PARTITIONS, dtype=np.uint64) << np.uint64(64 - int(np.log2(NUM_PARTITIONS)))
+            bounds = [np.r_[0, np.searchsorted(hashes, edges), len(hashes)] for hashes, _ in runs]
+            kept_hashes, kept_counts = [], []
+            for p in range(NUM_PARTITIONS):
+                hashes, counts = sum_counts(np.concatenate([h[b[p]:b[p + 1]] for (h, _), b in zip(runs, bounds)]),
+                                            np.concatenate([c[b[p]:b[p + 1]] for (_, c), b in zip(runs, bounds)]))
+                kept_hashes.append(hashes[counts > max_repeats])
+                kept_counts.append(counts[counts > max_repeats])
+            del runs
+            for prefix in self.runs:
+                os.remove(prefix + '_hashes.npy')
+                os.remove(prefix + '_counts.npy')
+            self.runs = []
+            self.hashes = np.concatenate(kept_hashes)
+            self.counts = np.concatenate(kept_counts)
+        else:
+            keep = self.counts > max_repeats
+            self.hashes = self.hashes[keep]
+            self.counts = self.counts[keep]
+
+    def count(self, hashes):
+        self.flush()
+        if len(self.hashes) == 0:
+            return np.zeros(len(hashes), dtype=np.uint32)
+        positions = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+        return np.where(self.hashes[positions] == hashes, self.counts[positions], 0)
+
+
+class CountMinSketch(object):
+    """
+    Count-min sketch of line hashes with a fixed memory of depth * width 32bit counters.
+    Counts are never underestimated, so a line may be dropped too early but never kept too long.
+    Each row indexes the line hash with a multiply-shift hash of its own odd multiplier.
+    """
+    def __init__(self, width=2**22, depth=4, seed=0):
+        self.bits = max(1, int(np.ceil(np.log2(width))))
+        self.table = np.zeros((depth, 2**self.bits), dtype=np.uint32)
+        rng = np.random.RandomState(seed)
+        self.multipliers = rng.randint(0, 2**63, size=depth, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+
+    def _columns(self, hashes):
+        return (hashes[None, :] * self.multipliers[:, None]) >> np.uint64(64 - self.bits)
+
+    def add(self, hashes, counts):
+        rows = np.repeat(np.arange(len(self.table)), len(hashes))
+        np.add.at(self.table, (rows, self._columns(hashes).ravel()), np.tile(counts, len(self.table)))
+
+    def finalize(self, max_repeats):
+        pass
+
+    def count(self, hashes):
+        return self.table[np.arange(len(self.table))[:, None], self._columns(hashes)].min(axis=0)
+
+
+def new_counter(args):
+    if args.sketch:
+        return CountMinSketch(width=args.sketch_width, depth=args.sketch_depth)
+    return LineCounter(max_lines=args.memory_budget * 2**20 // BYTES_PER_LINE,
+                       spill_dir=tempfile.mkdtemp(prefix='linecounts_', dir=args.data_dir))
+
+
+def read_lines(infile, data_dir):
+    with open(data_dir + infile, 'r') as ifile:
+        for doc in ifile:
+            yield doc
+
+
+def count_chunk(task):
+    """
+    Return the distinct line hashes of a chunk of json lines and the number of documents containing each.
+    """
+    _, _, docs = task
+    # A line repeated inside a document is counted once, so counts are document frequencies
+    hashes = [np.unique(hash_lines(split_lines(json.loads(doc)['text']))) for doc in docs]
+    return sum_counts(np.concatenate([np.zeros(0, dtype=np.uint64)] + hashes),
+                      np.ones(sum(len(h) for h in hashes), dtype=np.uint32))
+
+
+def count_lines(filenames, data_dir, counter, workers=None):
+    """
+    First pass: the workers hash chunks of documents of all files, the counts are summed in this process.
+    """
+    start_time = time.time()
+    results = map_file_chunks(filenames, lambda infile: read_lines(infile, data_dir), count_chunk, workers=workers)
+    for _, (hashes, counts) in results:
+        counter.add(hashes, counts)
+    print("Counted lines of {} files in {:.2f} s !".format(len(filenames), time.time() - start_time))
+
+
+# Set in every worker before the second pass, the counter is inherited by the forked workers.
+line_counter = None
+max_line_repeats = MAX_REPEATS
+
+
+def init_worker(counter, max_repeats):
+    global line_counter, max_line_repeats
+    line_counter = counter
+    max_line_repeats = max_repeats
+
+
+def strip_chunk(task):
+    """
+    Remove the lines found in more than max_repeats documents from a chunk of json lines,
+    return the output lines and the counters of the chunk.
+    """
+    _, _, docs = task
+    out_lines = []
+    stats = Counter()
+    for doc in docs:
+        parsed = json.loads(doc)
+        stats['num_docs'] += 1
+
+        lines = split_lines(parsed['text'])
+        keep = line_counter.count(hash_lines(lines)) <= max_line_repeats
+        stats['num_lines'] += len(lines)
+        stats['num_stripped_lines'] += len(lines) - int(keep.sum())
+
+        # Skip documents made of boilerplate only
+        if not keep.any():
+            stats['num_empty_docs'] += 1
+            continue
+
+        # Write to output file
+        parsed['text'] = '\n'.join(line for line, kept in zip(lines, keep) if kept)
+        out_lines.append(json.dumps(parsed)+'\n')
+    return out_lines, stats
+
+
+def strip_lines(filenames, data_dir, counter, max_repeats, workers=None):
+    """
+    Second pass: remove the lines found in more than max_repeats documents and drop the documents left empty.
+    The chunks come back in input order, so each output file keeps the order of its input file.
+    """
+    results = map_file_chunks(filenames, lambda infile: read_lines(infile, data_dir), strip_chunk, workers=workers,
+                              initializer=init_worker, initargs=(counter, max_repeats))
+    for infile, file_results in groupby(results, key=itemgetter(0)):
+        stats = Counter()
+        with open(data_dir + 'stripped_' + infile, 'w') as ofile:
+            for _, (out_lines, chunk_stats) in file_results:
+                ofile.writelines(out_lines)
+                stats.update(chunk_stats)
+        print("{} : stripped {} of {} lines, dropped {} of {} documents !".format(
+            infile, stats['num_stripped_lines'], stats['num_lines'], stats['num_empty_docs'], stats['num_docs']))
+
+
+def main(args):
+    """
+    Strip all presplit files if --all=True, otherwise the input file, with a pool of --workers processes.
+    The line counts are shared across all files: a first pass counts the lines of every file and
+    a second pass strips the lines repeated more than --max_repeats times.
+    """
+    if args.all:
+        filenames = [f for f in os.listdir(args.data_dir) if f.startswith('split_') and f.endswith('.json')]
+    else:
+        filenames = [args.infile]
+
+    counter = new_counter(args)
+    try:
+        count_lines(filenames, args.data_dir, counter, args.workers)
+        counter.finalize(args.max_repeats)
+    finally:
+        if not args.sketch:
+            shutil.rmtree(counter.spill_dir, ignore_errors=True)
+    strip_lines(filenames, args.data_dir, counter, args.max_repeats, args.workers)
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args)
@@ -0,0 +1,55 @@
+import os
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cleanup_dataset import MIN_DOCUMENT_LENGTH, OnlineDeduplicator, clean_document, is_english_fast  # noqa: E402
+
+SENTENCE = 'The router forwards the packets of the hosts to the next hop of the route.'
+
+
+def test_clean_english_document():
+    num_sentences = MIN_DOCUMENT_LENGTH // len(SENTENCE.split()) + 1
+    doc = {'text': [SENTENCE] * num_sentences, 'uri': ['https://www.cisco.com/']}
+    stats = Counter()
+    assert clean_document(doc, stats) is doc
+    assert doc['text'] == ' '.join([SENTENCE] * num_sentences)
+    assert stats == Counter({'num_lang_fast_english': 1})
+
+
+def test_non_ascii_text_is_not_english():
+    assert is_english_fast('Маршрутизатор пересылает пакеты к следующему узлу маршрута.') is False
+    assert is_english_fast('Le routeur transmet les paquets de l\'hôte au prochain saut.') is not True
+
+
+LONG_TEXT = ' '.join('Interface {} of router {} forwards the packets of vlan {} to the next hop.'.format(i, i % 7, i * 3)
+                     for i in range(40))
+
+
+def online_deduplicator():
+    from lsh import minhash
+    hasher = minhash.MinHasher(seeds=100, char_ngram=5, hashbytes=4, random_state=0)
+    return hasher, OnlineDeduplicator(hasher, num_bands=10, min_jaccard=0.9)
+
+
+def test_online_deduplicator():
+    hasher, deduplicator = online_deduplicator()
+    text = LONG_TEXT
+    near_duplicate = text.replace('next hop', 'last hop', 1)
+    distinct = 'A switch connects the hosts of the same network and learns their addresses. ' * 20
+    fingerprints = hasher.fingerprint_batch([doc.encode('utf-8') for doc in [text, near_duplicate, distinct]],
+                                            n_threads=1)
+    assert deduplicator.add_if_new(fingerprints[0], 'a:1')
+    assert not deduplicator.add_if_new(fingerprints[1], 'a:2')
+    assert deduplicator.add_if_new(fingerprints[2], 'a:3')
+
+
+def test_online_deduplicator_batch():
+    hasher, deduplicator = online_deduplicator()
+    text = LONG_TEXT
+    docs = [text, 'A switch connects the hosts of the same network. ' * 20, text.replace('next', 'last', 1)]
+    fingerprints = hasher.fingerprint_batch([doc.encode('utf-8') for doc in docs], n_threads=1)
+    # The near-duplicate of the first document of the batch is dropped too
+    assert deduplicator.add_if_new_batch(list(fingerprints), ['a:1', 'a:2', 'a:3']) == [True, True, False]
+    assert deduplicator.add_if_new_batch(list(fingerprints[:1]), ['b:1']) == [False]
@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parallel import iter_chunks, map_file_chunks  # noqa: E402
+
+FILES = {'a': list(range(23)), 'empty': [], 'b': list(range(100, 107))}
+
+
+def read_documents(filename):
+    return iter(FILES[filename])
+
+
+def process_chunk(task):
+    filename, start, docs = task
+    # Later chunks finish first, so the order of the results does not come from the workers
+    time.sleep(0.001 * (10 - start % 10))
+    return start, [doc * 2 for doc in docs]
+
+
+def test_iter_chunks():
+    chunks = list(iter_chunks(['a', 'empty', 'b'], read_documents, chunk_size=10))
+    assert [(filename, start, len(docs)) for filename, start, docs in chunks] == [
+        ('a', 0, 10), ('a', 10, 10), ('a', 20, 3), ('empty', 0, 0), ('b', 0, 7)]
+
+
+def test_empty_file_yields_one_empty_chunk():
+    assert list(iter_chunks(['empty'], read_documents)) == [('empty', 0, [])]
+    assert list(map_file_chunks(['empty'], read_documents, process_chunk, workers=2)) == [('empty', (0, []))]
+
+
+def test_results_in_input_order():
+    results = list(map_file_chunks(['a', 'empty', 'b'], read_documents, process_chunk, workers=3, chunk_size=2))
+    assert [filename for filename, _ in results] == ['a'] * 12 + ['empty'] + ['b'] * 4
+    assert [doc for _, (_, docs) in results for doc in docs] == [doc * 2 for doc in FILES['a'] + FILES['b']]
+
+
+def test_one_worker_gives_the_same_output():
+    args = (['a', 'empty', 'b'], read_documents, process_chunk)
+    assert list(map_file_chunks(*args, workers=1, chunk_size=4)) == list(map_file_chunks(*args, workers=4, chunk_size=4))
+
+
+def test_chunks_in_flight_are_bounded():
+    workers = 2
+    num_read = [0]
+
+    def count_reads(filename):
+        for doc in FILES[filename]:
+            num_read[0] += 1
+            yield doc
+
+    in_flight = []
+    results = map_file_chunks(['a'], count_reads, process_chunk, workers=workers, chunk_size=1)
+    for num_done, _ in enumerate(results):
+        in_flight.append(num_read[0] - num_done)
+    assert max(in_flight) == 2 * workers
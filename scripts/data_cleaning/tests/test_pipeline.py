@@ -0,0 +1,73 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline import (CleanStage, DedupStage, JsonWriter, SplitStage, TrainDevTestStage,  # noqa: E402
+                      check_chain, run_pipeline)
+
+SENTENCES = [
+    'The router forwards the packets of the hosts to the next hop of the route.',
+    'A switch connects the hosts of the same network and learns their addresses.',
+    'The firewall filters the traffic that is sent to the servers of the network.',
+]
+
+
+def original_document(sentence, uri):
+    return {'text': [' '.join([sentence] * 10)], 'uri': [uri]}
+
+
+def original_documents():
+    return [
+        original_document(SENTENCES[0], 'https://www.cisco.com/a'),
+        original_document(SENTENCES[1], 'https://www.cisco.com/b'),
+        # Too small, dropped by the clean stage
+        {'text': [SENTENCES[2]], 'uri': ['https://www.cisco.com/c']},
+        # Copy of the first document, dropped by the dedup stage
+        original_document(SENTENCES[0], 'https://www.cisco.com/d'),
+        original_document(SENTENCES[2], 'https://www.cisco.com/e'),
+    ]
+
+
+def run_chain(filepath, workers):
+    stages = [CleanStage(), SplitStage(), DedupStage(min_jaccard=0.9, batch_size=2), JsonWriter(filepath)]
+    check_chain(stages, 'original')
+    stats = run_pipeline(iter(original_documents()), stages, workers=workers)
+    with open(filepath, 'r') as f:
+        return [json.loads(line) for line in f], stats
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_run_pipeline(tmp_path, workers):
+    docs, stats = run_chain(str(tmp_path / 'out.json'), workers)
+    assert [doc['uri'] for doc in docs] == [['https://www.cisco.com/a'], ['https://www.cisco.com/b'],
+                                            ['https://www.cisco.com/e']]
+    # Split to one sentence per line
+    assert len(docs[0]['text'].split('\n')) == 10
+    assert list(stats) == ['clean', 'split', 'dedup', 'write:out.json']
+    assert stats['clean']['num_docs'] == 5
+    assert stats['clean']['num_small_docs'] == 1
+    assert stats['clean']['num_written_docs'] == 4
+    assert stats['split']['num_docs'] == 4
+    assert stats['dedup'] == {'num_docs': 4, 'num_duplicate_docs': 1}
+    assert stats['write:out.json'] == {'num_written_docs': 3}
+
+
+def test_workers_give_the_same_output(tmp_path):
+    docs_1, stats_1 = run_chain(str(tmp_path / 'out1.json'), 1)
+    docs_2, stats_2 = run_chain(str(tmp_path / 'out2.json'), 2)
+    assert docs_1 == docs_2
+    assert stats_1['clean'] == stats_2['clean']
+    assert stats_1['split'] == stats_2['split']
+    assert stats_1['dedup'] == stats_2['dedup']
+
+
+def test_check_chain_rejects_unproduced_kind(tmp_path):
+    check_chain([CleanStage(), SplitStage(), DedupStage()], 'original')
+    with pytest.raises(ValueError, match="'split' consumes 'cleaned'"):
+        check_chain([SplitStage()], 'original')
+    with pytest.raises(ValueError, match="'train_dev_test' consumes 'sentences'"):
+        check_chain([CleanStage(), TrainDevTestStage(str(tmp_path))], 'original')
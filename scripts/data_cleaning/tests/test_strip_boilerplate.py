@@ -0,0 +1,106 @@
+import json
+import os
+import sys
+from collections import Counter
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from strip_boilerplate import (CountMinSketch, LineCounter, count_chunk, init_worker,  # noqa: E402
+                               read_lines, strip_chunk)
+
+
+def random_batches(num_batches=200, seed=0):
+    rng = np.random.RandomState(seed)
+    batches = []
+    for _ in range(num_batches):
+        # Hashes spread over the whole 64bit range, so they fall in different partitions of a spill
+        hashes = np.unique(rng.randint(0, 500, size=rng.randint(0, 30)).astype(np.uint64) * np.uint64(2**55 + 1))
+        batches.append((hashes, rng.randint(1, 4, size=len(hashes)).astype(np.uint32)))
+    return batches
+
+
+def expected_counts(batches):
+    counts = Counter()
+    for hashes, batch_counts in batches:
+        counts.update(dict(zip(hashes.tolist(), batch_counts.tolist())))
+    return counts
+
+
+def test_line_counter_in_memory():
+    batches = random_batches()
+    counter = LineCounter(buffer_size=50)
+    for hashes, counts in batches:
+        counter.add(hashes, counts)
+    expected = expected_counts(batches)
+    queries = np.array(sorted(expected) + [1, 2**64 - 1], dtype=np.uint64)
+    assert counter.count(queries).tolist() == [expected[h] for h in queries.tolist()]
+    assert np.all(counter.hashes[1:] > counter.hashes[:-1])
+    assert counter.runs == []
+
+
+def test_line_counter_spill(tmp_path):
+    batches = random_batches()
+    counter = LineCounter(buffer_size=50, max_lines=40, spill_dir=str(tmp_path))
+    for hashes, counts in batches:
+        counter.add(hashes, counts)
+    counter.flush()
+    assert counter.runs
+
+    max_repeats = 5
+    counter.finalize(max_repeats)
+    expected = expected_counts(batches)
+    queries = np.array(sorted(expected), dtype=np.uint64)
+    assert counter.count(queries).tolist() == [c if c > max_repeats else 0 for c in (expected[h] for h in queries.tolist())]
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_line_counter_finalize_in_memory():
+    batches = random_batches()
+    counter = LineCounter()
+    for hashes, counts in batches:
+        counter.add(hashes, counts)
+    counter.finalize(5)
+    expected = expected_counts(batches)
+    assert dict(zip(counter.hashes.tolist(), counter.counts.tolist())) == {h: c for h, c in expected.items() if c > 5}
+
+
+def test_count_min_sketch_never_underestimates():
+    batches = random_batches()
+    # A narrow sketch, so that many hashes collide
+    sketch = CountMinSketch(width=64, depth=3)
+    for hashes, counts in batches:
+        sketch.add(hashes, counts)
+    expected = expected_counts(batches)
+    queries = np.array(sorted(expected), dtype=np.uint64)
+    estimates = sketch.count(queries)
+    assert np.all(estimates >= np.array([expected[h] for h in queries.tolist()]))
+    assert np.any(estimates > np.array([expected[h] for h in queries.tolist()]))
+
+
+def test_strip_chunk(tmp_path):
+    docs = [
+        {'text': 'Cookie settings\nThe router forwards packets.\nCookie settings', 'url': 'a'},
+        {'text': 'Cookie settings\nA switch learns addresses.', 'url': 'b'},
+        {'text': 'Cookie settings', 'url': 'c'},
+        {'text': 'The router forwards packets.\nVLANs split a network.', 'url': 'd'},
+    ]
+    with open(str(tmp_path / 'split_a.json'), 'w') as f:
+        for doc in docs:
+            f.write(json.dumps(doc) + '\n')
+    lines = list(read_lines('split_a.json', str(tmp_path) + '/'))
+
+    counter = LineCounter()
+    counter.add(*count_chunk(('split_a.json', 0, lines)))
+    counter.finalize(2)
+    init_worker(counter, 2)
+    out_lines, stats = strip_chunk(('split_a.json', 0, lines))
+
+    # 'Cookie settings' is in 3 documents, its repeats inside a document are counted once
+    assert [json.loads(line) for line in out_lines] == [
+        {'text': 'The router forwards packets.', 'url': 'a'},
+        {'text': 'A switch learns addresses.', 'url': 'b'},
+        {'text': 'The router forwards packets.\nVLANs split a network.', 'url': 'd'},
+    ]
+    assert stats == Counter({'num_docs': 4, 'num_lines': 8, 'num_stripped_lines': 4, 'num_empty_docs': 1})